@@ -1,47 +1,188 @@
 import os
+import copy
 import logging
 import uuid
 import time
+import threading
+import contextvars
+import importlib.util
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
-from typing import Dict, List, Optional
-
-# Try to import cohere, but make it optional
-try:
-    import cohere
-    COHERE_AVAILABLE = True
-except ImportError:
-    COHERE_AVAILABLE = False
-    cohere = None
-
-from dotenv import load_dotenv
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.keys import Keys
-from selenium.webdriver.common.action_chains import ActionChains
-from selenium.common.exceptions import TimeoutException, WebDriverException, NoSuchElementException
-import base64
-from PIL import Image
-import io
+from typing import Callable, Dict, List, Optional
 import json
 
-# Configure logging first
-logging.basicConfig(level=logging.INFO)
+# Loads .env, so the settings read below (and by the modules imported here) see it
+from settings import load_environment
+from singleflight import SingleFlight
+from draft_cache import DraftCache
+from driver_pool import DriverPool, cached_driver_path
+from screencast import ScreencastRecorder
+from failure_watchdog import AutomationAbort, FailureWatchdog, probe_page
+from model_router import ModelRouter, detect_email_type
+from structured_logging import log_context
+from session_trace import TRACE_EXPORT, Trace, activate
+from session_trace import span as trace_span
+from ui_plan import PlanStore
+from send_pipeline import SEND_PIPELINE, DeliveryConfirmer, sent_search_url
+import personalization
+
+# Heavy dependencies (cohere, selenium, PIL, and smtplib/ssl/email through
+# smtp_delivery) are imported on first use
+# so that importing this module - and main - stays fast. Cohere is optional.
+COHERE_AVAILABLE = importlib.util.find_spec("cohere") is not None
+
+# "screenshot" captures each step with a blocking save_screenshot call;
+# "screencast" records a DevTools screencast on a side channel instead
+CAPTURE_MODE = os.getenv("CAPTURE_MODE", "screenshot")
+
+# Seconds to keep the browser open after a failure so it can be inspected (opt-in)
+ERROR_HOLD_SECONDS = float(os.getenv("ERROR_HOLD_SECONDS", "0"))
+
+# Retries of a failed step within one send, resuming from the last checkpoint
+STEP_RETRIES = int(os.getenv("STEP_RETRIES", "2"))
+
+# Seconds a failed send's browser is kept open for a resume (0 = close at once).
+# Each parked browser stays logged in, so keep this short.
+RESUME_TTL_SECONDS = float(os.getenv("RESUME_TTL_SECONDS", "60"))
+
+# "chrome" drives a real browser; "stub" uses stub_driver.py (load tests, no Chrome)
+BROWSER_DRIVER = os.getenv("BROWSER_DRIVER", "chrome")
+
+# Multiplier for the fixed waits between steps (e.g. 0.01 with the stub browser)
+STEP_PAUSE_SCALE = float(os.getenv("STEP_PAUSE_SCALE", "1"))
+
+# Parallel LLM calls when each recipient of a multi-recipient send gets its own generation
+PERSONALIZE_CONCURRENCY = int(os.getenv("PERSONALIZE_CONCURRENCY", "8"))
+
+# Generate content while the browser starts and logs in (0 = generate first, then drive)
+GENERATION_OVERLAP = os.getenv("GENERATION_OVERLAP", "1") != "0"
+# Generations running alongside browser work per agent
+GENERATION_WORKERS = int(os.getenv("GENERATION_WORKERS", "16"))
+
+# "browser" sends through Gmail in Chrome; "smtp" delivers directly (smtp_delivery.py)
+DELIVERY_BACKEND = os.getenv("DELIVERY_BACKEND", "browser")
+
+# Seconds to wait for Gmail to finish uploading each attachment
+ATTACHMENT_UPLOAD_TIMEOUT = float(os.getenv("ATTACHMENT_UPLOAD_TIMEOUT", "120"))
+
 logger = logging.getLogger(__name__)
 
-# Load environment variables
-try:
-    load_dotenv()
-except Exception as e:
-    logger.warning(f"Could not load .env file: {e}")
+# Shared across agent instances so identical concurrent prompts hit Cohere once
+generation_flight = SingleFlight("generation")
+
+# Recent drafts by prompt similarity, reused for near-duplicate prompts
+draft_cache = DraftCache()
+
+# Model / max_tokens / temperature per call, learned from observed latency and output length
+model_router = ModelRouter()
+
+# Selectors and step order from ui_plan.json, reloaded when the file changes
+ui_plans = PlanStore()
+
+def generation_key(prompt: str, recipient_email: str = None) -> tuple:
+    """Normalize generation inputs so trivially different requests coalesce"""
+    normalized_prompt = " ".join(prompt.lower().split())
+    normalized_recipient = (recipient_email or "").strip().lower()
+    return ("generate_email_content", normalized_prompt, normalized_recipient)
+
+class PendingDraft:
+    """
+    Email content still being generated in the background. Reading a field
+    (draft["subject"]) waits for the generation; the wait is a trace span.
+    """
+
+    def __init__(self, future: Future):
+        self.future = future
+
+    def result(self) -> Dict:
+        if not self.future.done():
+            with trace_span("draft.wait", "wait"):
+                return self.future.result()
+        return self.future.result()
+
+    def __getitem__(self, key: str):
+        return self.result()[key]
+
+
+def resolve_draft(email_content) -> Optional[Dict]:
+    """The content of a draft that may still be pending; None if its generation failed"""
+    if not isinstance(email_content, PendingDraft):
+        return email_content
+    try:
+        return email_content.result()
+    except Exception as e:
+        logger.error("Background generation failed: %s", e)
+        return None
+
+class SessionContext:
+    """Per-send state, passed through the automation steps instead of living on the agent"""
+
+    def __init__(self, session_id: str = None, on_screenshot: Callable[[Dict], None] = None):
+        self.session_id = session_id or str(uuid.uuid4())
+        self.screenshots: List[Dict] = []
+        self.on_screenshot = on_screenshot
+        self.started_at = time.time()
+        self.current_step: Optional[str] = None
+        self.recorder: Optional[ScreencastRecorder] = None
+        self.failure: Optional[AutomationAbort] = None
+        self.checkpoint: Optional[str] = None
+        self.sent = False
+        # How the send was confirmed (pipelined batches only)
+        self.delivery: Optional[Dict] = None
+        self.attempts: List[Dict] = []
+        self.trace = Trace(self.session_id)
+        # The whole send uses one plan, even if the file is reloaded meanwhile
+        self.plan = ui_plans.current()
+        self.trace.root.set(ui_plan=self.plan.label)
+        self._aborted = threading.Event()
+
+    def abort(self, failure: AutomationAbort):
+        """Stop the session at its next wait (called by the failure watchdog)"""
+        if self.failure is None:
+            self.failure = failure
+        self._aborted.set()
+
+    def raise_if_aborted(self):
+        if self.failure is not None:
+            raise self.failure
+
+    def pause(self, seconds: float):
+        """Sleep between automation steps, returning early if the session is aborted"""
+        with trace_span("pause", "wait", seconds=seconds):
+            if self._aborted.wait(seconds * STEP_PAUSE_SCALE):
+                raise self.failure
+
+    @property
+    def retry_seconds(self) -> float:
+        """Time spent in attempts after the first one"""
+        return round(sum(attempt["seconds"] for attempt in self.attempts[1:]), 3)
+
+    @property
+    def timeline(self) -> List[Dict]:
+        """Screencast frames recorded for this session (empty in screenshot mode)"""
+        return self.recorder.session_frames(self.session_id) if self.recorder is not None else []
+
+    def finish_trace(self) -> Dict:
+        """Close the span tree, write it next to the screenshots and return its summary"""
+        self.trace.finish()
+        if TRACE_EXPORT:
+            self.trace.export()
+        return self.trace.summary()
+    
+    def add_screenshot(self, screenshot_info: Dict):
+        """Record a screenshot and notify live viewers"""
+        self.screenshots.append(screenshot_info)
+        if self.on_screenshot is not None:
+            try:
+                self.on_screenshot(screenshot_info)
+            except Exception as e:
+                logger.warning("Screenshot callback failed: %s", e)
 
 class AIEmailAgent:
     def __init__(self):
         """Initialize the AI Email Agent with Cohere integration"""
+        load_environment()
         api_key = os.getenv("COHERE_API_KEY")
-        logger.info(f"API Key loaded: {api_key[:20] if api_key else 'None'}...")
         
         # Check if cohere is available
         if not COHERE_AVAILABLE:
@@ -50,7 +191,13 @@ class AIEmailAgent:
         elif api_key and api_key != "your_cohere_api_key_here":
             try:
                 logger.info("Attempting to initialize Cohere client...")
-                self.cohere_client = cohere.Client(api_key)
+                import cohere
+                # COHERE_API_URL points the client at another endpoint (e.g. cohere_standin.py)
+                self.cohere_client = cohere.Client(
+                    api_key,
+                    api_url=os.getenv("COHERE_API_URL") or None,
+                    max_retries=int(os.getenv("COHERE_MAX_RETRIES", "3"))
+                )
                 # Test the client with a simple request
                 logger.info("Testing Cohere client with a simple request...")
                 test_response = self.cohere_client.generate(
@@ -62,7 +209,7 @@ class AIEmailAgent:
                 self.ai_available = True
                 logger.info("Cohere client initialized successfully")
             except Exception as e:
-                logger.error(f"Failed to initialize Cohere client: {e}")
+                logger.error("Failed to initialize Cohere client: %s", e)
                 if "insufficient_quota" in str(e) or "429" in str(e):
                     logger.warning("Cohere API quota exceeded. Using fallback mode.")
                 elif "invalid_api_key" in str(e):
@@ -74,8 +221,12 @@ class AIEmailAgent:
             logger.warning("No valid Cohere API key found. AI features will be disabled.")
             self.ai_available = False
         
-        self.screenshots = []
-        self.session_id = None
+        # Pre-launched browsers (BROWSER_POOL_SIZE) shared by all sessions
+        self.driver_pool = DriverPool(self.create_driver)
+        
+        # Content generated while the browser logs in (threads start on first use)
+        self.generation_executor = ThreadPoolExecutor(max_workers=GENERATION_WORKERS,
+                                                      thread_name_prefix="generation")
         
     def interpret_prompt(self, user_prompt: str) -> Dict:
         """
@@ -110,15 +261,19 @@ class AIEmailAgent:
             
             prompt_text = f"{system_prompt}\n\nAnalyze this prompt: {user_prompt}"
             
-            response = self.cohere_client.generate(
-                model="command",
-                prompt=prompt_text,
-                temperature=0.7,
-                max_tokens=500
-            )
+            route = model_router.route("interpret", user_prompt)
+            started = time.perf_counter()
+            with trace_span("interpret", "llm", model=route["model"], max_tokens=route["max_tokens"]):
+                response = self.cohere_client.generate(
+                    model=route["model"],
+                    prompt=prompt_text,
+                    temperature=route["temperature"],
+                    max_tokens=route["max_tokens"]
+                )
             
             # Parse the response
             content = response.generations[0].text
+            model_router.observe(route, time.perf_counter() - started, content)
             # Extract JSON from the response (handle potential formatting)
             try:
                 # Try to parse as JSON directly
@@ -142,7 +297,7 @@ class AIEmailAgent:
             return result
             
         except Exception as e:
-            logger.error(f"Error interpreting prompt: {e}")
+            logger.error("Error interpreting prompt: %s", e)
             # Fallback response
             return {
                 "email_type": "general",
@@ -152,9 +307,10 @@ class AIEmailAgent:
                 "key_points": [user_prompt]
             }
     
-    def generate_email_content(self, prompt: str, recipient_email: str = None) -> Dict:
+    def generate_email_content(self, prompt: str, recipient_email: str = None, reuse: bool = True) -> Dict:
         """
         Generate complete email content using AI
+        reuse=False always generates, even when a similar prompt has a stored draft
         """
         if not self.ai_available:
             # Fallback content generation without AI
@@ -168,6 +324,41 @@ class AIEmailAgent:
                 "ai_generated": False
             }
         
+        # A near-duplicate of a recent prompt reuses its draft
+        reused = draft_cache.lookup(prompt, recipient_email) if reuse else None
+        if reused is not None:
+            logger.info("Reusing draft of a similar prompt (similarity %s)", reused['reused_draft']['similarity'])
+            return reused
+        
+        # Identical in-flight requests share one LLM call
+        content, shared = generation_flight.do(
+            generation_key(prompt, recipient_email),
+            self._generate_email_content, prompt, recipient_email
+        )
+        if shared:
+            return copy.deepcopy(content)
+        if content.get("ai_generated"):
+            draft_cache.add(prompt, recipient_email, content)
+        return content
+    
+    def traced_generation(self, prompt: str, recipient_email: str = None) -> Dict:
+        """generate_email_content as one span of the active session trace"""
+        with trace_span("generate_email_content", "generation") as span:
+            content = self.generate_email_content(prompt, recipient_email)
+            if span is not None:
+                span.set(ai_generated=content.get("ai_generated"), reused=bool(content.get("reused_draft")))
+            return content
+    
+    def start_generation(self, prompt: str, recipient_email: str = None) -> PendingDraft:
+        """Run traced_generation in the background, in the current session's trace and log context"""
+        context = contextvars.copy_context()
+        return PendingDraft(self.generation_executor.submit(context.run, self.traced_generation,
+                                                            prompt, recipient_email))
+    
+    def _generate_email_content(self, prompt: str, recipient_email: str = None) -> Dict:
+        """
+        Run the AI generation (interpretation + enhancement) for one prompt
+        """
         try:
             # First interpret the prompt
             interpretation = self.interpret_prompt(prompt)
@@ -188,14 +379,22 @@ class AIEmailAgent:
             Make it sound natural and professional.
             """
             
-            response = self.cohere_client.generate(
-                model="command",
-                prompt=enhancement_prompt,
-                temperature=0.7,
-                max_tokens=400
+            route = model_router.route(
+                "generate", prompt,
+                email_type=detect_email_type(f"{interpretation.get('email_type', '')} {prompt}")
             )
+            started = time.perf_counter()
+            with trace_span("generate", "llm", model=route["model"], max_tokens=route["max_tokens"]):
+                response = self.cohere_client.generate(
+                    model=route["model"],
+                    prompt=enhancement_prompt,
+                    temperature=route["temperature"],
+                    max_tokens=route["max_tokens"]
+                )
             
             enhanced_content = response.generations[0].text
+            model_router.observe(route, time.perf_counter() - started, enhanced_content)
+            logger.info("Generated with %s (%s, max_tokens=%d)", route["model"], route["tier"], route["max_tokens"])
             
             # Extract subject and body from the enhanced content
             lines = enhanced_content.split('\n')
@@ -212,7 +411,7 @@ class AIEmailAgent:
             }
             
         except Exception as e:
-            logger.error(f"Error generating email content: {e}")
+            logger.error("Error generating email content: %s", e)
             # Fallback content
             return {
                 "subject": f"Re: {prompt[:50]}...",
@@ -223,35 +422,77 @@ class AIEmailAgent:
                 "ai_generated": False
             }
     
-    def capture_screenshot(self, driver, step_name: str) -> str:
-        """Capture screenshot and save with timestamp"""
-        try:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"{self.session_id}_{step_name}_{timestamp}.png"
-            filepath = os.path.join("screenshots", filename)
-            
-            # Ensure screenshots directory exists
-            os.makedirs("screenshots", exist_ok=True)
-            
-            # Take screenshot
-            driver.save_screenshot(filepath)
-            
-            # Create screenshot info
-            screenshot_info = {
-                "filename": filename,
-                "step": step_name,
-                "description": self.get_step_description(step_name),
-                "timestamp": timestamp,
-                "url": f"/screenshots/{filename}"
-            }
-            
-            self.screenshots.append(screenshot_info)
-            logger.info(f"Screenshot captured: {step_name}")
-            return filename
+    def personalize(self, prompt: str, recipients: List[Dict], mode: str = "template") -> Dict:
+        """
+        Email content for each recipient ({"email", "name", "company", "role"}).
+        template: one generation with placeholders, rendered locally per recipient.
+        individual: one generation per recipient, run concurrently.
+        """
+        if mode == "individual":
+            def generate_for(recipient):
+                details = ", ".join(
+                    f"{field}: {recipient[field]}" for field in ("name", "company", "role") if recipient.get(field)
+                )
+                content = self.generate_email_content(f"{prompt}\n\nRecipient {details}" if details else prompt,
+                                                      recipient.get("email"), reuse=False)
+                content["personalized_for"] = recipient.get("email")
+                return content
             
-        except Exception as e:
-            logger.error(f"Error capturing screenshot for {step_name}: {e}")
-            return None
+            with ThreadPoolExecutor(max_workers=max(1, min(PERSONALIZE_CONCURRENCY, len(recipients)))) as pool:
+                drafts = list(pool.map(generate_for, recipients))
+            generations = len(recipients)
+        elif mode == "template":
+            # The placeholder instruction only makes sense to the model; the fallback would echo it
+            template_prompt = f"{prompt}\n\n{personalization.TEMPLATE_INSTRUCTION}" if self.ai_available else prompt
+            template = personalization.templatize(self.generate_email_content(template_prompt))
+            drafts = [personalization.render(template, recipient) for recipient in recipients]
+            generations = 1 if recipients else 0
+        else:
+            raise ValueError(f"Unknown personalization mode '{mode}'")
+        
+        logger.info("Personalized %s emails with %s generations (%s)", len(recipients), generations, mode)
+        return {
+            "mode": mode,
+            "generations": generations if self.ai_available else 0,
+            "drafts": drafts
+        }
+    
+    def capture_screenshot(self, driver, step_name: str, ctx: "SessionContext") -> str:
+        """Capture screenshot for a session and save with timestamp"""
+        with trace_span("screenshot", "screenshot", step=step_name):
+            try:
+                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+                
+                # Ensure screenshots directory exists
+                os.makedirs("screenshots", exist_ok=True)
+                
+                # While a screencast is running the latest frame is the keyframe,
+                # so the automation thread does not wait on a capture round trip
+                filename = f"{ctx.session_id}_{step_name}_{timestamp}.jpg"
+                filepath = os.path.join("screenshots", filename)
+                if ctx.recorder is None or not ctx.recorder.active or not ctx.recorder.save_keyframe(filepath):
+                    # Take screenshot
+                    filename = f"{ctx.session_id}_{step_name}_{timestamp}.png"
+                    filepath = os.path.join("screenshots", filename)
+                    driver.save_screenshot(filepath)
+                
+                # Create screenshot info
+                screenshot_info = {
+                    "filename": filename,
+                    "step": step_name,
+                    "description": self.get_step_description(step_name),
+                    "timestamp": timestamp,
+                    "captured_at": time.time(),
+                    "url": f"/screenshots/{filename}"
+                }
+                
+                ctx.add_screenshot(screenshot_info)
+                logger.info("Screenshot captured: %s", step_name)
+                return filename
+                
+            except Exception as e:
+                logger.error("Error capturing screenshot for %s: %s", step_name, e)
+                return None
     
     def get_step_description(self, step_name: str) -> str:
         """Get human-readable description for each step"""
@@ -270,497 +511,817 @@ class AIEmailAgent:
         }
         return descriptions.get(step_name, f"Step: {step_name}")
     
-    def wait_for_element_safe(self, driver, by, selector, timeout=10, condition="clickable"):
-        """Safely wait for element with multiple conditions"""
+    def wait_for_element_safe(self, driver, by, selector, timeout=10, condition="clickable", ctx=None):
+        """Safely wait for element with multiple conditions; stops early if ctx is aborted"""
+        from selenium.webdriver.support.ui import WebDriverWait
+        from selenium.webdriver.support import expected_conditions as EC
+        from selenium.common.exceptions import TimeoutException
         wait = WebDriverWait(driver, timeout)
-        try:
-            if condition == "clickable":
-                return wait.until(EC.element_to_be_clickable((by, selector)))
-            elif condition == "visible":
-                return wait.until(EC.visibility_of_element_located((by, selector)))
-            elif condition == "present":
-                return wait.until(EC.presence_of_element_located((by, selector)))
-            else:
-                return wait.until(EC.presence_of_element_located((by, selector)))
-        except TimeoutException:
-            return None
+        if condition == "clickable":
+            expected = EC.element_to_be_clickable((by, selector))
+        elif condition == "visible":
+            expected = EC.visibility_of_element_located((by, selector))
+        elif condition == "any_visible":
+            expected = EC.visibility_of_any_elements_located((by, selector))
+        else:
+            expected = EC.presence_of_element_located((by, selector))
+        
+        def until_found_or_aborted(d):
+            if ctx is not None:
+                ctx.raise_if_aborted()
+            return expected(d)
+        
+        with trace_span("wait_for", "selector", selector=selector, condition=condition) as span:
+            try:
+                element = wait.until(until_found_or_aborted)
+            except TimeoutException:
+                element = None
+            if span is not None:
+                span.set(found=element is not None)
+            return element
     
-    def find_element_with_fallback(self, driver, selectors, by=By.CSS_SELECTOR, timeout=10):
-        """Find element using multiple selectors with fallback"""
-        for selector in selectors:
+    def find_field(self, driver, ctx: SessionContext, name: str, timeout: float = None, **values):
+        """
+        Find a field of the session's UI plan. One wait covers all of the field's
+        CSS selectors (their compiled group), then the first displayed and enabled
+        match is taken in the plan's priority order; the XPath union is only
+        tried if no CSS selector matched.
+        """
+        query = ctx.plan.field(name, **values)
+        for by, combined, selectors, wait in query.lookups(timeout):
             try:
-                element = self.wait_for_element_safe(driver, by, selector, timeout, "visible")
-                if element and element.is_displayed() and element.is_enabled():
-                    logger.info(f"Found element with selector: {selector}")
-                    return element
+                if not self.wait_for_element_safe(driver, by, combined, wait, "any_visible", ctx=ctx):
+                    continue
+                for selector in selectors:
+                    for element in driver.find_elements(by, selector):
+                        if element.is_displayed() and element.is_enabled():
+                            logger.debug("Found %s with selector: %s", name, selector, extra={"sample": "selector"})
+                            return element
+            except AutomationAbort:
+                raise
             except Exception as e:
-                logger.debug(f"Selector {selector} failed: {e}")
-                continue
+                logger.debug("Lookup of %s failed: %s", name, e, extra={"sample": "selector_miss"})
         return None
     
+    def run_step(self, ctx: SessionContext, name: str, step: Callable, *args):
+        """Run one automation step, tagging the session with the step name"""
+        ctx.raise_if_aborted()
+        ctx.current_step = name
+        return step(*args)
+    
+    def create_driver(self):
+        """Start a Chrome WebDriver configured to look like a regular browser"""
+        if BROWSER_DRIVER == "stub":
+            from stub_driver import StubDriver
+            return StubDriver()
+        from selenium import webdriver
+        from selenium.webdriver.chrome.options import Options
+        from selenium.webdriver.chrome.service import Service
+        chrome_options = Options()
+        chrome_options.add_argument("--no-sandbox")
+        chrome_options.add_argument("--disable-dev-shm-usage")
+        chrome_options.add_argument("--disable-gpu")
+        chrome_options.add_argument("--window-size=1920,1080")
+        chrome_options.add_argument("--disable-blink-features=AutomationControlled")
+        chrome_options.add_argument("--disable-extensions")
+        chrome_options.add_argument("--disable-plugins")
+        chrome_options.add_argument("--disable-images")
+        chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
+        chrome_options.add_experimental_option('useAutomationExtension', False)
+        
+        # Add user agent to avoid detection
+        chrome_options.add_argument("--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36")
+        
+        # Reuse the chromedriver path resolved during startup prewarm
+        driver = webdriver.Chrome(options=chrome_options, service=Service(executable_path=cached_driver_path()))
+        
+        # Remove webdriver property to avoid detection
+        driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
+        driver.execute_script("Object.defineProperty(navigator, 'plugins', {get: () => [1, 2, 3, 4, 5]})")
+        driver.execute_script("Object.defineProperty(navigator, 'languages', {get: () => ['en-US', 'en']})")
+        return driver
+    
+    def step_navigate(self, driver, ctx: SessionContext):
+        """Step 1: Navigate to Gmail"""
+        logger.info("Navigating to Gmail...")
+        driver.get("https://mail.google.com")
+        ctx.pause(5)  # Wait for page to load
+        self.capture_screenshot(driver, "start", ctx)
+    
+    def step_login(self, driver, ctx: SessionContext, gmail_id: str, gmail_password: str):
+        """Step 2: Login"""
+        logger.info("Logging into Gmail...")
+        
+        email_input = self.find_field(driver, ctx, "email_input")
+        if not email_input:
+            raise Exception("Could not find email input field")
+        
+        # Clear and enter email
+        email_input.clear()
+        ctx.pause(1)
+        email_input.send_keys(gmail_id)
+        ctx.pause(2)
+        
+        next_button = self.find_field(driver, ctx, "email_next")
+        if not next_button:
+            raise Exception("Could not find next button")
+        
+        next_button.click()
+        ctx.pause(5)
+        self.capture_screenshot(driver, "login", ctx)
+        
+        password_input = self.find_field(driver, ctx, "password_input")
+        if not password_input:
+            raise Exception("Could not find password input field")
+        
+        # Clear and enter password
+        password_input.clear()
+        ctx.pause(1)
+        password_input.send_keys(gmail_password)
+        ctx.pause(2)
+        
+        password_next = self.find_field(driver, ctx, "password_next")
+        if not password_next:
+            raise Exception("Could not find password next button")
+        
+        password_next.click()
+        ctx.pause(8)  # Wait longer for login to complete (ends early if the watchdog fires)
+        self.capture_screenshot(driver, "login", ctx)
+        
+        # Check for security challenges and login errors in one round trip
+        failure = probe_page(driver)
+        if failure:
+            logger.warning("Security challenge detected - automation may fail")
+            self.capture_screenshot(driver, "security_challenge", ctx)
+            ctx.abort(AutomationAbort(*failure))
+            ctx.raise_if_aborted()
+    
+    def step_compose(self, driver, ctx: SessionContext, inbox_loaded: bool = False):
+        """Step 3: Open compose window (inbox_loaded: Gmail is already up in this tab)"""
+        logger.info("Opening compose window...")
+        
+        # Wait for Gmail to fully load
+        if not inbox_loaded:
+            ctx.pause(5)
+        
+        compose_button = self.find_field(driver, ctx, "compose_button")
+        if not compose_button:
+            # Try clicking by JavaScript as fallback
+            try:
+                driver.execute_script("document.querySelector(arguments[0]).click()",
+                                      ctx.plan.fields["compose_button"].css[0])
+                ctx.pause(3)
+            except AutomationAbort:
+                raise
+            except:
+                raise Exception("Could not open compose window")
+        else:
+            compose_button.click()
+            ctx.pause(5)
+        
+        self.capture_screenshot(driver, "compose", ctx)
+        
+        # Wait for compose window to fully load
+        logger.info("Waiting for compose window to load...")
+        ctx.pause(8)
+    
+    def step_recipient(self, driver, ctx: SessionContext, recipient_email: str):
+        """Step 4: Fill recipient, with debugging of the compose window's inputs"""
+        from selenium.webdriver.common.by import By
+        logger.info("Entering recipient...")
+        candidates = ctx.plan.fields["input_candidates"].css_group
+        
+        # Wait for compose window to fully load
+        ctx.pause(8)
+        
+        # Debug available elements (costs a browser round trip per attribute, so only at DEBUG)
+        if logger.isEnabledFor(logging.DEBUG):
+            try:
+                all_inputs = driver.find_elements(By.CSS_SELECTOR, candidates)
+                inputs = []
+                for elem in all_inputs[:10]:  # First 10 elements
+                    if elem.is_displayed():
+                        inputs.append({attr: elem.get_attribute(attr) or "" for attr in ("placeholder", "aria-label", "role", "name")})
+                logger.debug("Found %d input elements", len(all_inputs), extra={"sample": "element_dump", "inputs": inputs})
+            except Exception as e:
+                logger.warning("Could not debug input elements: %s", e)
+        
+        to_field = self.find_field(driver, ctx, "recipient")
+        
+        if not to_field:
+            # Last resort: try to find any input field that might be the recipient field
+            try:
+                all_inputs = driver.find_elements(By.CSS_SELECTOR, candidates)
+                for input_elem in all_inputs:
+                    if input_elem.is_displayed() and input_elem.is_enabled():
+                        # Check if it's likely a recipient field
+                        placeholder = input_elem.get_attribute("placeholder") or ""
+                        aria_label = input_elem.get_attribute("aria-label") or ""
+                        name = input_elem.get_attribute("name") or ""
+                        if ("to" in placeholder.lower() or "recipient" in placeholder.lower() or 
+                            "to" in aria_label.lower() or "recipient" in aria_label.lower() or
+                            "to" in name.lower() or "recipient" in name.lower()):
+                            to_field = input_elem
+                            logger.debug("Found recipient field by placeholder/aria-label/name", extra={"sample": "selector"})
+                            break
+            except:
+                pass
+        
+        if not to_field:
+            # Try clicking on the compose area to focus it
+            try:
+                compose_area = driver.find_element(By.CSS_SELECTOR, ctx.plan.fields["compose_dialog"].css_group)
+                compose_area.click()
+                ctx.pause(2)
+                
+                # Try to find recipient field again after clicking
+                to_field = self.find_field(driver, ctx, "recipient", timeout=10)
+            except AutomationAbort:
+                raise
+            except:
+                pass
+        
+        if not to_field:
+            raise Exception("Could not find recipient field")
+        
+        # Clear and fill the recipient field
+        to_field.clear()
+        ctx.pause(1)
+        to_field.send_keys(recipient_email)
+        ctx.pause(2)
+        self.capture_screenshot(driver, "recipient", ctx)
+    
+    def step_subject(self, driver, ctx: SessionContext, subject: str):
+        """Step 5: Fill subject"""
+        logger.info("Entering subject...")
+        subject_field = self.find_field(driver, ctx, "subject")
+        
+        if not subject_field:
+            raise Exception("Could not find subject field")
+        
+        # Clear and fill subject
+        subject_field.clear()
+        ctx.pause(1)
+        subject_field.send_keys(subject)
+        ctx.pause(2)
+        self.capture_screenshot(driver, "subject", ctx)
+    
+    def step_body(self, driver, ctx: SessionContext, body: str):
+        """Step 6: Fill email body"""
+        from selenium.webdriver.common.by import By
+        logger.info("Entering email body...")
+        body_field = self.find_field(driver, ctx, "body")
+        
+        if not body_field:
+            # Last resort: find the largest contenteditable div
+            try:
+                contenteditable_divs = driver.find_elements(By.CSS_SELECTOR, ctx.plan.fields["body_candidates"].css_group)
+                if contenteditable_divs:
+                    # Find the largest one (likely the body field)
+                    largest_div = max(contenteditable_divs, key=lambda x: x.size['width'] * x.size['height'])
+                    if largest_div.is_displayed() and largest_div.is_enabled():
+                        body_field = largest_div
+                        logger.debug("Found body field by size (largest contenteditable div)", extra={"sample": "selector"})
+            except:
+                pass
+        
+        if not body_field:
+            raise Exception("Could not find body field")
+        
+        # Clear and fill body
+        body_field.clear()
+        ctx.pause(1)
+        body_field.send_keys(body)
+        ctx.pause(2)
+        self.capture_screenshot(driver, "body", ctx)
+    
+    def step_attach(self, driver, ctx: SessionContext, attachments: List[Dict]):
+        """Attach files from disk through the compose window's file input"""
+        from selenium.webdriver.common.by import By
+        logger.info("Attaching %d file(s)...", len(attachments))
+        # The file input is hidden, so it is looked up directly rather than waited for
+        file_inputs = []
+        for selector in ctx.plan.fields["attach_input"].css:
+            file_inputs = driver.find_elements(By.CSS_SELECTOR, selector)
+            if file_inputs:
+                break
+        if not file_inputs:
+            raise Exception("Could not find attachment input")
+        # Newline-separated paths select all files at once; the browser reads them from disk
+        file_inputs[-1].send_keys("\n".join(os.path.abspath(attachment["path"]) for attachment in attachments))
+        
+        # Each file shows up in the compose window once its upload has finished
+        for attachment in attachments:
+            chip = ctx.plan.field("attachment_chip", filename=attachment["filename"])
+            if self.wait_for_element_safe(driver, By.CSS_SELECTOR, chip.css_group, ATTACHMENT_UPLOAD_TIMEOUT,
+                                          "visible", ctx=ctx) is None:
+                raise Exception(f"Upload of {attachment['filename']} did not finish")
+        ctx.pause(1)
+        self.capture_screenshot(driver, "attach", ctx)
+    
+    def step_send(self, driver, ctx: SessionContext):
+        """Step 7: Send email and verify"""
+        logger.info("Sending email...")
+        send_button = self.find_field(driver, ctx, "send_button")
+        
+        if not send_button:
+            raise Exception("Could not find send button")
+        
+        send_button.click()
+        # Past this point a retry could send the email twice
+        ctx.sent = True
+        ctx.pause(5)
+        self.capture_screenshot(driver, "send", ctx)
+        
+        # Step 8: Verify success
+        logger.info("Verifying email sent...")
+        ctx.pause(3)
+        self.capture_screenshot(driver, "success", ctx)
+    
+    def step_send_pipelined(self, driver, ctx: SessionContext, confirmer: DeliveryConfirmer):
+        """Click Send and move on to the next message; confirmer confirms the delivery in the background"""
+        logger.info("Sending email (pipelined)...")
+        send_button = self.find_field(driver, ctx, "send_button")
+        
+        if not send_button:
+            raise Exception("Could not find send button")
+        
+        confirmer.expect(ctx)
+        try:
+            send_button.click()
+        except Exception:
+            confirmer.cancel(ctx)
+            raise
+        # Past this point a retry could send the email twice
+        ctx.sent = True
+        self.capture_screenshot(driver, "send", ctx)
+    
+    def confirm_in_sent(self, driver, ctx: SessionContext, recipient_email: str, subject: str) -> bool:
+        """Look for a send that got no "Message sent" toast in the Sent folder"""
+        try:
+            with activate(ctx.trace), trace_span("delivery.sent_folder", "wait"):
+                driver.get(sent_search_url(recipient_email, subject))
+                found = self.find_field(driver, ctx, "sent_row") is not None
+        except Exception as e:
+            logger.warning("Sent folder check for session %s failed: %s", ctx.session_id, e)
+            found = False
+        ctx.delivery = {**(ctx.delivery or {}), "confirmed": found, "via": "sent_folder" if found else None}
+        return found
+    
+    def send_steps(self, driver, ctx: SessionContext, gmail_id: str, gmail_password: str,
+                   recipient_email: str, email_content, attachments: List[Dict] = None) -> List[tuple]:
+        """
+        The checkpointed steps of one send as (name, step, args), in the order
+        of the session's UI plan. email_content may be a PendingDraft; it is
+        first read by the subject step.
+        """
+        available = {
+            "navigate": (self.step_navigate, (driver, ctx)),
+            "login": (self.step_login, (driver, ctx, gmail_id, gmail_password)),
+            "compose": (self.step_compose, (driver, ctx)),
+            "recipient": (self.step_recipient, (driver, ctx, recipient_email)),
+            "subject": (self.fill_from_draft, (self.step_subject, driver, ctx, email_content, "subject")),
+            "body": (self.fill_from_draft, (self.step_body, driver, ctx, email_content, "body")),
+            "attach": (self.step_attach, (driver, ctx, attachments)),
+            "send": (self.step_send, (driver, ctx)),
+        }
+        names = list(ctx.plan.steps)
+        if not attachments:
+            names = [name for name in names if name != "attach"]
+        elif "attach" not in names:
+            names.insert(names.index("send"), "attach")
+        return [(name, *available[name]) for name in names]
+    
+    def fill_from_draft(self, step: Callable, driver, ctx: SessionContext, email_content, field: str):
+        """Run a subject/body step with one field of the draft, read only when the step runs"""
+        return step(driver, ctx, email_content[field])
+    
+    def resume_index(self, ctx: SessionContext, steps: List[tuple], failed_step: str = None,
+                     resumed_from: int = None) -> int:
+        """
+        Where a retry starts: just after the last good checkpoint. If resuming
+        from there already failed at the same step, the compose window is likely
+        gone, so the retry opens a fresh one.
+        """
+        names = [name for name, _, _ in steps]
+        index = names.index(ctx.checkpoint) + 1 if ctx.checkpoint in names else 0
+        compose = names.index("compose")
+        if index > compose and index == resumed_from and names[index] == failed_step:
+            index = compose
+        return index
+    
+    def run_checkpointed(self, ctx: SessionContext, steps: List[tuple], start_index: int = 0,
+                         retries: int = None):
+        """
+        Run steps from start_index, checkpointing after each one. A failed step
+        is retried in the same browser from the last good checkpoint; classified
+        aborts and failures after the send click are not retried. Every attempt
+        is recorded on ctx.attempts.
+        """
+        retries = STEP_RETRIES if retries is None else retries
+        index = start_index
+        for attempt in range(retries + 1):
+            resumed_from = index
+            started = time.perf_counter()
+            try:
+                for name, step, args in steps[index:]:
+                    with trace_span(name, "step", attempt=attempt + 1):
+                        self.run_step(ctx, name, step, *args)
+                    ctx.checkpoint = name
+                    index += 1
+                ctx.attempts.append({
+                    "attempt": len(ctx.attempts) + 1,
+                    "resumed_from": steps[resumed_from][0],
+                    "failed_step": None,
+                    "error": None,
+                    "seconds": round(time.perf_counter() - started, 3)
+                })
+                return
+            except Exception as e:
+                failed_step = steps[index][0]
+                ctx.attempts.append({
+                    "attempt": len(ctx.attempts) + 1,
+                    "resumed_from": steps[resumed_from][0],
+                    "failed_step": failed_step,
+                    "error": str(e),
+                    "seconds": round(time.perf_counter() - started, 3)
+                })
+                if isinstance(e, AutomationAbort) or ctx.sent or attempt == retries:
+                    raise
+                index = self.resume_index(ctx, steps, failed_step, resumed_from)
+                ctx.checkpoint = steps[index - 1][0] if index else None
+                logger.warning("Step %s failed (%s); retrying from %s", failed_step, e, steps[index][0])
+    
     def send_email(self, gmail_id: str, gmail_password: str, 
-                   recipient_email: str, user_prompt: str) -> Dict:
+                   recipient_email: str, user_prompt: str, session_id: str = None,
+                   on_screenshot: Callable[[Dict], None] = None, capture_mode: str = None,
+                   email_content: Dict = None, attachments: List[Dict] = None) -> Dict:
         """
-        Main method to send email using AI-generated content with improved automation
+        Main method to send email using AI-generated content with improved automation.
+        All per-send state lives in a SessionContext, so one agent can run many
+        sends concurrently. Pass email_content to skip generation. Otherwise the
+        content is generated while the browser starts and logs in, and the
+        automation only waits for it at the subject step.
         """
-        self.session_id = str(uuid.uuid4())
-        self.screenshots = []
+        ctx = SessionContext(session_id, on_screenshot)
         
-        try:
-            logger.info(f"Starting AI-powered email automation for session {self.session_id}")
-            
-            # Generate email content using AI
-            logger.info("Generating email content using AI...")
-            email_content = self.generate_email_content(user_prompt, recipient_email)
+        with log_context(ctx.session_id), activate(ctx.trace):
+            try:
+                logger.info("Starting AI-powered email automation for session %s", ctx.session_id)
+                
+                if email_content is None:
+                    # Generate email content using AI
+                    logger.info("Generating email content using AI...")
+                    if GENERATION_OVERLAP:
+                        email_content = self.start_generation(user_prompt, recipient_email)
+                    else:
+                        email_content = self.traced_generation(user_prompt, recipient_email)
+                
+                # Take a pre-launched browser from the pool (or start one)
+                with trace_span("driver.acquire", "driver"):
+                    driver = self.driver_pool.acquire()
+            except Exception as e:
+                logger.error("Failed to initialize automation: %s", e)
+                if isinstance(email_content, PendingDraft):
+                    email_content.future.cancel()
+                return {
+                    "status": "error",
+                    "message": f"Failed to start automation: {str(e)}",
+                    "screenshots": ctx.screenshots,
+                    "trace": ctx.finish_trace(),
+                    "session_id": ctx.session_id,
+                    "ai_generated": False
+                }
             
-            logger.info(f"AI generated email - Type: {email_content['email_type']}, Tone: {email_content['tone']}")
+            return self._drive_send(driver, ctx, gmail_id, gmail_password, recipient_email,
+                                    email_content, capture_mode, attachments=attachments)
+    
+    def resume_email(self, session_id: str, gmail_id: str, gmail_password: str,
+                     recipient_email: str, user_prompt: str,
+                     on_screenshot: Callable[[Dict], None] = None, capture_mode: str = None,
+                     email_content: Dict = None, attachments: List[Dict] = None) -> Dict:
+        """
+        Resume a failed send. If its browser is still parked, continue from the
+        last good checkpoint in that browser; otherwise start over, reusing the
+        already generated content when it is known.
+        """
+        with log_context(session_id):
+            parked = self.driver_pool.unpark(session_id)
+            if parked is None:
+                logger.info("No parked browser for session %s, starting over", session_id)
+                return self.send_email(gmail_id, gmail_password, recipient_email, user_prompt,
+                                       session_id, on_screenshot, capture_mode, email_content, attachments)
             
-            # Initialize Selenium WebDriver with improved options
-            chrome_options = Options()
-            chrome_options.add_argument("--no-sandbox")
-            chrome_options.add_argument("--disable-dev-shm-usage")
-            chrome_options.add_argument("--disable-gpu")
-            chrome_options.add_argument("--window-size=1920,1080")
-            chrome_options.add_argument("--disable-blink-features=AutomationControlled")
-            chrome_options.add_argument("--disable-extensions")
-            chrome_options.add_argument("--disable-plugins")
-            chrome_options.add_argument("--disable-images")
-            chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
-            chrome_options.add_experimental_option('useAutomationExtension', False)
+            driver, state = parked
+            ctx = SessionContext(session_id, on_screenshot)
+            ctx.checkpoint = state["checkpoint"]
+            ctx.attempts = list(state["attempts"])
+            ctx.screenshots = list(state["screenshots"])
+            # The resumed attempts extend the trace of the failed ones
+            ctx.trace = state["trace"]
+            ctx.trace.reopen()
+            email_content = state["email_content"]
+            attachments = state["attachments"]
+            steps = self.send_steps(driver, ctx, gmail_id, gmail_password, recipient_email, email_content,
+                                    attachments)
+            start_index = self.resume_index(ctx, steps, state["failed_step"], state["resumed_from"])
+            logger.info("Resuming session %s from %s in its parked browser", session_id, steps[start_index][0])
+            with activate(ctx.trace):
+                return self._drive_send(driver, ctx, gmail_id, gmail_password, recipient_email,
+                                        email_content, capture_mode, start_index, attachments)
+    
+    def _drive_send(self, driver, ctx: SessionContext, gmail_id: str, gmail_password: str,
+                    recipient_email: str, email_content: Dict, capture_mode: str = None,
+                    start_index: int = 0, attachments: List[Dict] = None) -> Dict:
+        """Run the checkpointed steps in driver; park the browser if the send can be resumed"""
+        capture_mode = capture_mode or CAPTURE_MODE
+        if capture_mode == "screencast":
+            ctx.recorder = ScreencastRecorder(driver, ctx)
+            if not ctx.recorder.start():
+                logger.warning("Screencast unavailable, falling back to per-step screenshots")
+        
+        # Watch every step for challenge pages, CAPTCHAs and auth failures
+        watchdog = FailureWatchdog(driver, ctx)
+        watchdog.start()
+        resumable = False
+        
+        try:
+            steps = self.send_steps(driver, ctx, gmail_id, gmail_password, recipient_email, email_content,
+                                    attachments)
+            self.run_checkpointed(ctx, steps, start_index)
+            email_content = resolve_draft(email_content)
+            logger.info("AI generated email - Type: %s, Tone: %s", email_content["email_type"], email_content["tone"])
             
-            # Add user agent to avoid detection
-            chrome_options.add_argument("--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36")
+            return {
+                "status": "success",
+                "message": "Email sent successfully using AI-generated content!",
+                "screenshots": ctx.screenshots,
+                "timeline": ctx.timeline,
+                "trace": ctx.finish_trace(),
+                "attempts": ctx.attempts,
+                "retry_seconds": ctx.retry_seconds,
+                "session_id": ctx.session_id,
+                "email_content": email_content,
+                "ai_generated": True
+            }
             
-            driver = webdriver.Chrome(options=chrome_options)
+        except Exception as e:
+            logger.error("Error during automation: %s", e)
+            try:
+                self.capture_screenshot(driver, "error", ctx)
+            except:
+                pass
             
-            # Remove webdriver property to avoid detection
-            driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
-            driver.execute_script("Object.defineProperty(navigator, 'plugins', {get: () => [1, 2, 3, 4, 5]})")
-            driver.execute_script("Object.defineProperty(navigator, 'languages', {get: () => ['en-US', 'en']})")
+            # Optionally keep the browser open so the error can be inspected
+            if ERROR_HOLD_SECONDS > 0:
+                logger.info("Keeping browser open for %s seconds to show error...", ERROR_HOLD_SECONDS)
+                time.sleep(ERROR_HOLD_SECONDS)
             
-            wait = WebDriverWait(driver, 30)
+            could_resume = (RESUME_TTL_SECONDS > 0 and bool(ctx.attempts) and not ctx.sent
+                            and not isinstance(e, AutomationAbort))
+            if could_resume or not isinstance(email_content, PendingDraft) or email_content.future.done():
+                # A failure before the subject step may leave the generation running
+                email_content = resolve_draft(email_content)
+            else:
+                # Nothing will reuse the content, so the error is returned without waiting for it
+                email_content.future.cancel()
+                email_content = None
+            resumable = could_resume and email_content is not None
+            return {
+                "status": "error",
+                "message": f"Automation failed: {str(e)}",
+                "error_code": e.code if isinstance(e, AutomationAbort) else None,
+                "failed_step": ctx.current_step,
+                "checkpoint": ctx.checkpoint,
+                "resumable": resumable,
+                "attempts": ctx.attempts,
+                "retry_seconds": ctx.retry_seconds,
+                "screenshots": ctx.screenshots,
+                "timeline": ctx.timeline,
+                "trace": ctx.finish_trace(),
+                "session_id": ctx.session_id,
+                "email_content": email_content,
+                "ai_generated": True
+            }
             
+        finally:
+            watchdog.stop()
+            if ctx.recorder is not None:
+                ctx.recorder.stop()
+            if resumable:
+                logger.info("Keeping browser for session %s so the send can be resumed", ctx.session_id)
+                last = ctx.attempts[-1]
+                self.driver_pool.park(ctx.session_id, driver, {
+                    "checkpoint": ctx.checkpoint,
+                    "failed_step": last["failed_step"],
+                    "resumed_from": [name for name, _, _ in steps].index(last["resumed_from"]),
+                    "attempts": ctx.attempts,
+                    "screenshots": ctx.screenshots,
+                    "trace": ctx.trace,
+                    "email_content": email_content,
+                    "attachments": attachments,
+                }, RESUME_TTL_SECONDS)
+            else:
+                logger.info("Closing browser...")
+                self.driver_pool.release(driver)
+
+    def send_direct(self, gmail_id: str, gmail_password: str, recipient_email: str, user_prompt: str,
+                    session_id: str = None, on_screenshot: Callable[[Dict], None] = None,
+                    capture_mode: str = None, email_content: Dict = None,
+                    attachments: List[Dict] = None) -> Dict:
+        """
+        Deliver over SMTP instead of driving Gmail (DELIVERY_BACKEND=smtp).
+        gmail_password is used as the SMTP (app) password; there are no screenshots.
+        """
+        ctx = SessionContext(session_id, on_screenshot)
+        with log_context(ctx.session_id), activate(ctx.trace):
             try:
-                # Step 1: Navigate to Gmail
-                logger.info("Navigating to Gmail...")
-                driver.get("https://mail.google.com")
-                time.sleep(5)  # Wait for page to load
-                self.capture_screenshot(driver, "start")
-                
-                # Step 2: Login with improved selectors
-                logger.info("Logging into Gmail...")
-                
-                # Email input with multiple selectors
-                email_selectors = [
-                    "input[type='email']",
-                    "input[name='identifier']",
-                    "#identifierId",
-                    "input[aria-label*='Email']",
-                    "input[aria-label*='email']"
-                ]
-                
-                email_input = self.find_element_with_fallback(driver, email_selectors)
-                if not email_input:
-                    raise Exception("Could not find email input field")
-                
-                # Clear and enter email
-                email_input.clear()
-                time.sleep(1)
-                email_input.send_keys(gmail_id)
-                time.sleep(2)
-                
-                # Next button with multiple selectors
-                next_selectors = [
-                    "#identifierNext button",
-                    "#identifierNext",
-                    "button[jsname='LgbsSe']",
-                    "button[type='submit']",
-                    "button[aria-label*='Next']",
-                    "button:contains('Next')"
-                ]
-                
-                next_button = self.find_element_with_fallback(driver, next_selectors)
-                if not next_button:
-                    raise Exception("Could not find next button")
-                
-                next_button.click()
-                time.sleep(5)
-                self.capture_screenshot(driver, "login")
-                
-                # Password input with improved handling
-                password_selectors = [
-                    "input[type='password']",
-                    "input[name='password']",
-                    "input[aria-label*='Password']",
-                    "input[aria-label*='password']"
-                ]
-                
-                password_input = self.find_element_with_fallback(driver, password_selectors, timeout=15)
-                if not password_input:
-                    raise Exception("Could not find password input field")
-                
-                # Clear and enter password
-                password_input.clear()
-                time.sleep(1)
-                password_input.send_keys(gmail_password)
-                time.sleep(2)
-                
-                # Password next button
-                password_next_selectors = [
-                    "#passwordNext button",
-                    "#passwordNext",
-                    "button[jsname='LgbsSe']",
-                    "button[type='submit']",
-                    "button[aria-label*='Next']"
-                ]
-                
-                password_next = self.find_element_with_fallback(driver, password_next_selectors)
-                if not password_next:
-                    raise Exception("Could not find password next button")
-                
-                password_next.click()
-                time.sleep(8)  # Wait longer for login to complete
-                self.capture_screenshot(driver, "login")
-                
-                # Check for security challenges
-                security_selectors = [
-                    "div[data-challenge-type]",
-                    "#challengePickerList",
-                    ".challenge-picker",
-                    "div[aria-label*='verification']"
-                ]
-                
-                for selector in security_selectors:
-                    try:
-                        if driver.find_element(By.CSS_SELECTOR, selector):
-                            logger.warning("Security challenge detected - automation may fail")
-                            self.capture_screenshot(driver, "security_challenge")
-                            raise Exception("Gmail security challenge detected. Please complete manually.")
-                    except NoSuchElementException:
-                        continue
-                
-                # Step 3: Open compose window with improved selectors
-                logger.info("Opening compose window...")
-                
-                # Wait for Gmail to fully load
-                time.sleep(5)
-                
-                compose_selectors = [
-                    "div[role='button'][data-tooltip*='Compose']",
-                    "div[role='button'][aria-label*='Compose']",
-                    "div[data-tooltip*='Compose']",
-                    "div[jsaction*='compose']",
-                    "div[aria-label*='Compose']",
-                    "div[title*='Compose']",
-                    "div[data-tooltip='Compose']",
-                    "div[data-tooltip='New Message']",
-                    "div[aria-label='Compose']",
-                    "div[aria-label='New Message']"
-                ]
-                
-                compose_button = self.find_element_with_fallback(driver, compose_selectors, timeout=15)
-                if not compose_button:
-                    # Try clicking by JavaScript as fallback
-                    try:
-                        driver.execute_script("document.querySelector('div[role=\"button\"][data-tooltip*=\"Compose\"]').click()")
-                        time.sleep(3)
-                    except:
-                        raise Exception("Could not open compose window")
-                else:
-                    compose_button.click()
-                    time.sleep(5)
-                
-                self.capture_screenshot(driver, "compose")
-                
-                # Wait for compose window to fully load
-                logger.info("Waiting for compose window to load...")
-                time.sleep(8)
-                
-                # Step 4: Fill recipient with improved selectors and debugging
-                logger.info("Entering recipient...")
-                
-                # Wait for compose window to fully load
-                time.sleep(8)
-                
-                # Debug available elements
-                try:
-                    all_inputs = driver.find_elements(By.CSS_SELECTOR, "input, textarea, div[contenteditable='true']")
-                    logger.info(f"Found {len(all_inputs)} input elements")
-                    for i, elem in enumerate(all_inputs[:10]):  # Log first 10 elements
-                        if elem.is_displayed():
-                            placeholder = elem.get_attribute("placeholder") or ""
-                            aria_label = elem.get_attribute("aria-label") or ""
-                            role = elem.get_attribute("role") or ""
-                            name = elem.get_attribute("name") or ""
-                            logger.info(f"Input {i}: placeholder='{placeholder}', aria-label='{aria_label}', role='{role}', name='{name}'")
-                except Exception as e:
-                    logger.warning(f"Could not debug input elements: {e}")
-                
-                # Updated recipient selectors for current Gmail UI
-                to_selectors = [
-                    "textarea[name='to']",
-                    "input[name='to']",
-                    "div[role='textbox'][aria-label*='To']",
-                    "div[contenteditable='true'][aria-label*='To']",
-                    "div[role='textbox']",
-                    "div[contenteditable='true']",
-                    "input[type='email']",
-                    "input[placeholder*='Recipients']",
-                    "input[placeholder*='To']",
-                    "div[data-tooltip*='To']",
-                    "div[aria-label*='To']",
-                    "div[data-tooltip*='Recipients']",
-                    "div[contenteditable='true'][data-tooltip*='To']",
-                    "div[contenteditable='true'][data-tooltip*='Recipients']",
-                    "div[aria-label*='Recipients']",
-                    "div[data-tooltip*='Add recipients']",
-                    "div[aria-label*='Add recipients']",
-                    "div[data-tooltip*='Add people']",
-                    "div[aria-label*='Add people']"
-                ]
-                
-                to_field = self.find_element_with_fallback(driver, to_selectors, timeout=15)
-                
-                if not to_field:
-                    # Try XPath as fallback
-                    xpath_selectors = [
-                        "//div[@role='textbox' and contains(@aria-label, 'To')]",
-                        "//div[@contenteditable='true' and contains(@aria-label, 'To')]",
-                        "//input[@type='email']",
-                        "//textarea[@name='to']",
-                        "//input[@name='to']",
-                        "//div[contains(@data-tooltip, 'To')]",
-                        "//div[contains(@aria-label, 'To')]",
-                        "//div[contains(@aria-label, 'Recipients')]",
-                        "//div[contains(@aria-label, 'Add recipients')]",
-                        "//div[contains(@aria-label, 'Add people')]"
-                    ]
-                    
-                    for xpath in xpath_selectors:
-                        try:
-                            to_field = self.wait_for_element_safe(driver, By.XPATH, xpath, 5, "visible")
-                            if to_field and to_field.is_displayed() and to_field.is_enabled():
-                                logger.info(f"Found recipient field with XPath: {xpath}")
-                                break
-                        except:
-                            continue
-                
-                if not to_field:
-                    # Last resort: try to find any input field that might be the recipient field
-                    try:
-                        all_inputs = driver.find_elements(By.CSS_SELECTOR, "input, textarea, div[contenteditable='true']")
-                        for input_elem in all_inputs:
-                            if input_elem.is_displayed() and input_elem.is_enabled():
-                                # Check if it's likely a recipient field
-                                placeholder = input_elem.get_attribute("placeholder") or ""
-                                aria_label = input_elem.get_attribute("aria-label") or ""
-                                name = input_elem.get_attribute("name") or ""
-                                if ("to" in placeholder.lower() or "recipient" in placeholder.lower() or 
-                                    "to" in aria_label.lower() or "recipient" in aria_label.lower() or
-                                    "to" in name.lower() or "recipient" in name.lower()):
-                                    to_field = input_elem
-                                    logger.info("Found recipient field by placeholder/aria-label/name")
-                                    break
-                    except:
-                        pass
-                
-                if not to_field:
-                    # Try clicking on the compose area to focus it
-                    try:
-                        compose_area = driver.find_element(By.CSS_SELECTOR, "div[role='dialog']")
-                        compose_area.click()
-                        time.sleep(2)
-                        
-                        # Try to find recipient field again after clicking
-                        to_field = self.find_element_with_fallback(driver, to_selectors, timeout=10)
-                    except:
-                        pass
-                
-                if not to_field:
-                    raise Exception("Could not find recipient field")
-                
-                # Clear and fill the recipient field
-                to_field.clear()
-                time.sleep(1)
-                to_field.send_keys(recipient_email)
-                time.sleep(2)
-                self.capture_screenshot(driver, "recipient")
-                
-                # Step 5: Fill subject with improved selectors
-                logger.info("Entering subject...")
-                subject_selectors = [
-                    "input[name='subjectbox']",
-                    "input[name='subject']",
-                    "div[role='textbox'][aria-label*='Subject']",
-                    "div[contenteditable='true'][aria-label*='Subject']",
-                    "input[placeholder*='Subject']",
-                    "div[data-tooltip*='Subject']",
-                    "div[aria-label*='Subject']",
-                    "input[aria-label*='Subject']"
-                ]
-                
-                subject_field = self.find_element_with_fallback(driver, subject_selectors, timeout=10)
-                
-                if not subject_field:
-                    # Try XPath as fallback
-                    xpath_selectors = [
-                        "//input[@name='subjectbox']",
-                        "//input[@name='subject']",
-                        "//div[@role='textbox' and contains(@aria-label, 'Subject')]",
-                        "//div[@contenteditable='true' and contains(@aria-label, 'Subject')]",
-                        "//input[contains(@placeholder, 'Subject')]"
-                    ]
-                    
-                    for xpath in xpath_selectors:
-                        try:
-                            subject_field = self.wait_for_element_safe(driver, By.XPATH, xpath, 5, "visible")
-                            if subject_field and subject_field.is_displayed() and subject_field.is_enabled():
-                                logger.info(f"Found subject field with XPath: {xpath}")
-                                break
-                        except:
-                            continue
-                
-                if not subject_field:
-                    raise Exception("Could not find subject field")
-                
-                # Clear and fill subject
-                subject_field.clear()
-                time.sleep(1)
-                subject_field.send_keys(email_content['subject'])
-                time.sleep(2)
-                self.capture_screenshot(driver, "subject")
-                
-                # Step 6: Fill email body with improved selectors
-                logger.info("Entering email body...")
-                body_selectors = [
-                    "div[role='textbox'][aria-label*='Message Body']",
-                    "div[contenteditable='true'][aria-label*='Message Body']",
-                    "div[role='textbox'][aria-label*='Body']",
-                    "div[contenteditable='true'][aria-label*='Body']",
-                    "div[role='textbox']",
-                    "div[contenteditable='true']",
-                    "div[data-tooltip*='Message']",
-                    "div[data-tooltip*='Body']",
-                    "div[aria-label*='Message']",
-                    "div[aria-label*='Body']"
-                ]
-                
-                body_field = self.find_element_with_fallback(driver, body_selectors, timeout=10)
-                
-                if not body_field:
-                    # Try XPath as fallback
-                    xpath_selectors = [
-                        "//div[@role='textbox' and contains(@aria-label, 'Message Body')]",
-                        "//div[@contenteditable='true' and contains(@aria-label, 'Message Body')]",
-                        "//div[@role='textbox' and contains(@aria-label, 'Body')]",
-                        "//div[@contenteditable='true' and contains(@aria-label, 'Body')]",
-                        "//div[@role='textbox']",
-                        "//div[@contenteditable='true']"
-                    ]
-                    
-                    for xpath in xpath_selectors:
-                        try:
-                            body_field = self.wait_for_element_safe(driver, By.XPATH, xpath, 5, "visible")
-                            if body_field and body_field.is_displayed() and body_field.is_enabled():
-                                logger.info(f"Found body field with XPath: {xpath}")
-                                break
-                        except:
-                            continue
-                
-                if not body_field:
-                    # Last resort: find the largest contenteditable div
-                    try:
-                        contenteditable_divs = driver.find_elements(By.CSS_SELECTOR, "div[contenteditable='true']")
-                        if contenteditable_divs:
-                            # Find the largest one (likely the body field)
-                            largest_div = max(contenteditable_divs, key=lambda x: x.size['width'] * x.size['height'])
-                            if largest_div.is_displayed() and largest_div.is_enabled():
-                                body_field = largest_div
-                                logger.info("Found body field by size (largest contenteditable div)")
-                    except:
-                        pass
-                
-                if not body_field:
-                    raise Exception("Could not find body field")
-                
-                # Clear and fill body
-                body_field.clear()
-                time.sleep(1)
-                body_field.send_keys(email_content['body'])
-                time.sleep(2)
-                self.capture_screenshot(driver, "body")
-                
-                # Step 7: Send email with improved selectors
-                logger.info("Sending email...")
-                send_selectors = [
-                    "div[role='button'][data-tooltip-delay='800'][data-tooltip*='Send']",
-                    "div[role='button'][data-tooltip*='Send']",
-                    "div[jsname='M2UYVd']",
-                    "button[type='submit']",
-                    "div[aria-label*='Send']",
-                    "div[data-tooltip='Send']",
-                    "div[title*='Send']"
-                ]
-                
-                send_button = self.find_element_with_fallback(driver, send_selectors, timeout=10)
-                
-                if not send_button:
-                    raise Exception("Could not find send button")
-                
-                send_button.click()
-                time.sleep(5)
-                self.capture_screenshot(driver, "send")
-                
-                # Step 8: Verify success
-                logger.info("Verifying email sent...")
-                time.sleep(3)
-                self.capture_screenshot(driver, "success")
-                
+                if email_content is None:
+                    email_content = self.traced_generation(user_prompt, recipient_email)
+                import smtp_delivery
+                with trace_span("smtp.send", "delivery", attachments=len(attachments or [])):
+                    delivery = smtp_delivery.send_streamed(gmail_id, gmail_password, recipient_email,
+                                                           email_content["subject"], email_content["body"],
+                                                           attachments)
                 return {
                     "status": "success",
-                    "message": "Email sent successfully using AI-generated content!",
-                    "screenshots": self.screenshots,
-                    "session_id": self.session_id,
+                    "message": "Email delivered over SMTP using AI-generated content!",
+                    "screenshots": [],
+                    "trace": ctx.finish_trace(),
+                    "session_id": ctx.session_id,
                     "email_content": email_content,
-                    "ai_generated": True
+                    "delivery": {"backend": "smtp", **delivery},
+                    "ai_generated": email_content.get("ai_generated", True)
                 }
-                
             except Exception as e:
-                logger.error(f"Error during automation: {e}")
-                try:
-                    self.capture_screenshot(driver, "error")
-                except:
-                    pass
-                
-                # Don't quit the driver immediately, let user see the error
-                logger.info("Keeping browser open for 10 seconds to show error...")
-                time.sleep(10)
-                
+                logger.error("SMTP delivery failed: %s", e)
                 return {
                     "status": "error",
-                    "message": f"Automation failed: {str(e)}",
-                    "screenshots": self.screenshots,
-                    "session_id": self.session_id,
+                    "message": f"SMTP delivery failed: {str(e)}",
+                    "error_code": "delivery_failed",
+                    "screenshots": [],
+                    "trace": ctx.finish_trace(),
+                    "session_id": ctx.session_id,
                     "email_content": email_content,
-                    "ai_generated": True
+                    "ai_generated": bool(email_content and email_content.get("ai_generated"))
                 }
-                
-            finally:
-                try:
-                    logger.info("Closing browser...")
-                    driver.quit()
-                except Exception as e:
-                    logger.warning(f"Error closing browser: {e}")
-                
-        except Exception as e:
-            logger.error(f"Failed to initialize automation: {e}")
+    
+    def send_batch(self, gmail_id: str, gmail_password: str, messages: List[Dict],
+                   on_screenshot: Callable[[str, Dict], None] = None, capture_mode: str = None,
+                   pipelined: bool = None) -> List[Dict]:
+        """
+        Send several emails from one account in a single browser session: log in
+        once, then compose and send each message in turn.
+        messages: [{"session_id", "recipient_email", "user_prompt", "email_content" (optional),
+                    "attachments" (optional)}]
+        on_screenshot is called with (session_id, screenshot).
+        pipelined (default SEND_PIPELINE) opens the next compose window as soon as
+        Send is clicked and confirms deliveries in the background; results then
+        carry "delivery".
+        Returns one result per message, in order.
+        """
+        pipelined = SEND_PIPELINE if pipelined is None else pipelined
+        contexts = [
+            SessionContext(
+                message.get("session_id"),
+                (lambda screenshot, sid=message.get("session_id"): on_screenshot(sid, screenshot)) if on_screenshot else None
+            )
+            for message in messages
+        ]
+        if not contexts:
+            return []
+        
+        def error_result(ctx, message, email_content=None, error=None):
             return {
                 "status": "error",
-                "message": f"Failed to start automation: {str(e)}",
-                "screenshots": self.screenshots,
-                "session_id": self.session_id,
-                "ai_generated": False
+                "message": message,
+                "error_code": error.code if isinstance(error, AutomationAbort) else None,
+                "failed_step": ctx.current_step,
+                "attempts": ctx.attempts,
+                "screenshots": ctx.screenshots,
+                "trace": ctx.finish_trace(),
+                "session_id": ctx.session_id,
+                "email_content": email_content,
+                "ai_generated": bool(email_content and email_content.get("ai_generated"))
             }
+        
+        try:
+            driver = self.driver_pool.acquire()
+        except Exception as e:
+            logger.error("Failed to start browser for batch: %s", e)
+            return [error_result(ctx, f"Failed to start automation: {str(e)}") for ctx in contexts]
+        
+        results = []
+        # Sent messages waiting for delivery confirmation: (result, ctx, message, email_content)
+        in_flight = []
+        confirmer = None
+        # Login screenshots are recorded on the first session of the batch
+        login_ctx = contexts[0]
+        capture_mode = capture_mode or CAPTURE_MODE
+        if capture_mode == "screencast":
+            login_ctx.recorder = ScreencastRecorder(driver, login_ctx)
+            if not login_ctx.recorder.start():
+                logger.warning("Screencast unavailable, falling back to per-step screenshots")
+        watchdog = FailureWatchdog(driver, login_ctx)
+        watchdog.start()
+        try:
+            try:
+                logger.info("Starting batch of %s emails in one session", len(messages))
+                with activate(login_ctx.trace):
+                    with trace_span("navigate", "step"):
+                        self.run_step(login_ctx, "navigate", self.step_navigate, driver, login_ctx)
+                    with trace_span("login", "step"):
+                        self.run_step(login_ctx, "login", self.step_login, driver, login_ctx, gmail_id, gmail_password)
+            except Exception as e:
+                logger.error("Batch login failed: %s", e)
+                self.capture_screenshot(driver, "error", login_ctx)
+                return [error_result(ctx, f"Automation failed: {str(e)}", error=e) for ctx in contexts]
+            
+            # Logged in: watch each message's steps on its own context from here on
+            watchdog.stop()
+            if pipelined:
+                confirmer = DeliveryConfirmer(driver, login_ctx.plan.fields["sent_toast"])
+                try:
+                    confirmer.start()
+                except Exception as e:
+                    logger.warning("Delivery confirmation unavailable, sending the batch sequentially: %s", e)
+                    confirmer = None
+            for ctx, message in zip(contexts, messages):
+                email_content = None
+                if ctx is not login_ctx and login_ctx.recorder is not None:
+                    # One screencast for the batch, tagging frames with the message being sent
+                    ctx.recorder = login_ctx.recorder
+                    ctx.recorder.bind(ctx)
+                watchdog = FailureWatchdog(driver, ctx)
+                watchdog.start()
+                with log_context(ctx.session_id), activate(ctx.trace):
+                    try:
+                        email_content = message.get("email_content") or \
+                            self.traced_generation(message["user_prompt"], message["recipient_email"])
+                        # Already logged in: checkpointed steps from compose onwards
+                        steps = self.send_steps(driver, ctx, gmail_id, gmail_password,
+                                                message["recipient_email"], email_content,
+                                                message.get("attachments"))
+                        if confirmer is not None:
+                            steps[-1] = ("send", self.step_send_pipelined, (driver, ctx, confirmer))
+                            if ctx is not login_ctx:
+                                # The previous message was just sent from this tab, so the inbox is up
+                                steps[2] = ("compose", self.step_compose, (driver, ctx, True))
+                        self.run_checkpointed(ctx, steps[2:])
+                        result = {
+                            "status": "success",
+                            "message": "Email sent successfully using AI-generated content!",
+                            "screenshots": ctx.screenshots,
+                            "attempts": ctx.attempts,
+                            "session_id": ctx.session_id,
+                            "email_content": email_content,
+                            "ai_generated": True
+                        }
+                        if confirmer is not None:
+                            # The trace stays open until the delivery is confirmed
+                            in_flight.append((result, ctx, message, email_content))
+                        else:
+                            result["trace"] = ctx.finish_trace()
+                        results.append(result)
+                    except Exception as e:
+                        logger.error("Error sending batch email for session %s: %s", ctx.session_id, e)
+                        self.capture_screenshot(driver, "error", ctx)
+                        results.append(error_result(ctx, f"Automation failed: {str(e)}", email_content, error=e))
+                        # Return to the inbox so a half-filled compose window does not break the next email
+                        try:
+                            if confirmer is not None:
+                                # Leaving the page while Gmail is still sending would interrupt those sends
+                                confirmer.drain()
+                            driver.get("https://mail.google.com/mail/u/0/#inbox")
+                            ctx.pause(5)
+                        except Exception:
+                            pass
+                    finally:
+                        watchdog.stop()
+            if confirmer is not None:
+                self._confirm_deliveries(driver, confirmer, in_flight)
+            return results
+        finally:
+            watchdog.stop()
+            if confirmer is not None:
+                confirmer.stop()
+            if login_ctx.recorder is not None:
+                login_ctx.recorder.stop()
+            logger.info("Closing browser...")
+            self.driver_pool.release(driver)
+
+    def _confirm_deliveries(self, driver, confirmer: DeliveryConfirmer, in_flight: List[tuple]):
+        """Wait for the pipelined sends' toasts, check the Sent folder for the rest, and finish their results"""
+        unconfirmed = set(id(ctx) for ctx in confirmer.drain())
+        for result, ctx, message, email_content in in_flight:
+            if id(ctx) in unconfirmed:
+                email_content = resolve_draft(email_content) or {}
+                if not self.confirm_in_sent(driver, ctx, message["recipient_email"], email_content.get("subject", "")):
+                    logger.warning("Delivery of session %s could not be confirmed", ctx.session_id)
+                    result["message"] = "Email send was clicked, but delivery could not be confirmed"
+            result["delivery"] = ctx.delivery
+            result["trace"] = ctx.finish_trace()
+        logger.info("Pipelined batch: %s", confirmer.counts)
 
 def create_ai_demo_screenshots(session_id: str) -> List[Dict]:
     """Create demo screenshots for AI email automation simulation"""
@@ -786,8 +1347,8 @@ def create_ai_demo_screenshots(session_id: str) -> List[Dict]:
         
         # Create a simple demo image
         try:
+            from PIL import Image, ImageDraw, ImageFont
             img = Image.new('RGB', (800, 600), color='white')
-            from PIL import ImageDraw, ImageFont
             
             draw = ImageDraw.Draw(img)
             # Use default font
@@ -817,6 +1378,6 @@ def create_ai_demo_screenshots(session_id: str) -> List[Dict]:
             screenshots.append(screenshot_info)
             
         except Exception as e:
-            logger.error(f"Error creating demo screenshot for {step}: {e}")
+            logger.error("Error creating demo screenshot for %s: %s", step, e)
     
     return screenshots
@@ -0,0 +1,252 @@
+"""
+Attachments for AI Email Agent
+Uploads are parsed as they stream in and written to disk in chunks while
+they are hashed, so a request never holds a whole file in memory and an
+oversized file is rejected as soon as it crosses the limit. Files are stored
+once per content hash (blobs/<sha256>): attaching the same resume again
+reuses the stored copy. A send refers to attachments by id (the hash) and
+gets a path per file name, which the browser backend hands to Gmail's file
+input and the SMTP backend streams into the MIME message.
+
+python-multipart (installed with FastAPI's form support) is imported on
+first upload.
+"""
+
+import os
+import re
+import json
+import uuid
+import shutil
+import asyncio
+import hashlib
+import logging
+import threading
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+ATTACHMENT_DIR = os.getenv("ATTACHMENT_DIR", "attachments")
+# Per file, and per email (Gmail's limit is 25MB per message)
+ATTACHMENT_MAX_BYTES = int(os.getenv("ATTACHMENT_MAX_BYTES", str(25 * 1024 * 1024)))
+ATTACHMENT_MAX_TOTAL_BYTES = int(os.getenv("ATTACHMENT_MAX_TOTAL_BYTES", str(25 * 1024 * 1024)))
+CHUNK_SIZE = 1024 * 1024
+# Plain form fields (the JSON send request) are kept in memory
+MAX_FIELD_BYTES = 64 * 1024
+
+ATTACHMENT_ID_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+
+class AttachmentError(ValueError):
+    """Upload or attachment reference the API rejects (status_code is the HTTP status)"""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def safe_filename(filename: Optional[str]) -> str:
+    name = os.path.basename((filename or "").replace("\\", "/")).strip()
+    name = re.sub(r"[^\w.\- ()]", "_", name)
+    return name.lstrip(".")[:200] or "attachment"
+
+
+class Spool:
+    """One upload being written to a temporary file and hashed"""
+
+    def __init__(self, store: "AttachmentStore", filename: str, content_type: str):
+        self.store = store
+        self.filename = safe_filename(filename)
+        self.content_type = content_type or "application/octet-stream"
+        self.path = os.path.join(store.tmp_dir, uuid.uuid4().hex)
+        self.size = 0
+        self._hash = hashlib.sha256()
+        self._file = open(self.path, "wb")
+
+    def write(self, data: bytes):
+        self.size += len(data)
+        if self.size > self.store.max_bytes:
+            raise AttachmentError(f"{self.filename} is larger than {self.store.max_bytes} bytes", 413)
+        self._hash.update(data)
+        self._file.write(data)
+
+    def finish(self) -> Dict:
+        self._file.close()
+        return self.store._commit(self.path, self._hash.hexdigest(), self.size, self.filename, self.content_type)
+
+    def abort(self):
+        self._file.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class AttachmentStore:
+    def __init__(self, directory: str = None, max_bytes: int = None, max_total_bytes: int = None):
+        self.directory = os.path.abspath(directory or ATTACHMENT_DIR)
+        self.max_bytes = max_bytes or ATTACHMENT_MAX_BYTES
+        self.max_total_bytes = max_total_bytes or ATTACHMENT_MAX_TOTAL_BYTES
+        self.blob_dir = os.path.join(self.directory, "blobs")
+        self.tmp_dir = os.path.join(self.directory, "tmp")
+        self.files_dir = os.path.join(self.directory, "files")
+        for path in (self.blob_dir, self.tmp_dir, self.files_dir):
+            os.makedirs(path, exist_ok=True)
+        self._lock = threading.Lock()
+        self.counts = {"uploads": 0, "deduplicated": 0, "rejected": 0, "bytes_received": 0}
+
+    def spool(self, filename: str, content_type: str = None) -> Spool:
+        return Spool(self, filename, content_type)
+
+    def save(self, filename: str, stream, content_type: str = None) -> Dict:
+        """Store a file-like object, reading it in chunks"""
+        spool = self.spool(filename, content_type)
+        try:
+            for chunk in iter(lambda: stream.read(CHUNK_SIZE), b""):
+                spool.write(chunk)
+        except BaseException:
+            spool.abort()
+            self.counts["rejected"] += 1
+            raise
+        return spool.finish()
+
+    def _blob_path(self, attachment_id: str) -> str:
+        return os.path.join(self.blob_dir, attachment_id)
+
+    def _commit(self, tmp_path: str, attachment_id: str, size: int, filename: str, content_type: str) -> Dict:
+        blob = self._blob_path(attachment_id)
+        with self._lock:
+            deduplicated = os.path.exists(blob)
+            if deduplicated:
+                os.remove(tmp_path)
+            else:
+                os.replace(tmp_path, blob)
+            with open(blob + ".json", "w", encoding="utf-8") as f:
+                json.dump({"filename": filename, "content_type": content_type, "size": size}, f)
+            self.counts["uploads"] += 1
+            self.counts["deduplicated"] += deduplicated
+            self.counts["bytes_received"] += size
+        logger.info("Stored attachment %s (%d bytes%s)", filename, size, ", deduplicated" if deduplicated else "")
+        return {"attachment_id": attachment_id, "filename": filename, "content_type": content_type,
+                "size": size, "deduplicated": deduplicated}
+
+    def get(self, attachment_id: str) -> Optional[Dict]:
+        """Stored metadata (last upload's name and type) for an attachment id"""
+        if not ATTACHMENT_ID_PATTERN.match(attachment_id or ""):
+            return None
+        try:
+            with open(self._blob_path(attachment_id) + ".json", encoding="utf-8") as f:
+                return {"attachment_id": attachment_id, **json.load(f)}
+        except FileNotFoundError:
+            return None
+
+    def named_path(self, attachment_id: str, filename: str) -> str:
+        """A path to the blob under the name it is sent as (a hard link, so no copy)"""
+        path = os.path.join(self.files_dir, attachment_id, safe_filename(filename))
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            try:
+                os.link(self._blob_path(attachment_id), path)
+            except FileExistsError:
+                pass
+            except OSError:
+                shutil.copyfile(self._blob_path(attachment_id), path)
+        return path
+
+    def resolve(self, refs: List[Dict]) -> List[Dict]:
+        """
+        Turn [{"attachment_id", "filename" (optional)}] into attachments with
+        paths, checking that they exist and fit in one email
+        """
+        attachments = []
+        for ref in refs:
+            meta = self.get(ref["attachment_id"])
+            if meta is None:
+                raise AttachmentError(f"Unknown attachment {ref['attachment_id']}", 404)
+            filename = safe_filename(ref.get("filename") or meta["filename"])
+            attachments.append({**meta, "filename": filename,
+                                "path": self.named_path(meta["attachment_id"], filename)})
+        total = sum(attachment["size"] for attachment in attachments)
+        if total > self.max_total_bytes:
+            raise AttachmentError(f"Attachments total {total} bytes, over the {self.max_total_bytes} byte limit", 413)
+        return attachments
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return dict(self.counts)
+
+
+async def parse_multipart(content_type: str, chunks: AsyncIterator[bytes],
+                          store: AttachmentStore) -> Tuple[Dict[str, str], List[Dict]]:
+    """
+    Parse a multipart/form-data body as it arrives. File parts are spooled
+    into the store; other parts are returned as fields. The parser (and the
+    disk writes) run off the event loop one received chunk at a time.
+    """
+    from multipart.multipart import MultipartParser, parse_options_header
+
+    media_type, params = parse_options_header(content_type or "")
+    boundary = params.get(b"boundary")
+    if media_type != b"multipart/form-data" or not boundary:
+        raise AttachmentError("Expected a multipart/form-data body", 415)
+
+    fields: Dict[str, str] = {}
+    files: List[Dict] = []
+    spools: List[Spool] = []
+    part: Dict = {}
+    header = {"name": b"", "value": b""}
+
+    def on_part_begin():
+        part.clear()
+        part.update({"headers": {}, "data": bytearray(), "spool": None})
+
+    def on_header_field(data, start, end):
+        header["name"] += data[start:end]
+
+    def on_header_value(data, start, end):
+        header["value"] += data[start:end]
+
+    def on_header_end():
+        part["headers"][header["name"].decode("latin-1").lower()] = header["value"]
+        header["name"], header["value"] = b"", b""
+
+    def on_headers_finished():
+        _, disposition = parse_options_header(part["headers"].get("content-disposition", b""))
+        part["name"] = disposition.get(b"name", b"").decode("utf-8", "replace")
+        if b"filename" in disposition:
+            content_type = part["headers"].get("content-type", b"").decode("latin-1") or None
+            part["spool"] = store.spool(disposition[b"filename"].decode("utf-8", "replace"), content_type)
+            spools.append(part["spool"])
+
+    def on_part_data(data, start, end):
+        if part["spool"] is not None:
+            part["spool"].write(data[start:end])
+            return
+        part["data"] += data[start:end]
+        if len(part["data"]) > MAX_FIELD_BYTES:
+            raise AttachmentError(f"Form field {part['name']} is too large", 413)
+
+    def on_part_end():
+        if part["spool"] is not None:
+            files.append(part["spool"].finish())
+            spools.remove(part["spool"])
+        else:
+            fields[part["name"]] = part["data"].decode("utf-8", "replace")
+
+    parser = MultipartParser(boundary, {
+        "on_part_begin": on_part_begin,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+    })
+    try:
+        async for chunk in chunks:
+            if chunk:
+                await asyncio.to_thread(parser.write, chunk)
+        parser.finalize()
+    except BaseException:
+        for spool in spools:
+            spool.abort()
+        store.counts["rejected"] += 1
+        raise
+    return fields, files
@@ -0,0 +1,199 @@
+"""
+Pub/sub backplane for session events
+Lets the process that runs a send publish screenshot events that are
+delivered to WebSocket viewers connected to any worker or node.
+
+- InMemoryBackplane: single process (default)
+- RedisBackplane: any server speaking the Redis protocol (PUBLISH/PSUBSCRIBE),
+  selected with BACKPLANE_URL=redis://host:port/db
+"""
+
+import os
+import abc
+import json
+import base64
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Optional
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_PREFIX = "email_agent:session:"
+
+# Coroutine called with (session_id, data, thumbnail) for every delivered event
+EventHandler = Callable[[str, Dict, Optional[bytes]], Awaitable[None]]
+
+
+class BackplaneError(Exception):
+    pass
+
+
+class Backplane(abc.ABC):
+    """Base class - publish session events and deliver them to the local handler"""
+
+    def __init__(self):
+        self.handler: Optional[EventHandler] = None
+        self.published = 0
+        self.delivered = 0
+
+    def set_handler(self, handler: EventHandler):
+        self.handler = handler
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    @abc.abstractmethod
+    async def publish(self, session_id: str, data: Dict, thumbnail: bytes = None):
+        """Send an event to the handlers of every process subscribed to session_id"""
+
+    async def _deliver(self, session_id: str, data: Dict, thumbnail: bytes = None):
+        self.delivered += 1
+        if self.handler is not None:
+            await self.handler(session_id, data, thumbnail)
+
+    def stats(self) -> Dict:
+        return {"backend": type(self).__name__, "published": self.published, "delivered": self.delivered}
+
+
+class InMemoryBackplane(Backplane):
+    """Delivers events directly to the handler in this process"""
+
+    async def publish(self, session_id: str, data: Dict, thumbnail: bytes = None):
+        self.published += 1
+        await self._deliver(session_id, data, thumbnail)
+
+
+def encode_command(*args) -> bytes:
+    """Encode a command as a RESP array of bulk strings"""
+    parts = [f"*{len(args)}\r\n".encode()]
+    for arg in args:
+        if not isinstance(arg, bytes):
+            arg = str(arg).encode("utf-8")
+        parts.append(f"${len(arg)}\r\n".encode() + arg + b"\r\n")
+    return b"".join(parts)
+
+
+async def read_reply(reader: asyncio.StreamReader):
+    """Read one RESP reply"""
+    line = await reader.readline()
+    if not line:
+        raise ConnectionError("Connection closed by server")
+    prefix, rest = line[:1], line[1:-2]
+    if prefix == b"+":
+        return rest.decode()
+    if prefix == b"-":
+        raise BackplaneError(rest.decode())
+    if prefix == b":":
+        return int(rest)
+    if prefix == b"$":
+        length = int(rest)
+        if length == -1:
+            return None
+        return (await reader.readexactly(length + 2))[:-2]
+    if prefix == b"*":
+        length = int(rest)
+        if length == -1:
+            return None
+        return [await read_reply(reader) for _ in range(length)]
+    raise BackplaneError(f"Unexpected reply: {line!r}")
+
+
+class RedisBackplane(Backplane):
+    """Publishes over one connection and receives via PSUBSCRIBE on another"""
+
+    def __init__(self, url: str, reconnect_delay: float = 1.0):
+        super().__init__()
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.reconnect_delay = reconnect_delay
+        self._pub_reader: Optional[asyncio.StreamReader] = None
+        self._pub_writer: Optional[asyncio.StreamWriter] = None
+        self._pub_lock = asyncio.Lock()
+        self._subscriber_task: Optional[asyncio.Task] = None
+        self._subscribed = asyncio.Event()
+
+    async def _open(self):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        if self.password:
+            writer.write(encode_command("AUTH", self.password))
+            await read_reply(reader)
+        if self.db:
+            writer.write(encode_command("SELECT", self.db))
+            await read_reply(reader)
+        return reader, writer
+
+    async def start(self):
+        self._subscriber_task = asyncio.create_task(self._subscribe_loop())
+        await asyncio.wait_for(self._subscribed.wait(), timeout=10)
+        logger.info("Redis backplane connected to %s:%s", self.host, self.port)
+
+    async def stop(self):
+        if self._subscriber_task is not None:
+            self._subscriber_task.cancel()
+            try:
+                await self._subscriber_task
+            except asyncio.CancelledError:
+                pass
+        if self._pub_writer is not None:
+            self._pub_writer.close()
+            self._pub_writer = None
+
+    async def publish(self, session_id: str, data: Dict, thumbnail: bytes = None):
+        message = json.dumps({
+            "data": data,
+            "thumbnail": base64.b64encode(thumbnail).decode() if thumbnail else None,
+        })
+        async with self._pub_lock:
+            try:
+                if self._pub_writer is None:
+                    self._pub_reader, self._pub_writer = await self._open()
+                self._pub_writer.write(encode_command("PUBLISH", CHANNEL_PREFIX + session_id, message))
+                await read_reply(self._pub_reader)
+                self.published += 1
+            except (OSError, ConnectionError, asyncio.IncompleteReadError) as e:
+                logger.warning("Backplane publish failed: %s", e)
+                if self._pub_writer is not None:
+                    self._pub_writer.close()
+                self._pub_reader = self._pub_writer = None
+
+    async def _subscribe_loop(self):
+        """Receive published events, reconnecting if the server goes away"""
+        while True:
+            writer = None
+            try:
+                reader, writer = await self._open()
+                writer.write(encode_command("PSUBSCRIBE", CHANNEL_PREFIX + "*"))
+                await read_reply(reader)  # subscription confirmation
+                self._subscribed.set()
+                while True:
+                    reply = await read_reply(reader)
+                    if not isinstance(reply, list) or reply[0] != b"pmessage":
+                        continue
+                    channel, payload = reply[2].decode(), json.loads(reply[3])
+                    thumbnail = base64.b64decode(payload["thumbnail"]) if payload.get("thumbnail") else None
+                    await self._deliver(channel[len(CHANNEL_PREFIX):], payload["data"], thumbnail)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Backplane subscription lost: %s; reconnecting in %ss", e, self.reconnect_delay)
+                await asyncio.sleep(self.reconnect_delay)
+            finally:
+                if writer is not None:
+                    writer.close()
+
+
+def create_backplane(url: str = None) -> Backplane:
+    """Build the backplane configured by BACKPLANE_URL (in-memory when unset)"""
+    url = url if url is not None else os.getenv("BACKPLANE_URL", "")
+    if url.startswith("redis://"):
+        return RedisBackplane(url)
+    if url and url != "memory://":
+        raise ValueError(f"Unsupported BACKPLANE_URL: {url}")
+    return InMemoryBackplane()
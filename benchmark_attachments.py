@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Attachment memory benchmark for AI Email Agent
+Measures the peak RSS added by handling one attachment of each size, in a
+fresh interpreter per case, for the two paths a file takes:
+
+  upload  - a multipart body streamed through parse_multipart into the
+            attachment store, vs. reading the whole upload into memory first
+  smtp    - send_streamed to the local SMTP stand-in, vs. building the
+            message with email.message and smtplib.send_message
+
+Usage: python benchmark_attachments.py [--sizes 10 25 50] [--json]
+"""
+
+import os
+import sys
+import json
+import uuid
+import asyncio
+import argparse
+import resource
+import tempfile
+import subprocess
+
+READ_CHUNK = 64 * 1024  # Roughly what the ASGI server hands over per receive()
+
+
+def peak_rss_kb() -> int:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def write_multipart(path: str, payload: str, boundary: str):
+    """A multipart/form-data body with one file part holding the payload file"""
+    with open(path, "wb") as out, open(payload, "rb") as f:
+        out.write(f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"resume.pdf\"\r\n"
+                  f"Content-Type: application/pdf\r\n\r\n".encode())
+        for chunk in iter(lambda: f.read(READ_CHUNK), b""):
+            out.write(chunk)
+        out.write(f"\r\n--{boundary}--\r\n".encode())
+
+
+def run_case(path: str, mode: str, workdir: str, smtp_port: int) -> dict:
+    """Runs in the child interpreter"""
+    from attachments import AttachmentStore, parse_multipart
+    from smtp_delivery import send_streamed
+    store = AttachmentStore(os.path.join(workdir, f"store-{uuid.uuid4().hex}"), max_bytes=1 << 40,
+                            max_total_bytes=1 << 40)
+    boundary = "benchmark-boundary"
+
+    async def chunks():
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(READ_CHUNK), b""):
+                yield chunk
+
+    async def streamed_upload():
+        return await parse_multipart(f"multipart/form-data; boundary={boundary}", chunks(), store)
+
+    async def buffered_upload():
+        # What reading the upload into memory (await upload.read()) amounts to
+        body = b"".join([chunk async for chunk in chunks()])
+        start = body.index(b"\r\n\r\n") + 4
+        end = body.rindex(f"\r\n--{boundary}--".encode())
+        spool = store.spool("resume.pdf", "application/pdf")
+        spool.write(body[start:end])
+        return spool.finish()
+
+    def buffered_smtp(attachment):
+        import smtplib
+        from email.message import EmailMessage
+        message = EmailMessage()
+        message["From"], message["To"], message["Subject"] = "me@example.com", "you@example.com", "Resume"
+        message.set_content("Please find my resume attached.")
+        with open(attachment["path"], "rb") as f:
+            message.add_attachment(f.read(), maintype="application", subtype="pdf", filename="resume.pdf")
+        with smtplib.SMTP("127.0.0.1", smtp_port) as smtp:
+            smtp.send_message(message)
+
+    if mode.startswith("smtp"):
+        # The payload is stored before measuring; only the delivery is measured
+        with open(path, "rb") as f:
+            stored = store.save("resume.pdf", f, "application/pdf")
+        attachment = store.resolve([{"attachment_id": stored["attachment_id"]}])[0]
+    before = peak_rss_kb()
+    if mode == "upload-streamed":
+        asyncio.run(streamed_upload())
+    elif mode == "upload-buffered":
+        asyncio.run(buffered_upload())
+    elif mode == "smtp-streamed":
+        send_streamed("me@example.com", "", "you@example.com", "Resume", "Please find my resume attached.",
+                      [attachment], host="127.0.0.1", port=smtp_port, starttls=False)
+    elif mode == "smtp-buffered":
+        buffered_smtp(attachment)
+    return {"baseline_mb": round(before / 1024, 1), "added_peak_mb": round((peak_rss_kb() - before) / 1024, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure peak memory of attachment uploads and SMTP delivery")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 25, 50], help="Attachment sizes in MB")
+    parser.add_argument("--json", action="store_true", help="Print machine-readable results")
+    parser.add_argument("--child", nargs=4, metavar=("PATH", "MODE", "WORKDIR", "SMTP_PORT"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        path, mode, workdir, port = args.child
+        print(json.dumps(run_case(path, mode, workdir, int(port))))
+        return True
+
+    from smtp_standin import SMTPStandIn
+    smtp = SMTPStandIn()
+    smtp.start()
+    workdir = tempfile.mkdtemp(prefix="bench-attachments-")
+    rows = []
+    try:
+        for size in args.sizes:
+            payload = os.path.join(workdir, f"payload-{size}")
+            with open(payload, "wb") as f:
+                for _ in range(size):
+                    f.write(os.urandom(1024 * 1024))
+            body = payload + ".multipart"
+            write_multipart(body, payload, "benchmark-boundary")
+            for mode, path in (("upload-streamed", body), ("upload-buffered", body),
+                               ("smtp-streamed", payload), ("smtp-buffered", payload)):
+                result = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), "--child", path, mode, workdir, str(smtp.port)],
+                    capture_output=True, text=True, check=True
+                )
+                rows.append({"size_mb": size, "mode": mode, **json.loads(result.stdout.strip().splitlines()[-1])})
+    finally:
+        smtp.stop()
+        subprocess.run(["rm", "-rf", workdir])
+
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return True
+
+    print("📎 Attachment peak memory (added to the interpreter's peak RSS)")
+    print("=" * 50)
+    print(f"{'size':>6} {'mode':>16} {'added peak':>11}")
+    for row in rows:
+        print(f"{row['size_mb']:>4}MB {row['mode']:>16} {row['added_peak_mb']:>9.1f}MB")
+    return True
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Import-time benchmark for AI Email Agent
+Measures cold `import main` / `import ai_email_agent` in fresh interpreters
+using `python -X importtime`, and checks that heavy dependencies (selenium,
+cohere, PIL, smtplib) are not imported until first use and that the median
+import stays within its time budget. python-dotenv is loaded on purpose
+(settings.py) when there is a .env, so its settings apply at import.
+
+`import main` is dominated by FastAPI and has no default budget; set one
+with --budget main=<ms>.
+
+Usage: python benchmark_import.py [--runs 5] [--module main] [--budget ai_email_agent=50] [--json]
+"""
+
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+HEAVY_MODULES = ["selenium", "cohere", "PIL", "smtplib"]
+
+# Median cold import budget per module, in ms (about 1.5x the measured time)
+IMPORT_BUDGET_MS = {"ai_email_agent": 50}
+
+
+def warm_bytecode(module: str):
+    """Import once with bytecode writing on, so the timed runs do not include compiling edited files"""
+    env = {key: value for key, value in os.environ.items() if key != "PYTHONDONTWRITEBYTECODE"}
+    subprocess.run([sys.executable, "-c", f"import {module}"], env=env, capture_output=True, check=True)
+
+
+def measure_import(module: str) -> dict:
+    """Import a module in a fresh interpreter and collect -X importtime data"""
+    check = (
+        f"import sys, json; import {module}; "
+        f"print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", check],
+        capture_output=True, text=True, check=True
+    )
+    cumulative = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        try:
+            cumulative[parts[2].strip()] = int(parts[1].strip())
+        except ValueError:
+            continue  # header line
+    return {
+        "total_ms": cumulative.get(module, 0) / 1000,
+        "top": sorted(cumulative.items(), key=lambda item: item[1], reverse=True)[:10],
+        "heavy_loaded": json.loads(result.stdout.strip().splitlines()[-1]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cold import time")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--module", action="append", help="Module to import (default: main and ai_email_agent)")
+    parser.add_argument("--budget", action="append", default=[], metavar="MODULE=MS",
+                        help="Median import budget for a module (overrides the default)")
+    parser.add_argument("--json", action="store_true", help="Print machine-readable results")
+    args = parser.parse_args()
+    budgets = dict(IMPORT_BUDGET_MS)
+    for entry in args.budget:
+        module, _, ms = entry.partition("=")
+        budgets[module] = float(ms)
+
+    report = {}
+    for module in args.module or ["main", "ai_email_agent"]:
+        warm_bytecode(module)
+        runs = [measure_import(module) for _ in range(args.runs)]
+        totals = [run["total_ms"] for run in runs]
+        report[module] = {
+            "runs": args.runs,
+            "median_ms": round(statistics.median(totals), 1),
+            "min_ms": round(min(totals), 1),
+            "max_ms": round(max(totals), 1),
+            "budget_ms": budgets.get(module),
+            "heavy_loaded": runs[-1]["heavy_loaded"],
+            "top_imports_ms": [(name, round(us / 1000, 1)) for name, us in runs[-1]["top"]],
+        }
+
+    ok = all(not result["heavy_loaded"] and (result["budget_ms"] is None or result["median_ms"] <= result["budget_ms"])
+             for result in report.values())
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return ok
+
+    print("⏱️  Import-time benchmark")
+    print("=" * 50)
+    for module, result in report.items():
+        print(f"\n📦 import {module}: median {result['median_ms']} ms "
+              f"(min {result['min_ms']}, max {result['max_ms']}, {result['runs']} runs)")
+        for name, ms in result["top_imports_ms"][:5]:
+            print(f"   {ms:8.1f} ms  {name}")
+        if result["heavy_loaded"]:
+            print(f"❌ Heavy modules imported eagerly: {', '.join(result['heavy_loaded'])}")
+        else:
+            print("✅ No heavy modules imported at import time")
+        if result["budget_ms"] is not None:
+            within = result["median_ms"] <= result["budget_ms"]
+            print(f"{'✅' if within else '❌'} Median {result['median_ms']} ms "
+                  f"{'within' if within else 'over'} the {result['budget_ms']:g} ms budget")
+    return ok
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Pipelined sending benchmark for AI Email Agent
+Sends batches for one account through the stub browser (one logged-in tab,
+no Chrome or Gmail needed) in two modes and reports per-account throughput:
+
+  sequential - send_batch as before: Send click, then the fixed pauses
+  pipelined  - send_batch(pipelined=True): the next compose window is opened
+               right after the Send click and deliveries are confirmed from
+               the stub's "Message sent" toasts in the background
+
+STEP_PAUSE_SCALE shrinks Gmail's fixed pauses so a run takes seconds;
+STUB_SEND_SECONDS is how long the stub takes to "send" each message.
+The batch time includes waiting for the last delivery to be confirmed.
+
+Usage: python benchmark_pipelining.py [--messages 10] [--rounds 3] [--pause-scale 0.05] [--json]
+"""
+
+import os
+import sys
+import json
+import argparse
+import statistics
+import time
+
+
+def run_batch(agent, mode: str, round_index: int, messages: int) -> dict:
+    content = {"subject": "Quarterly update", "body": "Hello,\n\nHere is the update.\n\nBest,",
+               "email_type": "general", "tone": "professional", "ai_generated": False}
+    batch = [{"session_id": f"bench-pipeline-{mode}-{round_index}-{i}",
+              "recipient_email": f"user{i}@example.com", "user_prompt": "Send the quarterly update",
+              "email_content": content} for i in range(messages)]
+    started = time.perf_counter()
+    results = agent.send_batch("me@gmail.com", "pw", batch, pipelined=mode == "pipelined")
+    elapsed = time.perf_counter() - started
+    failed = [result for result in results if result["status"] != "success"]
+    if failed:
+        raise RuntimeError(f"Stub batch failed: {failed[0].get('message')}")
+    confirmations = [result["delivery"]["seconds"] for result in results
+                     if result.get("delivery") and result["delivery"]["confirmed"]]
+    return {"seconds": elapsed, "confirmed": len(confirmations), "confirm_seconds": confirmations}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare sequential and pipelined batch sending")
+    parser.add_argument("--messages", type=int, default=10, help="Messages per batch")
+    parser.add_argument("--rounds", type=int, default=3, help="Batches per mode")
+    parser.add_argument("--pause-scale", type=float, default=0.05, help="STEP_PAUSE_SCALE")
+    parser.add_argument("--send-seconds", type=float, default=0.4, help="STUB_SEND_SECONDS")
+    parser.add_argument("--latency-ms", type=float, default=2.0, help="STUB_DRIVER_LATENCY per command")
+    parser.add_argument("--json", action="store_true", help="Print machine-readable results")
+    args = parser.parse_args()
+
+    os.environ.update({
+        "BROWSER_DRIVER": "stub",
+        "COHERE_API_KEY": "",
+        "LOG_LEVEL": "CRITICAL",
+        "TRACE_EXPORT": "0",
+        "STUB_SEND_SECONDS": str(args.send_seconds),
+        "STUB_DRIVER_LATENCY": str(args.latency_ms / 1000),
+        "PIPELINE_CONFIRM_INTERVAL": "0.05",
+    })
+
+    import ai_email_agent
+    ai_email_agent.STEP_PAUSE_SCALE = args.pause_scale
+    agent = ai_email_agent.AIEmailAgent()
+
+    modes = ["sequential", "pipelined"]
+    runs = {mode: [] for mode in modes}
+    try:
+        # Interleave the modes batch by batch (rotating the order), so drift affects them equally
+        for round_index in range(args.rounds):
+            for mode in modes[round_index % 2:] + modes[:round_index % 2]:
+                runs[mode].append(run_batch(agent, mode, round_index, args.messages))
+    finally:
+        for name in os.listdir("screenshots") if os.path.isdir("screenshots") else []:
+            if name.startswith("bench-pipeline-"):
+                os.remove(os.path.join("screenshots", name))
+
+    report = {"settings": {"messages": args.messages, "rounds": args.rounds, "pause_scale": args.pause_scale,
+                           "send_seconds": args.send_seconds, "latency_ms": args.latency_ms},
+              "modes": {}}
+    for mode, batches in runs.items():
+        seconds = statistics.median(batch["seconds"] for batch in batches)
+        confirm = [value for batch in batches for value in batch["confirm_seconds"]]
+        report["modes"][mode] = {
+            "mode": mode,
+            "median_batch_seconds": round(seconds, 3),
+            "messages_per_minute": round(args.messages / seconds * 60, 1),
+            "confirmed": f"{sum(batch['confirmed'] for batch in batches)}/{args.messages * len(batches)}",
+            "median_confirm_seconds": round(statistics.median(confirm), 3) if confirm else None,
+        }
+    base = report["modes"]["sequential"]["median_batch_seconds"]
+    for entry in report["modes"].values():
+        entry["speedup"] = round(base / entry["median_batch_seconds"], 2)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return True
+
+    print(f"📬 Batch of {args.messages} messages, one stub browser "
+          f"(pause scale {args.pause_scale}, {args.send_seconds}s per send)")
+    print("=" * 70)
+    print(f"{'mode':>11} {'batch':>9} {'msgs/min':>9} {'speedup':>8} {'confirmed':>10} {'confirm':>8}")
+    for entry in report["modes"].values():
+        confirm = f"{entry['median_confirm_seconds']:.2f}s" if entry["median_confirm_seconds"] is not None else "-"
+        print(f"{entry['mode']:>11} {entry['median_batch_seconds']:>8.2f}s {entry['messages_per_minute']:>9.1f} "
+              f"{entry['speedup']:>7.2f}x {entry['confirmed']:>10} {confirm:>8}")
+    return True
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Profiling overhead benchmark for AI Email Agent
+Runs stub-browser sends through main.run_agent (STEP_PAUSE_SCALE=0, no AI, so
+the time is the agent's own code) in three modes and reports the median send
+time of each:
+
+  baseline  - agent.send_email called directly
+  disabled  - run_agent with profile=False (the path every normal request takes)
+  profiled  - run_agent with profile=True (sampling profiler + tracemalloc)
+
+disabled vs baseline is the cost of the profiling hook when it is off;
+profiled vs baseline is what an admin pays for one profiled request.
+
+Usage: python benchmark_profiling.py [--sends 40] [--interval-ms 5] [--json]
+"""
+
+import os
+import sys
+import json
+import shutil
+import argparse
+import statistics
+import tempfile
+import time
+
+
+def send_once(mode: str, i: int, agent, run_agent) -> float:
+    kwargs = dict(gmail_password="pw", recipient_email="you@example.com",
+                  user_prompt="Say hello", session_id=f"bench-profile-{mode}-{i}")
+    started = time.perf_counter()
+    if mode == "baseline":
+        result = agent.send_email(gmail_id="me@gmail.com", **kwargs)
+    else:
+        result = run_agent("send_email", gmail_id="me@gmail.com", profile=mode == "profiled", **kwargs)
+    elapsed = time.perf_counter() - started
+    if result["status"] != "success":
+        raise RuntimeError(f"Stub send failed: {result.get('message')}")
+    return elapsed
+
+
+def run_modes(modes, sends: int, agent, run_agent) -> dict:
+    """Interleave the modes send by send (rotating the order), so drift affects them equally"""
+    timings = {mode: [] for mode in modes}
+    for i in range(sends):
+        for mode in modes[i % len(modes):] + modes[:i % len(modes)]:
+            timings[mode].append(send_once(mode, i, agent, run_agent))
+    return {
+        mode: {
+            "mode": mode,
+            "sends": sends,
+            "median_ms": round(statistics.median(values) * 1000, 2),
+            "mean_ms": round(statistics.mean(values) * 1000, 2),
+        }
+        for mode, values in timings.items()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the overhead of per-request profiling")
+    parser.add_argument("--sends", type=int, default=40, help="Sends per mode")
+    parser.add_argument("--interval-ms", type=float, default=5.0, help="PROFILE_INTERVAL_MS")
+    parser.add_argument("--json", action="store_true", help="Print machine-readable results")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench-profiling-")
+    os.environ.update({
+        "BROWSER_DRIVER": "stub",
+        "COHERE_API_KEY": "",
+        "LOG_LEVEL": "CRITICAL",
+        "WORKER_PROCESSES": "0",
+        "TRACE_EXPORT": "0",
+        "PROFILE_DIR": os.path.join(workdir, "profiles"),
+        "PROFILE_INTERVAL_MS": str(args.interval_ms),
+    })
+
+    import ai_email_agent
+    import main as server
+    ai_email_agent.STEP_PAUSE_SCALE = 0
+    agent = server.get_agent()
+
+    try:
+        # Warm-up sends so the driver and imports are in place for every mode
+        modes = ["baseline", "disabled", "profiled"]
+        run_modes(modes, 2, agent, server.run_agent)
+        report = {"settings": {"sends": args.sends, "interval_ms": args.interval_ms},
+                  "modes": run_modes(modes, args.sends, agent, server.run_agent)}
+        base = report["modes"]["baseline"]["median_ms"]
+        for entry in report["modes"].values():
+            entry["overhead_pct"] = round((entry["median_ms"] - base) / base * 100, 1) if base else 0.0
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+        for name in os.listdir("screenshots") if os.path.isdir("screenshots") else []:
+            if name.startswith("bench-profile-"):
+                os.remove(os.path.join("screenshots", name))
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return True
+
+    print("⏱️  Profiling overhead (stub browser sends)")
+    print("=" * 50)
+    print(f"{'mode':>10} {'median':>10} {'mean':>10} {'overhead':>9}")
+    for entry in report["modes"].values():
+        print(f"{entry['mode']:>10} {entry['median_ms']:>8.2f}ms {entry['mean_ms']:>8.2f}ms "
+              f"{entry['overhead_pct']:>8.1f}%")
+    return True
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
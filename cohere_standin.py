@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Local Cohere stand-in for AI Email Agent
+A small HTTP server speaking the part of the Cohere generate API the agent
+uses (POST /v1/generate), so the LLM layer can be exercised and benchmarked
+without an API key or quota. Latency follows a configurable distribution,
+errors and 429s can be injected at a given rate, and completions are canned
+JSON, JSON wrapped in prose, or plain text. With a per-token cost, latency
+grows with the output (cut at max_tokens) and light models are faster.
+
+Point the agent at it with COHERE_API_URL=http://127.0.0.1:<port>.
+
+Usage: python cohere_standin.py --port 8400 --latency lognormal:0.4:0.5 --rate-limit-rate 0.05
+"""
+
+import json
+import time
+import uuid
+import random
+import logging
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+COMPLETION_MODES = ("json", "wrapped", "text")
+
+# Relative time per output token; unknown models run at full cost
+MODEL_SPEED = {"command-light": 0.4}
+
+
+def parse_latency(spec: str, rng: random.Random = None) -> Callable[[], float]:
+    """
+    Build a latency sampler (seconds) from a spec:
+    fixed:S, uniform:LOW:HIGH, normal:MEAN:SD or lognormal:MEDIAN:SIGMA
+    """
+    rng = rng or random.Random()
+    kind, *params = spec.split(":")
+    values = [float(p) for p in params]
+    if kind == "fixed" and len(values) == 1:
+        return lambda: values[0]
+    if kind == "uniform" and len(values) == 2:
+        return lambda: rng.uniform(values[0], values[1])
+    if kind == "normal" and len(values) == 2:
+        return lambda: max(0.0, rng.gauss(values[0], values[1]))
+    if kind == "lognormal" and len(values) == 2:
+        import math
+        mu = math.log(values[0]) if values[0] > 0 else 0.0
+        return lambda: rng.lognormvariate(mu, values[1]) if values[0] > 0 else 0.0
+    raise ValueError(f"Invalid latency spec '{spec}'")
+
+
+def interpretation_json(prompt: str) -> Dict:
+    """Canned prompt interpretation, shaped like the agent asks for"""
+    request = prompt.rsplit("Analyze this prompt:", 1)[-1].strip()
+    return {
+        "email_type": "general",
+        "subject": f"About: {request[:40]}",
+        "body": f"Hello,\n\n{request}\n\nBest regards,\n[Your Name]",
+        "tone": "professional",
+        "key_points": [request],
+    }
+
+
+EMAIL_PARAGRAPH = (
+    "I am writing to follow up on the matter we discussed and to share a few details that "
+    "should help us move forward. I have summarized the key points below so they are easy to review."
+)
+
+
+def email_text(prompt: str) -> str:
+    """Canned email whose length follows the request: one paragraph for a thank-you, four for an application"""
+    lowered = prompt.lower()
+    paragraphs = 4 if ("application" in lowered or "cover letter" in lowered) else 1 if "thank" in lowered else 2
+    body = "\n\n".join([EMAIL_PARAGRAPH] * paragraphs)
+    return f"Dear recipient,\n\n{body}\n\nBest regards,\n[Your Name]"
+
+
+def truncate_tokens(text: str, max_tokens: int) -> (str, bool):
+    """Cut text at roughly max_tokens (4 tokens per 3 words)"""
+    words = text.split(" ")
+    limit = max(1, int(max_tokens * 3 / 4))
+    if len(words) <= limit:
+        return text, False
+    return " ".join(words[:limit]), True
+
+
+class CohereStandIn:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: str = "fixed:0",
+                 error_rate: float = 0.0, rate_limit_rate: float = 0.0,
+                 completion: str = "json", seed: int = None, per_token_ms: float = 0.0):
+        if completion not in COMPLETION_MODES:
+            raise ValueError(f"completion must be one of {', '.join(COMPLETION_MODES)}")
+        self.host = host
+        self.port = port
+        self.rng = random.Random(seed)
+        self.latency = latency
+        self._sample_latency = parse_latency(latency, self.rng)
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.completion = completion
+        self.per_token_ms = per_token_ms
+        self.counts: Dict[str, int] = {"requests": 0, "ok": 0, "errors": 0, "rate_limited": 0}
+        self._lock = threading.Lock()
+        self.server = None
+        self._thread = None
+
+    def configure(self, latency: str = None, error_rate: float = None, rate_limit_rate: float = None,
+                  completion: str = None, per_token_ms: float = None):
+        """Change behaviour while running (e.g. after a client has connected)"""
+        if latency is not None:
+            self._sample_latency = parse_latency(latency, self.rng)
+            self.latency = latency
+        if error_rate is not None:
+            self.error_rate = error_rate
+        if rate_limit_rate is not None:
+            self.rate_limit_rate = rate_limit_rate
+        if completion is not None:
+            self.completion = completion
+        if per_token_ms is not None:
+            self.per_token_ms = per_token_ms
+
+    def start(self):
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                standin._handle(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        self._thread = threading.Thread(target=self.server.serve_forever, name="cohere-standin", daemon=True)
+        self._thread.start()
+        logger.info("Cohere stand-in listening on %s", self.url)
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def _count(self, name: str):
+        with self._lock:
+            self.counts[name] += 1
+
+    def _handle(self, request: BaseHTTPRequestHandler):
+        self._count("requests")
+        if request.path.rstrip("/") != "/v1/generate":
+            self._reply(request, 404, {"message": f"unknown endpoint {request.path}"})
+            return
+        length = int(request.headers.get("Content-Length") or 0)
+        try:
+            body = json.loads(request.rfile.read(length) or b"{}")
+        except ValueError:
+            self._reply(request, 400, {"message": "invalid request body"})
+            return
+
+        prompt = body.get("prompt") or ""
+        text, truncated = truncate_tokens(self._completion_for(prompt), int(body.get("max_tokens") or 20))
+        output_tokens = max(1, round(len(text.split()) * 4 / 3))
+        with self._lock:
+            delay = self._sample_latency()
+            roll = self.rng.random()
+        delay += self.per_token_ms / 1000 * output_tokens * MODEL_SPEED.get(body.get("model"), 1.0)
+        time.sleep(delay)
+
+        if roll < self.rate_limit_rate:
+            self._count("rate_limited")
+            self._reply(request, 429, {"message": "You are using a Trial key, which is limited. (rate limit)"},
+                        {"Retry-After": "1"})
+            return
+        if roll < self.rate_limit_rate + self.error_rate:
+            self._count("errors")
+            self._reply(request, 500, {"message": "internal server error"})
+            return
+
+        self._count("ok")
+        self._reply(request, 200, {
+            "id": str(uuid.uuid4()),
+            "prompt": prompt,
+            "generations": [{
+                "id": str(uuid.uuid4()),
+                "text": text,
+                "finish_reason": "MAX_TOKENS" if truncated else "COMPLETE",
+            }],
+            "meta": {"api_version": {"version": "1"}, "billed_units": {"output_tokens": output_tokens}},
+        })
+
+    def _completion_for(self, prompt: str) -> str:
+        if "Analyze this prompt:" not in prompt:
+            return email_text(prompt)
+        if self.completion == "json":
+            return json.dumps(interpretation_json(prompt))
+        if self.completion == "wrapped":
+            return f"Here is the analysis you asked for:\n{json.dumps(interpretation_json(prompt), indent=2)}\nLet me know if it helps."
+        return "This looks like a general email. Keep it short and professional."
+
+    @staticmethod
+    def _reply(request: BaseHTTPRequestHandler, status: int, payload: Dict, headers: Dict = None):
+        data = json.dumps(payload).encode("utf-8")
+        request.send_response(status)
+        request.send_header("Content-Type", "application/json")
+        request.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            request.send_header(name, value)
+        request.end_headers()
+        request.wfile.write(data)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {**self.counts, "latency": self.latency, "per_token_ms": self.per_token_ms,
+                    "error_rate": self.error_rate, "rate_limit_rate": self.rate_limit_rate,
+                    "completion": self.completion}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local Cohere generate API stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8400)
+    parser.add_argument("--latency", default="lognormal:0.4:0.5",
+                        help="fixed:S, uniform:LOW:HIGH, normal:MEAN:SD or lognormal:MEDIAN:SIGMA")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--completion", choices=COMPLETION_MODES, default="json")
+    parser.add_argument("--per-token-ms", type=float, default=0.0, help="Extra latency per output token")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    standin = CohereStandIn(args.host, args.port, args.latency, args.error_rate,
+                            args.rate_limit_rate, args.completion, args.seed, args.per_token_ms)
+    standin.start()
+    print(f"🤖 Cohere stand-in listening on {standin.url}")
+    print(f"   export COHERE_API_URL={standin.url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        standin.stop()
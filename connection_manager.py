@@ -0,0 +1,184 @@
+"""
+WebSocket fan-out for screenshot streaming
+Each connected client gets its own bounded send queue and writer task, so a
+slow viewer only delays itself. When a queue is full the oldest pending
+message is dropped - viewers care about the latest progress, not backlog.
+"""
+
+import io
+import os
+import json
+import time
+import struct
+import asyncio
+import logging
+from typing import Dict, List, Optional
+
+from fastapi import WebSocket
+
+from backplane import Backplane, InMemoryBackplane, create_backplane
+
+logger = logging.getLogger(__name__)
+
+SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "32"))
+HEARTBEAT_INTERVAL = float(os.getenv("WS_HEARTBEAT_INTERVAL", "15"))
+HEARTBEAT_TIMEOUT = float(os.getenv("WS_HEARTBEAT_TIMEOUT", "45"))
+THUMBNAIL_SIZE = (320, 180)
+
+
+def encode_binary_frame(header: Dict, payload: bytes) -> bytes:
+    """
+    Pack a binary frame: 4-byte big-endian header length, UTF-8 JSON header,
+    then the raw payload (thumbnail JPEG bytes)
+    """
+    header_bytes = json.dumps(header).encode("utf-8")
+    return struct.pack(">I", len(header_bytes)) + header_bytes + payload
+
+
+def make_thumbnail(filepath: str, size=THUMBNAIL_SIZE) -> Optional[bytes]:
+    """Render a small JPEG thumbnail of a screenshot file"""
+    try:
+        from PIL import Image
+        with Image.open(filepath) as img:
+            img = img.convert("RGB")
+            img.thumbnail(size)
+            buffer = io.BytesIO()
+            img.save(buffer, format="JPEG", quality=70)
+            return buffer.getvalue()
+    except Exception as e:
+        logger.warning("Could not create thumbnail for %s: %s", filepath, e)
+        return None
+
+
+class ClientConnection:
+    """One WebSocket viewer with its own bounded queue and writer task"""
+
+    def __init__(self, websocket: WebSocket, binary: bool = False, max_queue: int = SEND_QUEUE_SIZE):
+        self.websocket = websocket
+        self.binary = binary
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.dropped = 0
+        self.sent = 0
+        self.closed = False
+        self.last_seen = time.monotonic()
+        self.writer_task: Optional[asyncio.Task] = None
+
+    def enqueue(self, kind: str, payload):
+        """Queue a message without waiting; drops the oldest one when full"""
+        if self.closed:
+            return
+        if self.queue.full():
+            try:
+                self.queue.get_nowait()
+                self.dropped += 1
+            except asyncio.QueueEmpty:
+                pass
+        self.queue.put_nowait((kind, payload))
+
+    def touch(self):
+        """Record that the client is alive (any inbound message counts)"""
+        self.last_seen = time.monotonic()
+
+    def idle_for(self) -> float:
+        return time.monotonic() - self.last_seen
+
+    async def writer(self):
+        """Drain the queue onto the socket until the connection fails"""
+        try:
+            while True:
+                kind, payload = await self.queue.get()
+                if kind == "bytes":
+                    await self.websocket.send_bytes(payload)
+                else:
+                    await self.websocket.send_json(payload)
+                self.sent += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.info("WebSocket writer stopped: %s", e)
+        finally:
+            self.closed = True
+
+
+class ConnectionManager:
+    def __init__(self, backplane: Backplane = None):
+        self.active_connections: Dict[str, List[ClientConnection]] = {}
+        # Events are published through the backplane and delivered to the
+        # viewers connected to this process, wherever the send is running
+        self.backplane = backplane or create_backplane()
+        self.backplane.set_handler(self.deliver)
+
+    async def start(self):
+        await self.backplane.start()
+
+    async def stop(self):
+        await self.backplane.stop()
+
+    async def connect(self, session_id: str, websocket: WebSocket, binary: bool = False) -> ClientConnection:
+        await websocket.accept()
+        client = ClientConnection(websocket, binary=binary)
+        client.writer_task = asyncio.create_task(client.writer())
+        self.active_connections.setdefault(session_id, []).append(client)
+        return client
+
+    def disconnect(self, session_id: str, client: ClientConnection):
+        client.closed = True
+        if client.writer_task is not None:
+            client.writer_task.cancel()
+        if session_id in self.active_connections:
+            if client in self.active_connections[session_id]:
+                self.active_connections[session_id].remove(client)
+            if not self.active_connections[session_id]:
+                del self.active_connections[session_id]
+
+    def wants_binary(self, session_id: str) -> bool:
+        """Whether any viewer of the session asked for binary thumbnail frames"""
+        if not isinstance(self.backplane, InMemoryBackplane):
+            # Viewers on other workers are not visible from here
+            return True
+        return any(client.binary for client in self.active_connections.get(session_id, []))
+
+    async def broadcast(self, session_id: str, data: dict, thumbnail: bytes = None):
+        """Publish a session event to viewers on every worker"""
+        await self.backplane.publish(session_id, data, thumbnail)
+
+    async def deliver(self, session_id: str, data: dict, thumbnail: bytes = None):
+        """Queue a message for every local viewer of a session; never waits on a socket"""
+        for client in list(self.active_connections.get(session_id, [])):
+            if client.binary and thumbnail is not None:
+                client.enqueue("bytes", encode_binary_frame(data, thumbnail))
+            else:
+                client.enqueue("json", data)
+        # Let the writers run between messages of a burst, so only slow viewers fall behind
+        await asyncio.sleep(0)
+
+    async def serve(self, session_id: str, client: ClientConnection):
+        """
+        Read from the socket until it goes away. Sends a ping after each quiet
+        heartbeat interval and gives up on clients that stay silent too long.
+        """
+        try:
+            while not client.closed:
+                try:
+                    await asyncio.wait_for(client.websocket.receive_text(), timeout=HEARTBEAT_INTERVAL)
+                    client.touch()
+                except asyncio.TimeoutError:
+                    if client.idle_for() > HEARTBEAT_TIMEOUT:
+                        logger.info("WebSocket for session %s missed heartbeats, closing", session_id)
+                        break
+                    client.enqueue("json", {"type": "ping", "timestamp": time.time()})
+        except Exception:
+            # WebSocketDisconnect or a transport error - either way the client is gone
+            pass
+        finally:
+            self.disconnect(session_id, client)
+
+    def stats(self) -> Dict:
+        clients = [client for clients in self.active_connections.values() for client in clients]
+        return {
+            "sessions": len(self.active_connections),
+            "connections": len(clients),
+            "queued": sum(client.queue.qsize() for client in clients),
+            "dropped": sum(client.dropped for client in clients),
+            "backplane": self.backplane.stats(),
+        }
@@ -0,0 +1,180 @@
+"""
+Near-duplicate draft reuse for AI Email Agent
+Exact-key coalescing only helps identical prompts. This index keeps recent
+prompts as hashed n-gram vectors next to their generated drafts, and a new
+prompt whose cosine similarity to a stored one clears the threshold reuses
+that draft instead of calling Cohere ("send internship mail to Google" and
+"send an internship email for Google" are the same email).
+
+Names, emails and numbers in a prompt are slots: they are masked out of the
+vector and, with slot filling on, swapped into the reused draft. Otherwise a
+draft is only reused when its slots match exactly.
+
+NumPy is optional; without it the index is disabled.
+"""
+
+import os
+import re
+import copy
+import time
+import zlib
+import logging
+import threading
+import importlib.util
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+NUMPY_AVAILABLE = importlib.util.find_spec("numpy") is not None
+
+DRAFT_CACHE_SIZE = int(os.getenv("DRAFT_CACHE_SIZE", "512"))  # 0 disables reuse
+DRAFT_REUSE_THRESHOLD = float(os.getenv("DRAFT_REUSE_THRESHOLD", "0.9"))
+DRAFT_SLOT_FILL = os.getenv("DRAFT_SLOT_FILL", "1") != "0"
+VECTOR_DIM = 4096
+
+STOPWORDS = {
+    "a", "an", "the", "to", "for", "of", "and", "my", "me", "i", "please", "about",
+    "send", "write", "draft", "compose", "email", "mail", "message", "some", "with",
+}
+
+# Slot tokens: emails, numbers and capitalized words that do not start the prompt
+SLOT_PATTERN = re.compile(r"[\w.+-]+@[\w-]+\.[\w.]+|\b\d[\w/:.-]*|(?<!^)(?<![.!?]\s)\b[A-Z][\w&-]*")
+WORD_PATTERN = re.compile(r"[a-z0-9']+")
+
+
+def find_slots(prompt: str) -> List[str]:
+    return [match.group(0) for match in SLOT_PATTERN.finditer((prompt or "").strip())]
+
+
+def prompt_features(prompt: str) -> List[str]:
+    """Word unigrams, bigrams and character trigrams of the prompt with slots masked"""
+    masked = SLOT_PATTERN.sub(" slot ", (prompt or "").strip())
+    words = [w for w in WORD_PATTERN.findall(masked.lower()) if w not in STOPWORDS]
+    features = [f"w:{w}" for w in words]
+    features += [f"b:{a}_{b}" for a, b in zip(words, words[1:])]
+    for word in words:
+        padded = f"<{word}>"
+        features += [f"c:{padded[i:i + 3]}" for i in range(len(padded) - 2)]
+    return features
+
+
+def vectorize(prompt: str, dim: int = VECTOR_DIM):
+    """L2-normalized hashed feature vector (signed hashing keeps collisions unbiased)"""
+    import numpy as np
+    vector = np.zeros(dim, dtype=np.float32)
+    for feature in prompt_features(prompt):
+        h = zlib.crc32(feature.encode("utf-8"))
+        # Words count double: they carry the meaning, trigrams absorb typos and inflections
+        weight = 2.0 if feature.startswith("w:") else 1.0
+        vector[h % dim] += weight if (h >> 31) & 1 else -weight
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+class DraftCache:
+    def __init__(self, capacity: int = None, threshold: float = None, slot_fill: bool = None,
+                 dim: int = VECTOR_DIM):
+        self.capacity = capacity if capacity is not None else DRAFT_CACHE_SIZE
+        self.threshold = threshold if threshold is not None else DRAFT_REUSE_THRESHOLD
+        self.slot_fill = slot_fill if slot_fill is not None else DRAFT_SLOT_FILL
+        self.dim = dim
+        self.enabled = NUMPY_AVAILABLE and self.capacity > 0
+        self._vectors = None                      # capacity x dim, allocated on first add
+        self._last_used = None                    # per row, for LRU eviction
+        self._entries: List[Optional[Dict]] = []
+        self._lock = threading.Lock()
+        self.counts = {"lookups": 0, "hits": 0, "slot_filled": 0, "misses": 0, "stored": 0, "evictions": 0}
+        if self.capacity > 0 and not NUMPY_AVAILABLE:
+            logger.warning("NumPy not installed. Near-duplicate draft reuse is disabled.")
+
+    def lookup(self, prompt: str, recipient_email: str = None) -> Optional[Dict]:
+        """A stored draft for a near-duplicate prompt, with slots filled in, or None"""
+        if not self.enabled:
+            return None
+        import numpy as np
+        vector = vectorize(prompt, self.dim)
+        slots = self._slots(prompt, recipient_email)
+        with self._lock:
+            self.counts["lookups"] += 1
+            rows = len(self._entries)
+            if rows == 0:
+                self.counts["misses"] += 1
+                return None
+            scores = self._vectors[:rows] @ vector
+            best = int(np.argmax(scores))
+            similarity = float(scores[best])
+            entry = self._entries[best]
+            if similarity < self.threshold or not self._slots_compatible(entry["slots"], slots):
+                self.counts["misses"] += 1
+                return None
+            self._last_used[best] = time.monotonic()
+            entry["hits"] += 1
+            content = copy.deepcopy(entry["content"])
+            filled = entry["slots"] != slots
+            self.counts["slot_filled" if filled else "hits"] += 1
+        if filled:
+            content = self._fill(content, entry["slots"], slots)
+        content["reused_draft"] = {"similarity": round(similarity, 3), "prompt": entry["prompt"],
+                                   "slot_filled": filled}
+        return content
+
+    def add(self, prompt: str, recipient_email: str, content: Dict):
+        """Store a generated draft, evicting the least recently used one when full"""
+        if not self.enabled:
+            return
+        import numpy as np
+        vector = vectorize(prompt, self.dim)
+        entry = {"prompt": prompt, "slots": self._slots(prompt, recipient_email),
+                 "content": copy.deepcopy(content), "hits": 0}
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros((self.capacity, self.dim), dtype=np.float32)
+                self._last_used = np.zeros(self.capacity, dtype=np.float64)
+            if len(self._entries) < self.capacity:
+                row = len(self._entries)
+                self._entries.append(entry)
+            else:
+                row = int(np.argmin(self._last_used))
+                self._entries[row] = entry
+                self.counts["evictions"] += 1
+            self._vectors[row] = vector
+            self._last_used[row] = time.monotonic()
+            self.counts["stored"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries = []
+            self._vectors = None
+            self._last_used = None
+
+    @staticmethod
+    def _slots(prompt: str, recipient_email: str = None) -> List[str]:
+        return [(recipient_email or "").strip().lower()] + find_slots(prompt)
+
+    def _slots_compatible(self, stored: List[str], wanted: List[str]) -> bool:
+        if stored == wanted:
+            return True
+        # Filling pairs slots by position, so the prompts must have the same number
+        return self.slot_fill and len(stored) == len(wanted)
+
+    @staticmethod
+    def _fill(content: Dict, stored: List[str], wanted: List[str]) -> Dict:
+        """Swap the stored prompt's slot values for the new ones (in one pass, so swaps cannot chain)"""
+        mapping = {old.lower(): new for old, new in zip(stored, wanted) if old and old.lower() != new.lower()}
+        if not mapping:
+            return content
+        pattern = re.compile("|".join(re.escape(old) for old in sorted(mapping, key=len, reverse=True)),
+                             re.IGNORECASE)
+
+        def fill(text: str) -> str:
+            return pattern.sub(lambda m: mapping[m.group(0).lower()], text or "")
+
+        content["subject"] = fill(content.get("subject"))
+        content["body"] = fill(content.get("body"))
+        content["key_points"] = [fill(point) for point in content.get("key_points", [])]
+        return content
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"enabled": self.enabled, "size": len(self._entries), "capacity": self.capacity,
+                    "threshold": self.threshold, **self.counts}
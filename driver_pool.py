@@ -0,0 +1,172 @@
+"""
+Browser pool for AI Email Agent
+Resolves the chromedriver binary once and keeps pre-launched Chrome
+instances ready, so a send does not pay for driver resolution and a cold
+browser start on the critical path. Browsers of failed sends can be parked
+for a while so a retry resumes where the send stopped.
+"""
+
+import os
+import logging
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+from session_trace import span
+
+logger = logging.getLogger(__name__)
+
+_driver_path: Optional[str] = None
+_driver_path_lock = threading.Lock()
+
+
+def resolve_driver_path() -> Optional[str]:
+    """
+    Locate chromedriver once per process (CHROMEDRIVER_PATH, else Selenium
+    Manager) and cache the result
+    """
+    global _driver_path
+    if _driver_path is not None:
+        return _driver_path
+    with _driver_path_lock:
+        if _driver_path is None:
+            path = os.getenv("CHROMEDRIVER_PATH")
+            if not path:
+                from selenium.webdriver.chrome.options import Options
+                from selenium.webdriver.common.selenium_manager import SeleniumManager
+                path = SeleniumManager().driver_location(Options())
+            logger.info("Resolved chromedriver at %s", path)
+            _driver_path = path
+    return _driver_path
+
+
+def cached_driver_path() -> Optional[str]:
+    """The chromedriver path if it has already been resolved"""
+    return _driver_path
+
+
+class DriverPool:
+    def __init__(self, factory: Callable, size: int = None):
+        """
+        factory creates a new WebDriver. size is the number of pre-launched
+        browsers kept idle (BROWSER_POOL_SIZE, default 0 = launch on demand).
+        """
+        self.factory = factory
+        self.size = size if size is not None else int(os.getenv("BROWSER_POOL_SIZE", "0"))
+        self._idle: List = []
+        self._lock = threading.Lock()
+        self._launching = 0
+        self._closed = False
+        self._parked: Dict[str, tuple] = {}  # key -> (driver, state, timer)
+        self.hits = 0
+        self.misses = 0
+        self.resumed = 0
+        self.expired = 0
+
+    def prewarm(self):
+        """Launch browsers until the idle pool is full (blocking)"""
+        while True:
+            with self._lock:
+                if self._closed or len(self._idle) + self._launching >= self.size:
+                    return
+                self._launching += 1
+            self._launch_one()
+
+    def _launch_one(self):
+        try:
+            driver = self.factory()
+        except Exception as e:
+            logger.warning("Could not pre-launch browser: %s", e)
+            with self._lock:
+                self._launching -= 1
+            return
+        with self._lock:
+            self._launching -= 1
+            if not self._closed:
+                self._idle.append(driver)
+                return
+        driver.quit()
+
+    def _refill_async(self):
+        if self.size > 0 and not self._closed:
+            threading.Thread(target=self.prewarm, name="driver-pool-refill", daemon=True).start()
+
+    def acquire(self):
+        """Take a pre-launched browser, or start one if none is idle"""
+        with self._lock:
+            driver = self._idle.pop() if self._idle else None
+        if driver is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            with span("driver.start", "driver"):
+                driver = self.factory()
+        self._refill_async()
+        return driver
+
+    def release(self, driver):
+        """Finish with a browser. Browsers hold session cookies, so they are never reused"""
+        try:
+            driver.quit()
+        except Exception as e:
+            logger.warning("Error closing browser: %s", e)
+
+    def park(self, key: str, driver, state: Dict, ttl: float):
+        """Hold a browser (still logged in) for a later resume; it is closed after ttl seconds"""
+        timer = threading.Timer(ttl, self._expire, (key, driver))
+        timer.daemon = True
+        with self._lock:
+            if self._closed:
+                previous = (driver, None, None)
+            else:
+                previous = self._parked.pop(key, None)
+                self._parked[key] = (driver, state, timer)
+                timer.start()
+        if previous is not None:
+            if previous[2] is not None:
+                previous[2].cancel()
+            self.release(previous[0])
+
+    def unpark(self, key: str) -> Optional[Tuple[object, Dict]]:
+        """Take back a parked browser and its saved state, if it has not expired"""
+        with self._lock:
+            parked = self._parked.pop(key, None)
+        if parked is None:
+            return None
+        driver, state, timer = parked
+        timer.cancel()
+        self.resumed += 1
+        return driver, state
+
+    def _expire(self, key: str, driver):
+        with self._lock:
+            parked = self._parked.get(key)
+            if parked is None or parked[0] is not driver:
+                return
+            del self._parked[key]
+            self.expired += 1
+        logger.info("Parked browser for %s expired", key)
+        self.release(driver)
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            parked, self._parked = list(self._parked.values()), {}
+        for driver, _, timer in parked:
+            timer.cancel()
+            idle.append(driver)
+        for driver in idle:
+            self.release(driver)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "size": self.size,
+                "idle": len(self._idle),
+                "launching": self._launching,
+                "hits": self.hits,
+                "misses": self.misses,
+                "parked": len(self._parked),
+                "resumed": self.resumed,
+                "expired": self.expired,
+            }
@@ -0,0 +1,113 @@
+"""
+Failure watchdog for AI Email Agent
+Polls the page on a background thread while a send runs and classifies
+known dead ends on the Google sign-in host - security challenges, CAPTCHAs,
+wrong password, unknown account, blocked browser, login error banners. When
+one appears the session is aborted immediately with an error code, instead
+of waiting out fixed sleeps and every fallback selector.
+"""
+
+import os
+import re
+import json
+import logging
+import threading
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+WATCHDOG_INTERVAL = float(os.getenv("WATCHDOG_INTERVAL", "0.5"))
+
+# Failure pages are all served by the Google sign-in host. Once the send is in
+# Gmail itself, text like "Wrong password" can be part of an email or the inbox.
+LOGIN_HOSTS = ("accounts.google.com",)
+
+# One round trip per probe; returns the facts classify_page() needs. Page text
+# and selectors are only read on the sign-in host.
+PROBE_SCRIPT = """
+const host = location.host;
+if (!%s.includes(host)) {
+    return {host: host};
+}
+const q = (selector) => document.querySelector(selector);
+const banner = q("div[aria-live='assertive'], div[role='alert']");
+return {
+    host: host,
+    text: ((document.body && document.body.innerText) || '').slice(0, 20000),
+    captcha: !!q("iframe[src*='recaptcha'], #captchaimg, img[src*='Captcha']"),
+    challenge: !!q("div[data-challenge-type], #challengePickerList, .challenge-picker, div[aria-label*='verification']"),
+    banner: banner ? banner.innerText.trim() : ''
+};
+""" % json.dumps(list(LOGIN_HOSTS))
+
+TEXT_FAILURES = [
+    (re.compile(r"Wrong password", re.I), "WRONG_PASSWORD", "Gmail rejected the password"),
+    (re.compile(r"Couldn.t find your Google Account", re.I), "ACCOUNT_NOT_FOUND", "Gmail could not find this account"),
+    (re.compile(r"This browser or app may not be secure", re.I), "BROWSER_BLOCKED",
+     "Google blocked sign-in from the automated browser"),
+]
+
+
+class AutomationAbort(Exception):
+    """A send was stopped because the page reached a known failure state"""
+
+    def __init__(self, code: str, message: str):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+def classify_page(page: Optional[Dict]) -> Optional[Tuple[str, str]]:
+    """(code, detail) for a known failure page, from what PROBE_SCRIPT read; None elsewhere"""
+    if not page or page.get("host") not in LOGIN_HOSTS:
+        return None
+    if page.get("captcha"):
+        return "CAPTCHA", "A CAPTCHA must be solved to continue"
+    if page.get("challenge"):
+        return "SECURITY_CHALLENGE", "Gmail security challenge detected. Please complete manually."
+    text = page.get("text") or ""
+    for pattern, code, detail in TEXT_FAILURES:
+        if pattern.search(text):
+            return code, detail
+    if page.get("banner"):
+        return "AUTH_ERROR", page["banner"]
+    return None
+
+
+def probe_page(driver) -> Optional[Tuple[str, str]]:
+    """Check the current page once; returns (code, detail) for a known failure"""
+    return classify_page(driver.execute_script(PROBE_SCRIPT))
+
+
+class FailureWatchdog:
+    def __init__(self, driver, ctx, interval: float = None):
+        self.driver = driver
+        self.ctx = ctx
+        self.interval = interval or WATCHDOG_INTERVAL
+        self.probes = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name=f"watchdog-{self.ctx.session_id}", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval * 2 + 1)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                failure = probe_page(self.driver)
+            except Exception as e:
+                # Navigation in progress or browser closing - try again next tick
+                logger.debug("Watchdog probe failed: %s", e)
+                continue
+            self.probes += 1
+            if failure:
+                code, detail = failure
+                logger.warning("Watchdog detected %s during step %s: %s", code, self.ctx.current_step, detail)
+                self.ctx.abort(AutomationAbort(code, detail))
+                return
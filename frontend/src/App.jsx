@@ -2,6 +2,64 @@ import React, { useState, useRef } from "react";
 import axios from "axios";
 import "./App.css";
 
+const formatMs = (ms) => (ms >= 1000 ? `${(ms / 1000).toFixed(2)}s` : `${Math.round(ms)}ms`);
+
+// Waterfall of the session trace: one bar per span, positioned on the send's timeline
+function TraceWaterfall({ trace }) {
+  const [showDetails, setShowDetails] = useState(false);
+  const total = trace.total_ms || 1;
+  const rows = trace.waterfall.filter((span) => showDetails || span.depth === 1);
+
+  return (
+    <div className="trace-container">
+      <h4>
+        ⏱️ Session Trace: {formatMs(trace.total_ms)}
+        {trace.trace_url && (
+          <a href={trace.trace_url} target="_blank" rel="noreferrer" className="trace-link">
+            Full trace JSON
+          </a>
+        )}
+      </h4>
+      <div className="trace-kinds">
+        {Object.entries(trace.by_kind_ms).map(([kind, ms]) => (
+          <span key={kind} className={`trace-kind kind-${kind}`}>
+            {kind}: {formatMs(ms)}
+          </span>
+        ))}
+      </div>
+      <div className="trace-waterfall">
+        {rows.map((span, index) => (
+          <div
+            key={index}
+            className={`trace-row ${span.duration_ms >= total * 0.2 ? "slow" : ""} ${
+              span.status === "error" ? "failed" : ""
+            }`}
+            title={span.error || JSON.stringify(span.attrs || {})}
+          >
+            <div className="trace-label" style={{ paddingLeft: `${(span.depth - 1) * 16}px` }}>
+              {span.name}
+              {span.attrs?.selector && <small> {span.attrs.selector}</small>}
+            </div>
+            <div className="trace-track">
+              <div
+                className={`trace-bar kind-${span.kind}`}
+                style={{
+                  left: `${(span.start_ms / total) * 100}%`,
+                  width: `${Math.max((span.duration_ms / total) * 100, 0.5)}%`,
+                }}
+              ></div>
+            </div>
+            <div className="trace-duration">{formatMs(span.duration_ms)}</div>
+          </div>
+        ))}
+      </div>
+      <button type="button" className="trace-toggle" onClick={() => setShowDetails(!showDetails)}>
+        {showDetails ? "Hide selectors, waits and screenshots" : "Show selectors, waits and screenshots"}
+      </button>
+    </div>
+  );
+}
+
 function App() {
   const [formData, setFormData] = useState({
     gmail_id: "",
@@ -19,6 +77,7 @@ function App() {
   const [isRealEmail, setIsRealEmail] = useState(false);
   const [emailContent, setEmailContent] = useState(null);
   const [aiGenerated, setAiGenerated] = useState(false);
+  const [trace, setTrace] = useState(null);
   const wsRef = useRef(null);
   const sessionIdRef = useRef(null);
 
@@ -50,6 +109,11 @@ function App() {
     ws.onmessage = (event) => {
       try {
         const data = JSON.parse(event.data);
+        // Answer server heartbeats so the connection is not reaped
+        if (data.type === "ping") {
+          ws.send("pong");
+          return;
+        }
         setScreenshots((prev) => {
           // Avoid duplicates
           if (prev.some((s) => s.filename === data.filename)) return prev;
@@ -75,14 +139,20 @@ function App() {
     setIsRealEmail(false);
     setEmailContent(null);
     setAiGenerated(false);
+    setTrace(null);
     sessionIdRef.current = null;
 
     try {
-      const response = await axios.post("/send-ai-email", formData);
+      // One key per submit so a retried request never sends a duplicate email
+      const response = await axios.post("/send-ai-email", {
+        ...formData,
+        idempotency_key: window.crypto.randomUUID(),
+      });
       setStatus(response.data.status);
       setMessage(response.data.message);
       setEmailContent(response.data.email_content);
       setAiGenerated(response.data.ai_generated);
+      setTrace(response.data.trace || null);
       // Start WebSocket stream if session_id is present
       if (response.data.session_id) {
         startScreenshotStream(response.data.session_id);
@@ -105,7 +175,9 @@ function App() {
       }
       if (response.data.status === "error") {
         setError(
-          "AI automation failed. Please check the screenshots for details."
+          response.data.error_code
+            ? `AI automation stopped (${response.data.error_code}): ${response.data.message}`
+            : "AI automation failed. Please check the screenshots for details."
         );
       }
     } catch (err) {
@@ -308,6 +380,8 @@ function App() {
               </div>
             )}
 
+            {trace && trace.waterfall && <TraceWaterfall trace={trace} />}
+
             {isDemoMode && (
               <div className="demo-notice">
                 <p>
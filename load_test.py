@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""
+Load test for AI Email Agent
+Starts the API (uvicorn, stub browser, Cohere stand-in) in a scratch
+directory, then runs N concurrent virtual users. Each user subscribes to
+/ws/screenshots/{session_id} and then calls /send-ai-email for that session,
+while a prober hits /health. It reports request latency percentiles, error
+rates, WebSocket delivery delay and server event-loop lag, and writes the
+results as JSON keyed by commit so runs can be compared.
+
+Usage: python load_test.py [--users 10] [--duration 20] [--url http://127.0.0.1:8000]
+       [--llm standin|fallback] [--compare load_results/<previous>.json]
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime
+from typing import Dict, List
+
+from loop_monitor import percentile
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def summarize(values: List[float]) -> Dict:
+    """Latency summary in milliseconds"""
+    return {
+        "count": len(values),
+        "p50_ms": round(percentile(values, 50) * 1000, 1),
+        "p95_ms": round(percentile(values, 95) * 1000, 1),
+        "p99_ms": round(percentile(values, 99) * 1000, 1),
+        "max_ms": round(max(values) * 1000, 1) if values else 0.0,
+    }
+
+
+def current_commit() -> str:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=REPO_DIR,
+                               capture_output=True, text=True).stdout.strip()
+        return f"{commit}-dirty" if dirty else commit
+    except Exception:
+        return "unknown"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(args, workdir: str, cohere_url: str = None) -> (subprocess.Popen, str):
+    """Run main:app under uvicorn with the stub browser, in a scratch directory"""
+    port = free_port()
+    env = {
+        **os.environ,
+        "BROWSER_DRIVER": "stub",
+        "STUB_DRIVER_LATENCY": str(args.stub_latency),
+        "STEP_PAUSE_SCALE": str(args.pause_scale),
+        "PREWARM_DRIVER": "0",
+        "SESSION_DB_PATH": os.path.join(workdir, "sessions.db"),
+        "COHERE_API_URL": cohere_url or "",
+        "COHERE_API_KEY": "standin-key" if cohere_url else "",
+        "COHERE_MAX_RETRIES": "0",
+        "WORKER_PROCESSES": str(args.workers),
+    }
+    log = open(os.path.join(workdir, "server.log"), "w")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--app-dir", REPO_DIR,
+         "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT
+    )
+    return process, f"http://127.0.0.1:{port}"
+
+
+class LoadTest:
+    def __init__(self, args, base_url: str):
+        self.args = args
+        self.base_url = base_url
+        self.ws_url = base_url.replace("http", "ws", 1)
+        self.send_latencies: List[float] = []
+        self.send_statuses: Dict[str, int] = {}
+        self.health_latencies: List[float] = []
+        self.health_errors = 0
+        self.ws_delays: List[float] = []
+        self.ws_expected = 0
+        self.ws_errors = 0
+        self.loop_lag: List[Dict] = []
+
+    def _count(self, status: str):
+        self.send_statuses[status] = self.send_statuses.get(status, 0) + 1
+
+    async def wait_ready(self, client, timeout: float = 60):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get("/health")).status_code == 200:
+                    return True
+            except Exception:
+                pass
+            await asyncio.sleep(0.25)
+        return False
+
+    async def _receive(self, ws, delays: List[float]):
+        async for message in ws:
+            if isinstance(message, bytes):
+                continue
+            data = json.loads(message)
+            if data.get("type") == "ping":
+                await ws.send("pong")
+            elif "captured_at" in data:
+                delays.append(max(0.0, time.time() - data["captured_at"]))
+
+    async def virtual_user(self, client, user: int, deadline: float):
+        import websockets
+        iteration = 0
+        while time.monotonic() < deadline:
+            iteration += 1
+            session_id = str(uuid.uuid4())
+            delays: List[float] = []
+            try:
+                async with websockets.connect(f"{self.ws_url}/ws/screenshots/{session_id}") as ws:
+                    receiver = asyncio.create_task(self._receive(ws, delays))
+                    started = time.perf_counter()
+                    try:
+                        response = await client.post("/send-ai-email", json={
+                            "gmail_id": f"loadtest{user}@gmail.com",  # one account per user
+                            "gmail_password": "not-a-real-password",
+                            "recipient_email": f"recipient{user}@example.com",
+                            "user_prompt": f"Load test email {user}-{iteration}",
+                            "session_id": session_id,
+                        })
+                        self.send_latencies.append(time.perf_counter() - started)
+                        if response.status_code != 200:
+                            self._count(f"http_{response.status_code}")
+                        else:
+                            body = response.json()
+                            self._count(body.get("status", "unknown"))
+                            self.ws_expected += sum(1 for s in body.get("screenshots", []) if "captured_at" in s)
+                    except Exception as e:
+                        self._count(f"exception_{type(e).__name__}")
+                    # Give trailing frames a moment to arrive
+                    await asyncio.sleep(self.args.drain)
+                    receiver.cancel()
+            except Exception:
+                self.ws_errors += 1
+            self.ws_delays.extend(delays)
+
+    async def health_prober(self, client, deadline: float):
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            try:
+                response = await client.get("/health")
+                self.health_latencies.append(time.perf_counter() - started)
+                if response.status_code != 200:
+                    self.health_errors += 1
+            except Exception:
+                self.health_errors += 1
+            await asyncio.sleep(1.0 / self.args.health_rate)
+
+    async def metrics_poller(self, client, deadline: float):
+        while time.monotonic() < deadline:
+            await asyncio.sleep(1.0)
+            try:
+                lag = (await client.get("/metrics")).json()["event_loop"]
+                self.loop_lag.append({"t": round(time.time(), 1), "current_ms": lag["current_ms"], "p99_ms": lag["p99_ms"]})
+            except Exception:
+                pass
+
+    async def run(self) -> Dict:
+        import httpx
+        async with httpx.AsyncClient(base_url=self.base_url, timeout=self.args.timeout) as client:
+            if not await self.wait_ready(client):
+                raise RuntimeError(f"Server at {self.base_url} did not become healthy")
+            started = time.monotonic()
+            deadline = started + self.args.duration
+            await asyncio.gather(
+                *(self.virtual_user(client, user, deadline) for user in range(self.args.users)),
+                self.health_prober(client, deadline),
+                self.metrics_poller(client, deadline),
+            )
+            elapsed = time.monotonic() - started
+            metrics = (await client.get("/metrics")).json()
+
+        sends = len(self.send_latencies) + sum(v for k, v in self.send_statuses.items() if k.startswith("exception_"))
+        failed = sum(v for k, v in self.send_statuses.items() if k != "success")
+        return {
+            "send": {
+                **summarize(self.send_latencies),
+                "throughput_rps": round(len(self.send_latencies) / elapsed, 2),
+                "statuses": self.send_statuses,
+                "error_rate": round(failed / sends, 4) if sends else 0.0,
+            },
+            "health": {
+                **summarize(self.health_latencies),
+                "error_rate": round(self.health_errors / max(1, len(self.health_latencies) + self.health_errors), 4),
+            },
+            "websocket": {
+                "delivery_delay": summarize(self.ws_delays),
+                "frames_expected": self.ws_expected,
+                "frames_received": len(self.ws_delays),
+                "connection_errors": self.ws_errors,
+            },
+            "event_loop": {
+                "final": metrics.get("event_loop"),
+                "max_p99_ms": max((sample["p99_ms"] for sample in self.loop_lag), default=0.0),
+                "series": self.loop_lag,
+            },
+            "server_metrics": {k: v for k, v in metrics.items() if k != "event_loop"},
+            "elapsed_seconds": round(elapsed, 1),
+        }
+
+
+def compare(report: Dict, previous: Dict):
+    """Print the change in headline numbers against an earlier run"""
+    rows = [
+        ("send p50", ("send", "p50_ms")), ("send p99", ("send", "p99_ms")),
+        ("send rps", ("send", "throughput_rps")), ("health p99", ("health", "p99_ms")),
+        ("ws delay p99", ("websocket", "delivery_delay", "p99_ms")),
+        ("loop lag p99", ("event_loop", "max_p99_ms")),
+    ]
+    print(f"\n📊 Compared with {previous.get('commit')} ({previous.get('timestamp')})")
+    for label, path in rows:
+        old, new = previous, report
+        for key in path:
+            old, new = (old or {}).get(key), (new or {}).get(key)
+        if isinstance(old, (int, float)) and isinstance(new, (int, float)):
+            change = f"{(new - old) / old:+.1%}" if old else "n/a"
+            print(f"   {label:<14} {old:>9} → {new:<9} ({change})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the AI Email Agent API")
+    parser.add_argument("--users", type=int, default=10, help="Concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=20, help="Seconds to run")
+    parser.add_argument("--url", help="Test an already running server instead of starting one")
+    parser.add_argument("--llm", choices=["standin", "fallback"], default="standin",
+                        help="Cohere stand-in, or no API key (template fallback)")
+    parser.add_argument("--llm-latency", default="lognormal:0.2:0.3")
+    parser.add_argument("--workers", type=int, default=0, help="WORKER_PROCESSES for the server (0 = in-process)")
+    parser.add_argument("--pause-scale", type=float, default=0.01, help="STEP_PAUSE_SCALE for the server")
+    parser.add_argument("--stub-latency", type=float, default=0.002, help="Seconds per stub browser command")
+    parser.add_argument("--health-rate", type=float, default=5, help="/health probes per second")
+    parser.add_argument("--drain", type=float, default=0.5, help="Seconds to wait for trailing frames")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--output", default="load_results", help="Directory for JSON results")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    args = parser.parse_args()
+
+    standin = server = None
+    workdir = tempfile.mkdtemp(prefix="email-agent-load-")
+    try:
+        base_url = args.url
+        if not base_url:
+            cohere_url = None
+            if args.llm == "standin":
+                from cohere_standin import CohereStandIn
+                standin = CohereStandIn(latency=args.llm_latency, seed=1)
+                standin.start()
+                cohere_url = standin.url
+            server, base_url = start_server(args, workdir, cohere_url)
+            print(f"📝 Server log: {os.path.join(workdir, 'server.log')}")
+
+        print(f"🚀 {args.users} virtual users for {args.duration:.0f}s against {base_url}")
+        results = asyncio.run(LoadTest(args, base_url).run())
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=10)
+        if standin is not None:
+            standin.stop()
+
+    report = {
+        "commit": current_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "settings": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        **results,
+    }
+    os.makedirs(args.output, exist_ok=True)
+    path = os.path.join(args.output, f"{report['commit']}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+
+    send, health, ws = report["send"], report["health"], report["websocket"]
+    print(f"\n📨 /send-ai-email: {send['count']} requests, {send['throughput_rps']} rps, "
+          f"p50 {send['p50_ms']}ms p95 {send['p95_ms']}ms p99 {send['p99_ms']}ms, "
+          f"error rate {send['error_rate']:.1%} {send['statuses']}")
+    print(f"💓 /health: {health['count']} probes, p50 {health['p50_ms']}ms p99 {health['p99_ms']}ms, "
+          f"error rate {health['error_rate']:.1%}")
+    print(f"🖼️  WebSocket: {ws['frames_received']}/{ws['frames_expected']} frames, delivery delay "
+          f"p50 {ws['delivery_delay']['p50_ms']}ms p99 {ws['delivery_delay']['p99_ms']}ms")
+    print(f"⏱️  Event-loop lag: worst p99 {report['event_loop']['max_p99_ms']}ms")
+    print(f"\n💾 Results written to {path}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+    return send["error_rate"] == 0
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,66 @@
+"""
+Event-loop lag monitor for AI Email Agent
+A background task sleeps for a fixed interval and records how late it wakes
+up. Sustained lag means something is blocking the server loop (a sync call
+in an async endpoint, heavy encoding, ...) and every request and WebSocket
+frame is delayed by it.
+"""
+
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+LOOP_MONITOR_INTERVAL = float(os.getenv("LOOP_MONITOR_INTERVAL", "0.1"))
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, min(len(ordered), round(pct / 100 * len(ordered) + 0.5)))
+    return ordered[rank - 1]
+
+
+class LoopLagMonitor:
+    def __init__(self, interval: float = None, window: int = 600):
+        """Keeps the last window lag samples (one minute at the default 0.1s interval)"""
+        self.interval = interval or LOOP_MONITOR_INTERVAL
+        self.samples: deque = deque(maxlen=window)
+        self.max_lag = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def _run(self):
+        while True:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.perf_counter() - expected)
+            self.samples.append(lag)
+            self.max_lag = max(self.max_lag, lag)
+
+    def stats(self) -> Dict:
+        samples = list(self.samples)
+        return {
+            "interval_ms": round(self.interval * 1000, 1),
+            "samples": len(samples),
+            "current_ms": round(samples[-1] * 1000, 2) if samples else 0.0,
+            "p50_ms": round(percentile(samples, 50) * 1000, 2),
+            "p99_ms": round(percentile(samples, 99) * 1000, 2),
+            "max_ms": round(self.max_lag * 1000, 2),
+        }
@@ -1,18 +1,102 @@
-from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, HTTPException, WebSocket, Header, Request
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, JSONResponse
+from pydantic import BaseModel, ValidationError
+from contextlib import asynccontextmanager
 import logging
 import os
-from ai_email_agent import AIEmailAgent, create_ai_demo_screenshots
-from typing import Dict, List
+import time
+# Loads .env, before any module that reads settings at import time
+import settings  # noqa: F401
+from ai_email_agent import (AIEmailAgent, DELIVERY_BACKEND, create_ai_demo_screenshots, draft_cache, generation_flight,
+                            model_router, ui_plans)
+from attachments import AttachmentError, AttachmentStore, parse_multipart
+from driver_pool import resolve_driver_path
+from scheduler import SendScheduler
+from session_store import SessionStore, request_fingerprint
+from connection_manager import ConnectionManager, make_thumbnail
+from worker_tier import WorkerTier
+from loop_monitor import LoopLagMonitor
+from structured_logging import configure_logging, log_context
+from request_profiler import PROFILE_FILES, check_admin_token, profile_path, profile_session, profiling_enabled
+from typing import Dict, List, Literal, Optional
+from datetime import datetime
 import asyncio
+import threading
+import uuid
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="AI Email Agent v2", description="Intelligent Gmail automation with AI-powered content generation")
+# Queue-backed JSON logging (LOG_LEVEL, LOG_FORMAT)
+configure_logging()
+
+# Readiness of the startup prewarm stage, reported by /health
+warmup_state = {"ready": False, "started_at": None, "finished_at": None, "steps": {}}
+
+def prewarm():
+    """
+    Move first-request costs to startup: resolve and cache the chromedriver
+    path, create the shared agent (Cohere client + first TLS handshake) and
+    pre-launch pooled browsers when BROWSER_POOL_SIZE is set. The UI plan is
+    loaded (and validated) here too, so a broken plan file shows up in /health
+    """
+    warmup_state["started_at"] = time.time()
+    steps = [("driver_path", resolve_driver_path), ("agent", get_agent)]
+    if os.getenv("PREWARM_DRIVER", "1") == "0":
+        steps = steps[1:]
+    if worker_tier.enabled:
+        # Each worker process creates its own agent and prewarms its own pool
+        steps = [("workers", _wait_for_workers)]
+    steps.insert(0, ("ui_plan", ui_plans.current))
+    for name, step in steps:
+        started = time.perf_counter()
+        try:
+            step()
+            warmup_state["steps"][name] = {"ok": True, "seconds": round(time.perf_counter() - started, 3)}
+        except Exception as e:
+            logger.warning("Prewarm step %s failed: %s", name, e)
+            warmup_state["steps"][name] = {"ok": False, "error": str(e)}
+    if not worker_tier.enabled:
+        started = time.perf_counter()
+        get_agent().driver_pool.prewarm()
+        warmup_state["steps"]["browsers"] = {
+            "ok": True,
+            "seconds": round(time.perf_counter() - started, 3),
+            **get_agent().driver_pool.stats()
+        }
+    warmup_state["finished_at"] = time.time()
+    warmup_state["ready"] = True
+    logger.info("Prewarm finished in %.2fs", warmup_state['finished_at'] - warmup_state['started_at'])
+
+def _wait_for_workers():
+    if not worker_tier.wait_ready():
+        raise RuntimeError("Browser workers did not start in time")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global main_loop
+    main_loop = asyncio.get_running_loop()
+    await manager.start()
+    loop_monitor.start()
+    if worker_tier.enabled:
+        worker_tier.start()
+    scheduler.start()
+    # Warm up in the background; /health reports ready once it finishes
+    prewarm_task = asyncio.create_task(run_in_threadpool(prewarm))
+    yield
+    prewarm_task.cancel()
+    scheduler.stop()
+    if worker_tier.enabled:
+        await run_in_threadpool(worker_tier.stop)
+    if _agent is not None:
+        _agent.driver_pool.close()
+    await loop_monitor.stop()
+    await manager.stop()
+
+app = FastAPI(title="AI Email Agent v2", description="Intelligent Gmail automation with AI-powered content generation",
+              lifespan=lifespan)
 
 # Add CORS middleware
 app.add_middleware(
@@ -27,59 +111,137 @@ app.add_middleware(
 os.makedirs("screenshots", exist_ok=True)
 app.mount("/screenshots", StaticFiles(directory="screenshots"), name="screenshots")
 
+class AttachmentRef(BaseModel):
+    attachment_id: str
+    filename: Optional[str] = None  # Defaults to the name it was uploaded with
+
 class AIEmailRequest(BaseModel):
     gmail_id: str
     gmail_password: str
     recipient_email: str
     user_prompt: str  # Natural language prompt like "Send internship mail"
+    idempotency_key: Optional[str] = None  # Retries with the same key return the stored result
+    capture_mode: Optional[Literal["screenshot", "screencast"]] = None  # Defaults to CAPTURE_MODE
+    session_id: Optional[str] = None  # Client-chosen id, so a viewer can subscribe before the send starts
+    profile: bool = False  # Profile this send (admin only, same as the X-Profile header)
+    draft_id: Optional[str] = None  # Send a stored draft instead of generating content
+    attachments: List[AttachmentRef] = []  # Files uploaded with POST /attachments
 
-# --- WebSocket Pub/Sub for Screenshot Streaming ---
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: Dict[str, List[WebSocket]] = {}
-
-    async def connect(self, session_id: str, websocket: WebSocket):
-        await websocket.accept()
-        if session_id not in self.active_connections:
-            self.active_connections[session_id] = []
-        self.active_connections[session_id].append(websocket)
-
-    def disconnect(self, session_id: str, websocket: WebSocket):
-        if session_id in self.active_connections:
-            self.active_connections[session_id].remove(websocket)
-            if not self.active_connections[session_id]:
-                del self.active_connections[session_id]
-
-    async def broadcast(self, session_id: str, data: dict):
-        if session_id in self.active_connections:
-            for connection in self.active_connections[session_id]:
-                try:
-                    await connection.send_json(data)
-                except Exception as e:
-                    logger.warning(f"Error sending to WebSocket: {e}")
+class DraftRequest(BaseModel):
+    user_prompt: str
+    recipient_email: Optional[str] = None  # Lets the draft greet the recipient by name
+
+class DraftEdit(BaseModel):
+    subject: Optional[str] = None
+    body: Optional[str] = None
+
+class DraftSendRequest(BaseModel):
+    gmail_id: str
+    gmail_password: str
+    recipient_email: Optional[str] = None  # Defaults to the draft's recipient
+    subject: Optional[str] = None  # Edits are saved to the draft before sending
+    body: Optional[str] = None
+    idempotency_key: Optional[str] = None
+    capture_mode: Optional[Literal["screenshot", "screencast"]] = None
+    session_id: Optional[str] = None
+
+class Recipient(BaseModel):
+    email: str
+    name: Optional[str] = None
+    company: Optional[str] = None
+    role: Optional[str] = None
+
+class MultiRecipientEmailRequest(BaseModel):
+    gmail_id: str
+    gmail_password: str
+    user_prompt: str
+    recipients: List[Recipient]
+    # template: one generation rendered per recipient; individual: one generation each
+    personalization: Literal["template", "individual"] = "template"
+    capture_mode: Optional[Literal["screenshot", "screencast"]] = None
+    # Open each compose window while the previous message is still sending (default SEND_PIPELINE)
+    pipelined: Optional[bool] = None
+
+class ScheduledEmailRequest(AIEmailRequest):
+    send_at: datetime  # When to send; naive times are server-local
+
+# Durable record of every send session
+session_store = SessionStore()
+
+# Uploaded attachments, stored once per content hash
+attachment_store = AttachmentStore()
 
+# One long-lived agent (and Cohere client) shared by all requests; per-send
+# state lives in the SessionContext that send_email creates
+_agent: Optional[AIEmailAgent] = None
+_agent_lock = threading.Lock()
+
+def get_agent() -> AIEmailAgent:
+    """Return the shared agent, creating it on first use"""
+    global _agent
+    if _agent is None:
+        with _agent_lock:
+            if _agent is None:
+                _agent = AIEmailAgent()
+    return _agent
+
+# --- WebSocket Pub/Sub for Screenshot Streaming ---
 manager = ConnectionManager()
 
+# Event loop of the server, used to notify WebSocket clients from worker threads
+main_loop: Optional[asyncio.AbstractEventLoop] = None
+
+# Lag of the server event loop, reported by /metrics
+loop_monitor = LoopLagMonitor()
+
 @app.websocket("/ws/screenshots/{session_id}")
-async def websocket_endpoint(websocket: WebSocket, session_id: str):
-    await manager.connect(session_id, websocket)
-    try:
-        while True:
-            await asyncio.sleep(60)  # Keep connection open
-    except WebSocketDisconnect:
-        manager.disconnect(session_id, websocket)
+async def websocket_endpoint(websocket: WebSocket, session_id: str, binary: bool = False):
+    """Stream screenshots for a session; ?binary=true sends thumbnail bytes inline"""
+    client = await manager.connect(session_id, websocket, binary=binary)
+    await manager.serve(session_id, client)
 
 # --- Utility to notify WebSocket clients when a screenshot is created ---
 def notify_screenshot(session_id: str, screenshot: dict):
     """Notify WebSocket clients about new screenshot"""
     try:
-        loop = asyncio.get_event_loop()
-        if loop.is_running():
-            asyncio.create_task(manager.broadcast(session_id, screenshot))
-        else:
-            loop.run_until_complete(manager.broadcast(session_id, screenshot))
+        thumbnail = None
+        if manager.wants_binary(session_id):
+            thumbnail = make_thumbnail(os.path.join("screenshots", screenshot["filename"]))
+        broadcast = manager.broadcast(session_id, screenshot, thumbnail)
+        try:
+            asyncio.get_running_loop().create_task(broadcast)
+        except RuntimeError:
+            # Called from a worker thread - hand the broadcast to the server loop
+            if main_loop is not None:
+                asyncio.run_coroutine_threadsafe(broadcast, main_loop)
+            else:
+                broadcast.close()
     except Exception as e:
-        logger.warning(f"Error notifying screenshot: {e}")
+        logger.warning("Error notifying screenshot: %s", e)
+
+# Browser worker processes (WORKER_PROCESSES), routed by sender account
+worker_tier = WorkerTier(on_screenshot=notify_screenshot)
+
+def run_agent(method: str, gmail_id: str, profile: bool = False, **kwargs):
+    """
+    Run an agent send method in-process, or on the worker process that owns the
+    account. With profile, the run is profiled under its session_id.
+    """
+    if worker_tier.enabled:
+        # Workers report screenshots back through the tier
+        kwargs.pop("on_screenshot", None)
+        return worker_tier.submit(method, gmail_id, profile=profile, **kwargs).result()
+    if profile:
+        with profile_session(kwargs["session_id"]):
+            return getattr(get_agent(), method)(gmail_id=gmail_id, **kwargs)
+    return getattr(get_agent(), method)(gmail_id=gmail_id, **kwargs)
+
+def require_admin(admin_token: Optional[str]):
+    """Reject the request unless profiling is enabled and the admin token matches"""
+    if not profiling_enabled():
+        raise HTTPException(status_code=403, detail="Profiling is disabled (set PROFILING_ADMIN_TOKEN)")
+    if not check_admin_token(admin_token):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
 
 @app.get("/")
 async def root():
@@ -91,22 +253,229 @@ async def test_endpoint():
     return {"status": "success", "message": "AI Email Agent v2 API is working correctly!"}
 
 @app.post("/send-ai-email")
-async def send_ai_email(request: AIEmailRequest):
+async def send_ai_email(request: AIEmailRequest,
+                        idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+                        profile_header: Optional[str] = Header(None, alias="X-Profile"),
+                        admin_token: Optional[str] = Header(None, alias="X-Admin-Token")):
     """Send email using AI-powered automation with natural language prompts"""
+    profile = request.profile or (profile_header or "").lower() in ("1", "true", "yes")
+    if profile:
+        require_admin(admin_token)
+    if request.draft_id and not session_store.get_draft(request.draft_id):
+        raise HTTPException(status_code=404, detail="Draft not found")
+    resolve_attachments(request)
+    session_id = request.session_id or str(uuid.uuid4())
+    key = request.idempotency_key or idempotency_key
+    request_hash = idempotency_fingerprint(request) if key else None
+    # An exact replay (same key, same session id) gets the stored result below, not a conflict
+    owner = session_store.get_by_idempotency_key(key) if key else None
+    if owner:
+        check_same_request(owner, request_hash)
+    if request.session_id and session_store.get_session(request.session_id) and \
+            not (owner and owner["session_id"] == request.session_id):
+        raise HTTPException(status_code=409, detail="Session id is already in use")
+
+    if key:
+        record, created = session_store.claim(key, session_id, request_hash)
+        if not created:
+            check_same_request(record, request_hash)
+            if record["status"] in ("pending", "running"):
+                raise HTTPException(
+                    status_code=409,
+                    detail=f"A request with this idempotency key is still in progress (session {record['session_id']})"
+                )
+            if (record["response"] or {}).get("resumable") and session_store.claim_resume(record["session_id"]):
+                # A retry of a failed send picks up from its last checkpoint
+                logger.info("Resuming session %s for idempotency key", record['session_id'])
+                return await _finish_ai_email(request, record["session_id"], resume=True, profile=profile)
+            logger.info("Returning stored result for idempotency key (session %s)", record['session_id'])
+            return {**record["response"], "idempotent_replay": True}
+    else:
+        session_store.create_session(session_id)
+
+    session_store.mark_running(session_id)
+    return await _finish_ai_email(request, session_id, profile=profile)
+
+def idempotency_fingerprint(request: AIEmailRequest) -> str:
+    """
+    Hash of what a send does. The password is left out (a retry may fix a
+    wrong one) and so is the profile flag, which does not change the send.
+    """
+    return request_fingerprint(request.model_dump(exclude={"idempotency_key", "gmail_password", "profile"}))
+
+def check_same_request(record: Dict, request_hash: str):
+    """422 when an idempotency key comes back with a different request body"""
+    if record.get("request_hash") and record["request_hash"] != request_hash:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Idempotency key was already used for a different request (session {record['session_id']})"
+        )
+
+def resolve_attachments(request: AIEmailRequest) -> List[Dict]:
+    """The request's attachments with their stored paths (404 if unknown, 413 if too large)"""
     try:
-        logger.info(f"Starting AI-powered email automation")
+        return attachment_store.resolve([ref.model_dump() for ref in request.attachments])
+    except AttachmentError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
+async def receive_upload(request: Request):
+    """Stream a multipart body into the attachment store; returns (fields, attachments)"""
+    try:
+        return await parse_multipart(request.headers.get("content-type"), request.stream(), attachment_store)
+    except AttachmentError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
+@app.post("/attachments")
+async def upload_attachments(request: Request):
+    """Upload files (multipart/form-data) to attach to later sends by attachment_id"""
+    _, files = await receive_upload(request)
+    if not files:
+        raise HTTPException(status_code=400, detail="No files in the upload")
+    return {"attachments": files}
+
+@app.post("/send-ai-email/multipart")
+async def send_ai_email_multipart(request: Request,
+                                  idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+                                  profile_header: Optional[str] = Header(None, alias="X-Profile"),
+                                  admin_token: Optional[str] = Header(None, alias="X-Admin-Token")):
+    """
+    /send-ai-email with files: a "request" field holding the AIEmailRequest
+    JSON, plus any number of file parts, which are attached to the email
+    """
+    fields, files = await receive_upload(request)
+    try:
+        email_request = AIEmailRequest.model_validate_json(fields.get("request") or "{}")
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors())
+    email_request.attachments += [AttachmentRef(attachment_id=file["attachment_id"], filename=file["filename"])
+                                  for file in files]
+    return await send_ai_email(email_request, idempotency_key=idempotency_key, profile_header=profile_header,
+                               admin_token=admin_token)
+
+@app.post("/drafts")
+async def create_draft(request: DraftRequest):
+    """Generate email content and store it as a draft to review, edit and send later"""
+    return await run_in_threadpool(_create_draft, request)
+
+def _create_draft(request: DraftRequest) -> Dict:
+    email_content = get_agent().generate_email_content(request.user_prompt, request.recipient_email)
+    return session_store.create_draft(str(uuid.uuid4()), request.user_prompt, request.recipient_email, email_content)
+
+@app.get("/drafts/{draft_id}")
+async def get_draft(draft_id: str):
+    """Look up a stored draft"""
+    draft = session_store.get_draft(draft_id)
+    if draft is None:
+        raise HTTPException(status_code=404, detail="Draft not found")
+    return draft
+
+@app.patch("/drafts/{draft_id}")
+async def edit_draft(draft_id: str, edit: DraftEdit):
+    """Change a draft's subject and/or body"""
+    changes = edit.model_dump(exclude_none=True)
+    if not changes:
+        raise HTTPException(status_code=400, detail="Nothing to change")
+    draft = session_store.update_draft(draft_id, changes)
+    if draft is None:
+        raise HTTPException(status_code=404, detail="Draft not found")
+    return draft
+
+@app.post("/drafts/{draft_id}/send")
+async def send_draft(draft_id: str, request: DraftSendRequest,
+                     idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")):
+    """Send a stored draft without generating content again (retries, resends and bulk reuse)"""
+    draft = session_store.get_draft(draft_id)
+    if draft is None:
+        raise HTTPException(status_code=404, detail="Draft not found")
+    changes = request.model_dump(include={"subject", "body"}, exclude_none=True)
+    if changes:
+        # Saved, so a retry of this send uses the same edited text
+        session_store.update_draft(draft_id, changes)
+    recipient_email = request.recipient_email or draft["recipient_email"]
+    if not recipient_email:
+        raise HTTPException(status_code=400, detail="recipient_email is required for this draft")
+    email_request = AIEmailRequest(
+        gmail_id=request.gmail_id,
+        gmail_password=request.gmail_password,
+        recipient_email=recipient_email,
+        user_prompt=draft["user_prompt"],
+        idempotency_key=request.idempotency_key,
+        capture_mode=request.capture_mode,
+        session_id=request.session_id,
+        draft_id=draft_id,
+    )
+    return await send_ai_email(email_request, idempotency_key=idempotency_key, profile_header=None, admin_token=None)
+
+@app.post("/sessions/{session_id}/resume")
+async def resume_session(session_id: str, request: AIEmailRequest):
+    """Retry a failed send from its last good checkpoint (in its parked browser while it is kept)"""
+    record = session_store.get_session(session_id)
+    if not record:
+        raise HTTPException(status_code=404, detail="Session not found")
+    if request.draft_id and not session_store.get_draft(request.draft_id):
+        raise HTTPException(status_code=404, detail="Draft not found")
+    if not (record["response"] or {}).get("resumable"):
+        raise HTTPException(status_code=409, detail="Session cannot be resumed")
+    if not session_store.claim_resume(session_id):
+        raise HTTPException(status_code=409, detail="Session is already running")
+    return await _finish_ai_email(request, session_id, resume=True)
+
+async def _finish_ai_email(request: AIEmailRequest, session_id: str, resume: bool = False,
+                           profile: bool = False) -> Dict:
+    """Run the automation off the event loop and store its response"""
+    try:
+        # Run the blocking automation off the event loop so requests overlap
+        response = await run_in_threadpool(_run_ai_email, request, session_id, resume, profile)
+        if profile:
+            response = {**response, "profile_url": f"/admin/profiles/{session_id}"}
+        if request.draft_id:
+            response = {**response, "draft_id": request.draft_id}
+            if response.get("status") == "success":
+                session_store.record_draft_send(request.draft_id, session_id)
+    except Exception as e:
+        session_store.finish_session(session_id, {"status": "error", "message": str(e), "session_id": session_id})
+        raise
+    session_store.finish_session(session_id, response)
+    return response
+
+def _run_ai_email(request: AIEmailRequest, session_id: str, resume: bool = False, profile: bool = False) -> Dict:
+    """Run the automation for one session, with its session_id on every log record"""
+    with log_context(session_id):
+        return _build_ai_email_response(request, session_id, resume, profile)
+
+def _build_ai_email_response(request: AIEmailRequest, session_id: str, resume: bool, profile: bool) -> Dict:
+    """Run the automation and build the API response"""
+    try:
+        logger.info("Starting AI-powered email automation")
         
-        # Initialize the AI-powered email agent
-        email_agent = AIEmailAgent()
+        # A stored draft replaces generation
+        email_content = session_store.get_draft(request.draft_id)["email_content"] if request.draft_id else None
+        if resume and email_content is None:
+            # Send what the failed attempt generated, even if its browser is no longer parked
+            record = session_store.get_session(session_id)
+            email_content = ((record or {}).get("response") or {}).get("email_content") or None
+        attachments = resolve_attachments(request) or None
+        if DELIVERY_BACKEND == "smtp":
+            method = "send_direct"
+        else:
+            method = "resume_email" if resume else "send_email"
         
-        # Attempt to send email using AI automation
+        # Attempt to send email using AI automation (shared agent, or the account's worker)
+        result = None
         try:
             logger.info("Attempting AI-powered automation...")
-            result = email_agent.send_email(
+            result = run_agent(
+                method,
                 gmail_id=request.gmail_id,
+                profile=profile,
                 gmail_password=request.gmail_password,
                 recipient_email=request.recipient_email,
-                user_prompt=request.user_prompt
+                user_prompt=request.user_prompt,
+                session_id=session_id,
+                on_screenshot=lambda screenshot: notify_screenshot(session_id, screenshot),
+                capture_mode=request.capture_mode,
+                email_content=email_content,
+                attachments=attachments
             )
             
             if result["status"] == "success":
@@ -115,29 +484,50 @@ async def send_ai_email(request: AIEmailRequest):
                     "status": "success",
                     "message": "✅ Email sent successfully using AI-generated content!",
                     "screenshots": result["screenshots"],
+                    "timeline": result.get("timeline", []),
+                    "trace": result.get("trace"),
+                    "attempts": result.get("attempts", []),
+                    "session_id": result["session_id"],
+                    "email_content": result.get("email_content", {}),
+                    "attachments": [{key: attachment[key] for key in ("attachment_id", "filename", "size")}
+                                    for attachment in attachments or []],
+                    "delivery": result.get("delivery", {"backend": "browser"}),
+                    "ai_generated": result.get("ai_generated", True)
+                }
+            elif result.get("error_code"):
+                # Classified failure (challenge, CAPTCHA, wrong password...) - a demo
+                # run would hide the actual problem, so report it directly
+                logger.error("AI automation aborted (%s): %s", result['error_code'], result['message'])
+                return {
+                    "status": "error",
+                    "message": result["message"],
+                    "error_code": result["error_code"],
+                    "failed_step": result.get("failed_step"),
+                    "screenshots": result["screenshots"],
+                    "timeline": result.get("timeline", []),
+                    "trace": result.get("trace"),
+                    "attempts": result.get("attempts", []),
                     "session_id": result["session_id"],
                     "email_content": result.get("email_content", {}),
                     "ai_generated": result.get("ai_generated", True)
                 }
             else:
-                logger.error(f"AI automation failed: {result['message']}")
+                logger.error("AI automation failed: %s", result['message'])
                 # Fall back to demo mode
                 raise Exception(f"AI automation failed: {result['message']}")
                 
         except Exception as ai_error:
-            logger.error(f"AI automation failed: {ai_error}")
+            logger.error("AI automation failed: %s", ai_error)
             
             # Fall back to demo mode
             logger.info("Falling back to AI demo mode...")
-            import uuid
-            session_id = str(uuid.uuid4())
             demo_screenshots = create_ai_demo_screenshots(session_id)
             
             # Notify WebSocket clients about demo screenshots
             for screenshot in demo_screenshots:
                 notify_screenshot(session_id, screenshot)
             
-            return {
+            response = {
                 "status": "demo",
                 "message": "🎭 Demo Mode: AI-powered email automation simulation. Showing AI analysis and content generation steps.",
                 "screenshots": demo_screenshots,
@@ -145,15 +535,182 @@ async def send_ai_email(request: AIEmailRequest):
                 "ai_generated": True,
                 "error": str(ai_error)
             }
+            if result and result.get("trace"):
+                # Where the real attempt spent its time before failing
+                response["trace"] = result["trace"]
+            if result and result.get("resumable"):
+                # The real browser is parked; a retry can still resume the send
+                response.update({
+                    "resumable": True,
+                    "checkpoint": result.get("checkpoint"),
+                    "attempts": result.get("attempts", []),
+                    "email_content": result.get("email_content", {})
+                })
+            return response
             
     except Exception as e:
-        logger.error(f"AI email automation failed: {e}")
+        logger.error("AI email automation failed: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
+def _run_scheduled_batch(gmail_id: str, gmail_password: str, jobs: List[Dict]) -> List[Dict]:
+    """Send a batch of due scheduled emails for one account in a single browser session"""
+    for job in jobs:
+        session_store.create_session(job["session_id"])
+        session_store.mark_running(job["session_id"])
+    results = run_agent(
+        "send_batch", gmail_id,
+        gmail_password=gmail_password,
+        messages=[{"session_id": job["session_id"], "recipient_email": job["recipient_email"],
+                   "user_prompt": job["user_prompt"]} for job in jobs],
+        on_screenshot=notify_screenshot
+    )
+    for job, result in zip(jobs, results):
+        session_store.finish_session(job["session_id"], result)
+    return results
+
+@app.post("/send-ai-email-multi")
+async def send_ai_email_multi(request: MultiRecipientEmailRequest):
+    """Send one prompt to several recipients, personalized per recipient, in a single login"""
+    if not request.recipients:
+        raise HTTPException(status_code=400, detail="At least one recipient is required")
+    return await run_in_threadpool(_run_multi_email, request)
+
+def _run_multi_email(request: MultiRecipientEmailRequest) -> Dict:
+    """Generate the personalized drafts, then send them as one batch"""
+    recipients = [recipient.model_dump() for recipient in request.recipients]
+    personalized = get_agent().personalize(request.user_prompt, recipients, request.personalization)
+    messages = []
+    for recipient, draft in zip(recipients, personalized["drafts"]):
+        session_id = str(uuid.uuid4())
+        session_store.create_session(session_id)
+        session_store.mark_running(session_id)
+        messages.append({"session_id": session_id, "recipient_email": recipient["email"],
+                         "user_prompt": request.user_prompt, "email_content": draft})
+    try:
+        results = run_agent(
+            "send_batch", request.gmail_id,
+            gmail_password=request.gmail_password,
+            messages=messages,
+            on_screenshot=notify_screenshot,
+            capture_mode=request.capture_mode,
+            pipelined=request.pipelined
+        )
+    except Exception as e:
+        logger.error("Multi-recipient send failed: %s", e)
+        results = [{"status": "error", "message": str(e), "session_id": m["session_id"],
+                    "email_content": m["email_content"]} for m in messages]
+    for message, result in zip(messages, results):
+        session_store.finish_session(message["session_id"], result)
+    sent = sum(1 for result in results if result["status"] == "success")
+    return {
+        "status": "success" if sent == len(results) else "partial" if sent else "error",
+        "personalization": personalized["mode"],
+        "generations": personalized["generations"],
+        "sent": sent,
+        "results": results
+    }
+
+# Deferred sends, batched per account
+scheduler = SendScheduler(_run_scheduled_batch)
+
+@app.post("/schedule-ai-email")
+async def schedule_ai_email(request: ScheduledEmailRequest,
+                            idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")):
+    """
+    Queue an AI email to be sent later; jobs for the same account are sent in one login.
+    A retry with the same idempotency key returns the job it queued instead of a second one.
+    """
+    if request.draft_id:
+        raise HTTPException(status_code=400, detail="Scheduled sends generate their content; draft_id is not supported")
+    if request.attachments:
+        raise HTTPException(status_code=400, detail="Scheduled sends do not support attachments")
+    if request.capture_mode or request.profile:
+        # Jobs run in shared batches, which use the server's capture mode and are not profiled
+        raise HTTPException(status_code=400, detail="Scheduled sends do not support capture_mode or profile")
+    key = request.idempotency_key or idempotency_key
+    if key:
+        existing = scheduler.store.get_by_idempotency_key(key)
+        if existing:
+            return {**existing, "idempotent_replay": True}
+    if request.session_id and (session_store.get_session(request.session_id)
+                               or scheduler.store.get_by_session(request.session_id)):
+        raise HTTPException(status_code=409, detail="Session id is already in use")
+    job = {
+        "job_id": str(uuid.uuid4()),
+        "session_id": request.session_id or str(uuid.uuid4()),
+        "gmail_id": request.gmail_id,
+        "recipient_email": request.recipient_email,
+        "user_prompt": request.user_prompt,
+        "send_at": request.send_at.timestamp(),
+        "idempotency_key": key,
+    }
+    record, created = scheduler.schedule(job, request.gmail_password)
+    return record if created else {**record, "idempotent_replay": True}
+
+@app.get("/scheduled")
+async def list_scheduled(gmail_id: Optional[str] = None):
+    """List scheduled jobs, optionally for one account"""
+    return scheduler.store.list(gmail_id)
+
+@app.get("/scheduled/{job_id}")
+async def get_scheduled(job_id: str):
+    """Look up a scheduled job"""
+    job = scheduler.store.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Scheduled job not found")
+    return job
+
+@app.delete("/scheduled/{job_id}")
+async def cancel_scheduled(job_id: str):
+    """Cancel a scheduled job that has not started yet"""
+    if not scheduler.cancel(job_id):
+        raise HTTPException(status_code=409, detail="Job not found or already started")
+    return scheduler.store.get(job_id)
+
+@app.get("/sessions/{session_id}")
+async def get_session(session_id: str):
+    """Look up the stored status and result of a send session"""
+    record = session_store.get_session(session_id)
+    if not record:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return record
+
+@app.get("/admin/profiles/{session_id}")
+async def get_profile(session_id: str, format: Literal["json", "folded"] = "json",
+                      admin_token: Optional[str] = Header(None, alias="X-Admin-Token")):
+    """Download the profile of a profiled send (json summary, or folded stacks for flame graphs)"""
+    require_admin(admin_token)
+    path = profile_path(session_id, format)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="No profile for this session")
+    media_type = "application/json" if format == "json" else "text/plain"
+    return FileResponse(path, media_type=media_type, filename=f"{session_id}_{PROFILE_FILES[format]}")
+
+@app.get("/metrics")
+async def metrics():
+    """Counters for monitoring"""
+    return {
+        "generation": generation_flight.stats(),
+        "drafts": draft_cache.stats(),
+        "attachments": attachment_store.stats(),
+        "ui_plan": ui_plans.stats(),
+        "routing": model_router.stats(),
+        "browsers": get_agent().driver_pool.stats() if _agent is not None else None,
+        "workers": worker_tier.stats() if worker_tier.enabled else None,
+        "scheduler": scheduler.stats(),
+        "websockets": manager.stats(),
+        "event_loop": loop_monitor.stats()
+    }
+
 @app.get("/health")
 async def health_check():
-    """Health check endpoint"""
-    return {"status": "healthy", "message": "AI Email Agent v2 is running"}
+    """Health check endpoint - ready only once the startup prewarm has finished"""
+    if not warmup_state["ready"]:
+        return JSONResponse(
+            status_code=503,
+            content={"status": "warming", "message": "AI Email Agent v2 is warming up", "warmup": warmup_state}
+        )
+    return {"status": "healthy", "message": "AI Email Agent v2 is running", "warmup": warmup_state}
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,160 @@
+"""
+Model and token-budget routing for AI Email Agent
+Picks the model, max_tokens and temperature of each Cohere call from the
+prompt's complexity and email type instead of fixed settings. A thank-you
+note gets the light model and a small budget, a cover letter gets the full
+model and room to write.
+
+The router learns from every call: an EWMA of latency per output token per
+model, and of output length per call kind and complexity tier. Budgets
+shrink to what the emails actually use, and the model is downgraded (or the
+budget trimmed) when the predicted latency would break the SLO.
+"""
+
+import os
+import re
+import logging
+import threading
+from typing import Dict, List
+
+logger = logging.getLogger(__name__)
+
+# "adaptive", or "fixed" for the original settings (command, 500/400 tokens) as a baseline
+MODEL_ROUTING = os.getenv("MODEL_ROUTING", "adaptive")
+GENERATION_SLO_MS = float(os.getenv("GENERATION_SLO_MS", "8000"))
+ROUTER_EWMA_ALPHA = float(os.getenv("ROUTER_EWMA_ALPHA", "0.2"))
+# Available models, most capable first
+ROUTER_MODELS = [m.strip() for m in os.getenv("ROUTER_MODELS", "command,command-light").split(",") if m.strip()]
+
+# Share of the SLO each call of a generation may use
+SLO_SHARE = {"interpret": 0.4, "generate": 0.6}
+
+FIXED_TOKENS = {"interpret": 500, "generate": 400}
+
+# Smallest budgets that still fit a complete answer (the interpretation is JSON)
+MIN_TOKENS = {"interpret": 150, "generate": 80}
+
+TIERS = {
+    "short": {"model": -1, "max_tokens": {"interpret": 250, "generate": 200}},
+    "standard": {"model": 0, "max_tokens": {"interpret": 400, "generate": 400}},
+    "detailed": {"model": 0, "max_tokens": {"interpret": 500, "generate": 700}},
+}
+
+EMAIL_TYPES = [
+    ("thank_you", r"\b(thank|thanks|grateful|appreciat)"),
+    ("apology", r"\b(sorry|apolog)"),
+    ("application", r"\b(internship|cover letter|apply|application|job|position|resume|cv)\b"),
+    ("follow_up", r"\b(follow[- ]?up|following up|checking in|reminder)\b"),
+    ("meeting", r"\b(meeting|schedule|call|appointment|calendar)\b"),
+    ("request", r"\b(request|ask|could you|would you|extension|permission)\b"),
+    ("announcement", r"\b(announce|launch|release|update)\b"),
+]
+
+DETAILED_TYPES = {"application"}
+CASUAL_TYPES = {"thank_you", "announcement"}
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about 4 tokens per 3 words)"""
+    return max(1, round(len((text or "").split()) * 4 / 3))
+
+
+def detect_email_type(prompt: str) -> str:
+    lowered = (prompt or "").lower()
+    for email_type, pattern in EMAIL_TYPES:
+        if re.search(pattern, lowered):
+            return email_type
+    return "general"
+
+
+def complexity_tier(prompt: str, email_type: str) -> str:
+    """short / standard / detailed from prompt length, structure and type"""
+    words = len((prompt or "").split())
+    details = len(re.findall(r"[,;:\n]|\band\b", prompt or ""))
+    if email_type in DETAILED_TYPES or words > 60 or details > 8:
+        return "detailed"
+    if words <= 12 and details <= 2:
+        return "short"
+    return "standard"
+
+
+class ModelRouter:
+    def __init__(self, models: List[str] = None, slo_ms: float = None, alpha: float = None,
+                 adaptive: bool = None):
+        self.models = models or ROUTER_MODELS
+        self.adaptive = adaptive if adaptive is not None else MODEL_ROUTING != "fixed"
+        self.slo_ms = slo_ms or GENERATION_SLO_MS
+        self.alpha = alpha or ROUTER_EWMA_ALPHA
+        self._latency: Dict[str, Dict] = {}   # model -> {"ms_per_token", "samples"}
+        self._output: Dict[tuple, Dict] = {}  # (kind, tier) -> {"tokens", "samples"}
+        self._routes: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _ewma(self, table: Dict, key, field: str, value: float):
+        entry = table.setdefault(key, {field: value, "samples": 0})
+        entry[field] = value if entry["samples"] == 0 else (1 - self.alpha) * entry[field] + self.alpha * value
+        entry["samples"] += 1
+
+    def route(self, kind: str, prompt: str, email_type: str = None) -> Dict:
+        """Choose model, max_tokens and temperature for one call (kind: interpret or generate)"""
+        email_type = email_type or detect_email_type(prompt)
+        if not self.adaptive:
+            with self._lock:
+                self._routes[f"{kind}:fixed"] = self._routes.get(f"{kind}:fixed", 0) + 1
+            return {"kind": kind, "model": self.models[0], "max_tokens": FIXED_TOKENS[kind],
+                    "temperature": 0.7, "tier": "fixed", "email_type": email_type}
+        tier = complexity_tier(prompt, email_type)
+        settings = TIERS[tier]
+        model_index = settings["model"] % len(self.models)
+        cap = settings["max_tokens"][kind]
+        floor = MIN_TOKENS[kind]
+
+        with self._lock:
+            # Budget: what this kind of email has needed so far, with headroom
+            output = self._output.get((kind, tier))
+            max_tokens = cap
+            if output and output["samples"] >= 3:
+                max_tokens = int(min(cap, max(floor, output["tokens"] * 1.5 + 16)))
+
+            # Keep the predicted latency within this call's share of the SLO
+            budget_ms = self.slo_ms * SLO_SHARE[kind]
+            for index in range(model_index, len(self.models)):
+                model_index = index
+                latency = self._latency.get(self.models[index])
+                if latency is None or latency["ms_per_token"] * max_tokens <= budget_ms:
+                    break
+            latency = self._latency.get(self.models[model_index])
+            if latency is not None and latency["ms_per_token"] * max_tokens > budget_ms:
+                max_tokens = max(floor, int(budget_ms / latency["ms_per_token"]))
+
+            model = self.models[model_index]
+            name = f"{kind}:{tier}:{model}"
+            self._routes[name] = self._routes.get(name, 0) + 1
+
+        return {
+            "kind": kind,
+            "model": model,
+            "max_tokens": max_tokens,
+            "temperature": 0.8 if email_type in CASUAL_TYPES else 0.5 if email_type in DETAILED_TYPES else 0.7,
+            "tier": tier,
+            "email_type": email_type,
+        }
+
+    def observe(self, route: Dict, latency_seconds: float, text: str):
+        """Learn from a finished call"""
+        tokens = estimate_tokens(text)
+        # Output cut off at the budget: the email wanted more than it got
+        needed = tokens * 1.25 if tokens >= route["max_tokens"] * 0.95 else tokens
+        with self._lock:
+            self._ewma(self._latency, route["model"], "ms_per_token", latency_seconds * 1000 / tokens)
+            self._ewma(self._output, (route["kind"], route["tier"]), "tokens", needed)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "adaptive": self.adaptive,
+                "slo_ms": self.slo_ms,
+                "models": {m: {k: round(v, 2) for k, v in e.items()} for m, e in self._latency.items()},
+                "output_tokens": {f"{k}:{t}": round(e["tokens"], 1) for (k, t), e in self._output.items()},
+                "routes": dict(self._routes),
+            }
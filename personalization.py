@@ -0,0 +1,65 @@
+"""
+Per-recipient personalization for AI Email Agent
+One generated draft with placeholders is rendered locally for each
+recipient, so sending a prompt to 100 people costs one LLM generation
+instead of 100.
+
+Placeholders: {{greeting}}, {{name}}, {{first_name}}, {{company}}, {{role}}
+"""
+
+import re
+import copy
+from typing import Dict
+
+PLACEHOLDER_PATTERN = re.compile(r"\{\{\s*(\w+)\s*\}\}")
+
+TEMPLATE_INSTRUCTION = (
+    "Write it once as a template for several recipients: start with {{greeting}} and use "
+    "{{name}}, {{company}} and {{role}} wherever recipient details belong."
+)
+
+# Text used when a recipient field was not supplied
+DEFAULTS = {"name": "there", "first_name": "there", "company": "your team", "role": "your role"}
+
+GREETING_LINE = re.compile(r"^\s*(dear|hello|hi|hey|greetings)\b[^\n]*,?[ \t]*\n", re.IGNORECASE)
+
+
+def templatize(content: Dict) -> Dict:
+    """Make a generated draft renderable: make sure the body opens with {{greeting}}"""
+    template = copy.deepcopy(content)
+    body = template.get("body", "")
+    if "{{greeting}}" not in body:
+        if GREETING_LINE.match(body):
+            body = GREETING_LINE.sub("{{greeting}}\n", body, count=1)
+        else:
+            body = "{{greeting}}\n\n" + body
+    template["body"] = body
+    return template
+
+
+def recipient_fields(recipient: Dict) -> Dict:
+    """Placeholder values for one recipient ({"email", "name", "company", "role"})"""
+    name = (recipient.get("name") or "").strip()
+    fields = {
+        "name": name,
+        "first_name": name.split()[0] if name else "",
+        "company": (recipient.get("company") or "").strip(),
+        "role": (recipient.get("role") or "").strip(),
+    }
+    fields = {key: value or DEFAULTS[key] for key, value in fields.items()}
+    fields["greeting"] = f"Dear {name}," if name else "Hello,"
+    return fields
+
+
+def render(template: Dict, recipient: Dict) -> Dict:
+    """Fill a template draft for one recipient"""
+    fields = recipient_fields(recipient)
+
+    def fill(text: str) -> str:
+        return PLACEHOLDER_PATTERN.sub(lambda m: fields.get(m.group(1).lower(), m.group(0)), text)
+
+    content = copy.deepcopy(template)
+    content["subject"] = fill(content.get("subject", ""))
+    content["body"] = fill(content.get("body", ""))
+    content["personalized_for"] = recipient.get("email")
+    return content
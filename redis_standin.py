@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Local Redis stand-in for AI Email Agent
+A tiny asyncio server implementing the part of the Redis protocol the
+backplane uses (PING, PUBLISH, SUBSCRIBE, PSUBSCRIBE and their UNSUBSCRIBE
+counterparts), so multi-worker streaming can be tested without Redis.
+
+Usage: python redis_standin.py --port 6379
+"""
+
+import asyncio
+import argparse
+import fnmatch
+import logging
+from typing import Dict, Set
+
+from backplane import read_reply
+
+logger = logging.getLogger(__name__)
+
+
+def _bulk(value) -> bytes:
+    if value is None:
+        return b"$-1\r\n"
+    if not isinstance(value, bytes):
+        value = str(value).encode("utf-8")
+    return f"${len(value)}\r\n".encode() + value + b"\r\n"
+
+
+def _array(*items) -> bytes:
+    encoded = [f":{item}\r\n".encode() if isinstance(item, int) else _bulk(item) for item in items]
+    return f"*{len(items)}\r\n".encode() + b"".join(encoded)
+
+
+class RedisStandIn:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.host = host
+        self.port = port
+        self.server = None
+        self.channels: Dict[bytes, Set[asyncio.StreamWriter]] = {}
+        self.patterns: Dict[bytes, Set[asyncio.StreamWriter]] = {}
+        self._client_tasks: Set[asyncio.Task] = set()
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle_client, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        logger.info("Redis stand-in listening on %s:%s", self.host, self.port)
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        # Let connected clients finish instead of being cancelled at loop shutdown
+        for writer in {w for registry in (self.channels, self.patterns) for ws in registry.values() for w in ws}:
+            writer.close()
+        if self._client_tasks:
+            await asyncio.wait(self._client_tasks, timeout=1)
+
+    @property
+    def url(self) -> str:
+        return f"redis://{self.host}:{self.port}/0"
+
+    def _subscription_count(self, writer) -> int:
+        return sum(writer in subs for subs in self.channels.values()) + \
+            sum(writer in subs for subs in self.patterns.values())
+
+    def _publish(self, channel: bytes, message: bytes) -> int:
+        receivers = 0
+        for writer in self.channels.get(channel, set()):
+            writer.write(_array(b"message", channel, message))
+            receivers += 1
+        for pattern, writers in self.patterns.items():
+            if fnmatch.fnmatchcase(channel.decode(), pattern.decode()):
+                for writer in writers:
+                    writer.write(_array(b"pmessage", pattern, channel, message))
+                    receivers += 1
+        return receivers
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        task = asyncio.current_task()
+        self._client_tasks.add(task)
+        try:
+            while True:
+                command = await read_reply(reader)
+                if not isinstance(command, list) or not command:
+                    writer.write(b"-ERR protocol error\r\n")
+                    continue
+                name, args = command[0].upper(), command[1:]
+                if name == b"PING":
+                    writer.write(b"+PONG\r\n")
+                elif name in (b"AUTH", b"SELECT"):
+                    writer.write(b"+OK\r\n")
+                elif name == b"PUBLISH":
+                    writer.write(f":{self._publish(args[0], args[1])}\r\n".encode())
+                elif name in (b"SUBSCRIBE", b"PSUBSCRIBE"):
+                    registry = self.channels if name == b"SUBSCRIBE" else self.patterns
+                    for target in args:
+                        registry.setdefault(target, set()).add(writer)
+                        writer.write(_array(name.lower(), target, self._subscription_count(writer)))
+                elif name in (b"UNSUBSCRIBE", b"PUNSUBSCRIBE"):
+                    registry = self.channels if name == b"UNSUBSCRIBE" else self.patterns
+                    for target in args or list(registry):
+                        registry.get(target, set()).discard(writer)
+                        writer.write(_array(name.lower(), target, self._subscription_count(writer)))
+                elif name == b"QUIT":
+                    writer.write(b"+OK\r\n")
+                    break
+                else:
+                    writer.write(f"-ERR unknown command '{name.decode()}'\r\n".encode())
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            for registry in (self.channels, self.patterns):
+                for writers in registry.values():
+                    writers.discard(writer)
+            writer.close()
+            self._client_tasks.discard(task)
+
+
+async def _serve(host: str, port: int):
+    standin = RedisStandIn(host, port)
+    await standin.start()
+    print(f"🔌 Redis stand-in listening on {standin.url}")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local Redis protocol stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6379)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_serve(args.host, args.port))
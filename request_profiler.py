@@ -0,0 +1,188 @@
+"""
+Opt-in request profiling for AI Email Agent
+Wraps one send in a sampling CPU profiler and tracemalloc snapshots, so a
+slow request can be profiled in production without restarting under a
+profiler. Only enabled when PROFILING_ADMIN_TOKEN is set; a request opts in
+with the X-Profile header and that token in X-Admin-Token.
+
+The sampler reads the stack of the thread running the send every
+PROFILE_INTERVAL_MS from a background thread, so the profiled code itself
+is not instrumented. Results are written per session to
+profiles/<session_id>/: profile.json (top functions, memory) and cpu.folded
+(collapsed stacks for flame graph tools).
+
+tracemalloc is process-wide: memory figures include other threads running
+at the same time. Content generation runs on a generation executor thread
+(GENERATION_OVERLAP), which is not sampled: its time shows in the trace as
+the generate_email_content span, and in the profile only as any draft.wait
+the send spent waiting for it.
+"""
+
+import os
+import re
+import sys
+import json
+import hmac
+import time
+import logging
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_MEMORY_FRAMES = int(os.getenv("PROFILE_MEMORY_FRAMES", "10"))
+TOP_ENTRIES = 30
+
+PROFILE_FILES = {"json": "profile.json", "folded": "cpu.folded"}
+
+_memory_lock = threading.Lock()
+_memory_users = 0
+_memory_started_here = False
+
+
+def profiling_enabled() -> bool:
+    return bool(os.getenv("PROFILING_ADMIN_TOKEN"))
+
+
+def check_admin_token(token: Optional[str]) -> bool:
+    expected = os.getenv("PROFILING_ADMIN_TOKEN")
+    return bool(expected and token) and hmac.compare_digest(expected, token)
+
+
+def profile_path(session_id: str, fmt: str = "json") -> str:
+    safe_id = re.sub(r"[^A-Za-z0-9_.-]", "_", session_id)
+    return os.path.join(PROFILE_DIR, safe_id, PROFILE_FILES[fmt])
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """Samples one thread's stack at a fixed interval"""
+
+    def __init__(self, thread_id: int = None, interval_ms: float = None):
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval = (interval_ms or PROFILE_INTERVAL_MS) / 1000
+        self.stacks: Dict[tuple, int] = {}
+        self.samples = 0
+        self.started = None
+        self.duration = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self.started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.duration = time.perf_counter() - self.started
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            key = tuple(reversed(stack))
+            self.stacks[key] = self.stacks.get(key, 0) + 1
+            self.samples += 1
+
+    def folded(self) -> str:
+        """Collapsed stacks, one "root;...;leaf count" line per distinct stack"""
+        return "\n".join(f"{';'.join(stack)} {count}" for stack, count in
+                         sorted(self.stacks.items(), key=lambda item: item[1], reverse=True)) + "\n"
+
+    def top_functions(self) -> Dict:
+        """Functions by samples where they were running (self) and on the stack (total)"""
+        own: Dict[str, int] = {}
+        total: Dict[str, int] = {}
+        for stack, count in self.stacks.items():
+            own[stack[-1]] = own.get(stack[-1], 0) + count
+            for label in set(stack):
+                total[label] = total.get(label, 0) + count
+
+        def top(counts):
+            return [{"function": label, "samples": count, "share": round(count / max(1, self.samples), 3)}
+                    for label, count in sorted(counts.items(), key=lambda item: item[1], reverse=True)[:TOP_ENTRIES]]
+
+        return {"self": top(own), "total": top(total)}
+
+
+def _start_memory():
+    global _memory_users, _memory_started_here
+    with _memory_lock:
+        if _memory_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(PROFILE_MEMORY_FRAMES)
+            _memory_started_here = True
+        _memory_users += 1
+
+
+def _stop_memory():
+    global _memory_users, _memory_started_here
+    with _memory_lock:
+        _memory_users -= 1
+        if _memory_users == 0 and _memory_started_here:
+            tracemalloc.stop()
+            _memory_started_here = False
+
+
+def _memory_report(before, after, peak: int) -> Dict:
+    diff = after.compare_to(before, "lineno")
+    return {
+        "peak_bytes": peak,
+        "net_bytes": sum(stat.size_diff for stat in diff),
+        "top_allocations": [
+            {"location": str(stat.traceback[0]), "size_diff": stat.size_diff, "count_diff": stat.count_diff}
+            for stat in diff[:TOP_ENTRIES] if stat.size_diff > 0
+        ],
+    }
+
+
+@contextmanager
+def profile_session(session_id: str):
+    """Profile the code run in this block on the current thread and store the result for session_id"""
+    _start_memory()
+    tracemalloc.reset_peak()
+    before = tracemalloc.take_snapshot()
+    profiler = SamplingProfiler()
+    profiler.start()
+    try:
+        yield profiler
+    finally:
+        profiler.stop()
+        try:
+            _, peak = tracemalloc.get_traced_memory()
+            after = tracemalloc.take_snapshot()
+            report = {
+                "session_id": session_id,
+                "created_at": time.time(),
+                "duration_seconds": round(profiler.duration, 3),
+                "interval_ms": profiler.interval * 1000,
+                "samples": profiler.samples,
+                "cpu": profiler.top_functions(),
+                "memory": _memory_report(before, after, peak),
+            }
+            path = profile_path(session_id)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(report, f)
+            with open(profile_path(session_id, "folded"), "w", encoding="utf-8") as f:
+                f.write(profiler.folded())
+            logger.info("Stored profile for session %s (%d samples)", session_id, profiler.samples)
+        except Exception as e:
+            logger.error("Could not store profile for session %s: %s", session_id, e)
+        finally:
+            _stop_memory()
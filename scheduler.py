@@ -0,0 +1,300 @@
+"""
+Scheduled sends for AI Email Agent
+Deferred /send-ai-email jobs are persisted in SQLite and ordered in an
+in-memory heap by send time. When a job comes due, it is held until the
+other pending jobs for the same gmail_id that fall due within the batch
+window (counted from the account's earliest pending job) are due as well,
+and they all run together, so a morning batch of emails costs one browser
+login instead of one each. Jobs are never sent before their send time and
+at most the batch window after it.
+
+Passwords are only held in memory. Jobs that survive a restart without
+their credentials are marked failed instead of being silently dropped, as
+are jobs that were running when the server stopped.
+"""
+
+import os
+import json
+import time
+import heapq
+import sqlite3
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_WINDOW = 300
+
+# runner(gmail_id, gmail_password, jobs) -> one result dict per job, in order
+BatchRunner = Callable[[str, str, List[Dict]], List[Dict]]
+
+
+class ScheduleStore:
+    def __init__(self, db_path: str = None):
+        """Open (or create) the scheduled job table"""
+        self.db_path = db_path or os.getenv("SESSION_DB_PATH", "sessions.db")
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS scheduled_jobs (
+                    job_id TEXT PRIMARY KEY,
+                    session_id TEXT NOT NULL,
+                    gmail_id TEXT NOT NULL,
+                    recipient_email TEXT NOT NULL,
+                    user_prompt TEXT NOT NULL,
+                    send_at REAL NOT NULL,
+                    status TEXT NOT NULL,
+                    batch_id TEXT,
+                    created_at REAL NOT NULL,
+                    finished_at REAL,
+                    result TEXT,
+                    idempotency_key TEXT
+                )
+                """
+            )
+            columns = [row["name"] for row in self._conn.execute("PRAGMA table_info(scheduled_jobs)")]
+            if "idempotency_key" not in columns:
+                # Databases created before scheduled jobs took idempotency keys
+                self._conn.execute("ALTER TABLE scheduled_jobs ADD COLUMN idempotency_key TEXT")
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS scheduled_jobs_due ON scheduled_jobs (status, send_at)"
+            )
+            self._conn.execute(
+                "CREATE UNIQUE INDEX IF NOT EXISTS scheduled_jobs_key ON scheduled_jobs (idempotency_key)"
+            )
+
+    def add(self, job: Dict) -> Tuple[Dict, bool]:
+        """
+        Insert a pending job. Returns (record, created); with an idempotency key
+        that an earlier job already holds, that job is returned instead.
+        """
+        with self._lock, self._conn:
+            key = job.get("idempotency_key")
+            if key:
+                row = self._conn.execute("SELECT * FROM scheduled_jobs WHERE idempotency_key = ?", (key,)).fetchone()
+                if row is not None:
+                    return self._row_to_dict(row), False
+            self._conn.execute(
+                """
+                INSERT INTO scheduled_jobs
+                (job_id, session_id, gmail_id, recipient_email, user_prompt, send_at, status, created_at,
+                 idempotency_key)
+                VALUES (?, ?, ?, ?, ?, ?, 'pending', ?, ?)
+                """,
+                (job["job_id"], job["session_id"], job["gmail_id"], job["recipient_email"],
+                 job["user_prompt"], job["send_at"], time.time(), key),
+            )
+            row = self._conn.execute("SELECT * FROM scheduled_jobs WHERE job_id = ?", (job["job_id"],)).fetchone()
+            return self._row_to_dict(row), True
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM scheduled_jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return self._row_to_dict(row) if row else None
+
+    def get_by_idempotency_key(self, idempotency_key: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM scheduled_jobs WHERE idempotency_key = ?", (idempotency_key,)
+            ).fetchone()
+        return self._row_to_dict(row) if row else None
+
+    def get_by_session(self, session_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM scheduled_jobs WHERE session_id = ?", (session_id,)).fetchone()
+        return self._row_to_dict(row) if row else None
+
+    def pending(self) -> List[Dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM scheduled_jobs WHERE status = 'pending' ORDER BY send_at"
+            ).fetchall()
+        return [self._row_to_dict(row) for row in rows]
+
+    def running(self) -> List[Dict]:
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM scheduled_jobs WHERE status = 'running'").fetchall()
+        return [self._row_to_dict(row) for row in rows]
+
+    def pending_for_account(self, gmail_id: str, due_before: float) -> List[Dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM scheduled_jobs WHERE status = 'pending' AND gmail_id = ? AND send_at <= ? ORDER BY send_at",
+                (gmail_id, due_before),
+            ).fetchall()
+        return [self._row_to_dict(row) for row in rows]
+
+    def list(self, gmail_id: str = None) -> List[Dict]:
+        query, params = "SELECT * FROM scheduled_jobs", ()
+        if gmail_id:
+            query, params = query + " WHERE gmail_id = ?", (gmail_id,)
+        with self._lock:
+            rows = self._conn.execute(query + " ORDER BY send_at", params).fetchall()
+        return [self._row_to_dict(row) for row in rows]
+
+    def set_status(self, job_ids: List[str], status: str, batch_id: str = None, only_if: str = None) -> int:
+        """Update job status; with only_if, only jobs currently in that status change"""
+        if not job_ids:
+            return 0
+        placeholders = ",".join("?" * len(job_ids))
+        query = f"UPDATE scheduled_jobs SET status = ?, batch_id = COALESCE(?, batch_id) WHERE job_id IN ({placeholders})"
+        params = [status, batch_id, *job_ids]
+        if only_if:
+            query += " AND status = ?"
+            params.append(only_if)
+        with self._lock, self._conn:
+            return self._conn.execute(query, params).rowcount
+
+    def finish(self, job_id: str, result: Dict):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE scheduled_jobs SET status = ?, finished_at = ?, result = ? WHERE job_id = ?",
+                (result.get("status", "error"), time.time(), json.dumps(result, default=str), job_id),
+            )
+
+    @staticmethod
+    def _row_to_dict(row: sqlite3.Row) -> Dict:
+        record = dict(row)
+        if record.get("result"):
+            record["result"] = json.loads(record["result"])
+        return record
+
+
+class SendScheduler:
+    def __init__(self, runner: BatchRunner, store: ScheduleStore = None,
+                 batch_window: float = None, max_workers: int = None):
+        self.runner = runner
+        self.store = store or ScheduleStore()
+        self.batch_window = batch_window if batch_window is not None else float(
+            os.getenv("SCHEDULER_BATCH_WINDOW", DEFAULT_BATCH_WINDOW)
+        )
+        self._heap: List = []  # (send_at, job_id)
+        self._credentials: Dict[str, str] = {}
+        self._condition = threading.Condition()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers or int(os.getenv("SCHEDULER_WORKERS", "2")),
+            thread_name_prefix="scheduled-send"
+        )
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = False
+        self.batches_run = 0
+        self.jobs_run = 0
+
+    def start(self):
+        """Fail jobs interrupted by a restart, load pending jobs and start the dispatch thread"""
+        for job in self.store.running():
+            self.store.finish(job["job_id"], {
+                "status": "error",
+                "message": "Interrupted by a server restart before it finished; please reschedule",
+                "session_id": job["session_id"]
+            })
+        for job in self.store.pending():
+            heapq.heappush(self._heap, (job["send_at"], job["job_id"]))
+        self._thread = threading.Thread(target=self._loop, name="send-scheduler", daemon=True)
+        self._thread.start()
+        logger.info("Scheduler started with %s pending jobs", len(self._heap))
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self._executor.shutdown(wait=False)
+
+    def schedule(self, job: Dict, gmail_password: str) -> Tuple[Dict, bool]:
+        """
+        Persist a job and wake the dispatcher if it is now the earliest.
+        Returns (record, created); a repeated idempotency key returns the earlier job.
+        """
+        record, created = self.store.add(job)
+        if not created:
+            return record, False
+        with self._condition:
+            self._credentials[job["job_id"]] = gmail_password
+            heapq.heappush(self._heap, (job["send_at"], job["job_id"]))
+            self._condition.notify()
+        return record, True
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancel a job that has not started yet"""
+        cancelled = self.store.set_status([job_id], "cancelled", only_if="pending") == 1
+        if cancelled:
+            with self._condition:
+                self._credentials.pop(job_id, None)
+        return cancelled
+
+    def _loop(self):
+        while True:
+            with self._condition:
+                while not self._stopped:
+                    if self._heap and self._heap[0][0] <= time.time():
+                        break
+                    timeout = self._heap[0][0] - time.time() if self._heap else None
+                    self._condition.wait(timeout)
+                if self._stopped:
+                    return
+                _, job_id = heapq.heappop(self._heap)
+            job = self.store.get(job_id)
+            if job is None or job["status"] != "pending":
+                continue  # cancelled, or already pulled into an earlier batch
+            self._dispatch(job)
+
+    def _dispatch(self, job: Dict):
+        """Run the account's due jobs together, once the jobs falling due within the window are due too"""
+        due = self.store.pending_for_account(job["gmail_id"], time.time())
+        if not due:
+            return
+        # The window counts from the earliest pending job, so none waits longer than the window
+        window = self.store.pending_for_account(job["gmail_id"], due[0]["send_at"] + self.batch_window)
+        if len(window) > len(due):
+            with self._condition:
+                heapq.heappush(self._heap, (window[-1]["send_at"], job["job_id"]))
+            return
+        claimed = [c for c in due if self.store.set_status([c["job_id"]], "running", only_if="pending")]
+        if not claimed:
+            return
+        # Jobs scheduled with different passwords are sent in separate sessions
+        groups: Dict[Optional[str], List[Dict]] = {}
+        with self._condition:
+            for c in claimed:
+                groups.setdefault(self._credentials.pop(c["job_id"], None), []).append(c)
+        for password, jobs in groups.items():
+            if password is None:
+                for c in jobs:
+                    self.store.finish(c["job_id"], {
+                        "status": "error",
+                        "message": "Credentials are no longer available (server restarted); please reschedule",
+                        "session_id": c["session_id"]
+                    })
+                continue
+            batch_id = jobs[0]["job_id"]
+            self.store.set_status([c["job_id"] for c in jobs], "running", batch_id)
+            logger.info("Running batch %s with %s scheduled emails", batch_id, len(jobs))
+            self._executor.submit(self._run_batch, job["gmail_id"], password, jobs)
+
+    def _run_batch(self, gmail_id: str, gmail_password: str, jobs: List[Dict]):
+        try:
+            results = self.runner(gmail_id, gmail_password, jobs)
+        except Exception as e:
+            logger.error("Scheduled batch failed: %s", e)
+            results = [{"status": "error", "message": str(e), "session_id": job["session_id"]} for job in jobs]
+        for job, result in zip(jobs, results):
+            self.store.finish(job["job_id"], result)
+        self.batches_run += 1
+        self.jobs_run += len(jobs)
+
+    def stats(self) -> Dict:
+        with self._condition:
+            queued = len(self._heap)
+        return {
+            "queued": queued,
+            "batches_run": self.batches_run,
+            "jobs_run": self.jobs_run,
+            "batch_window_seconds": self.batch_window,
+        }
@@ -0,0 +1,143 @@
+"""
+DevTools screencast capture for AI Email Agent
+Subscribes to Chrome's Page.startScreencast over a side-channel DevTools
+connection (running on its own thread), so the automation thread never
+blocks on a full-page capture. Frames are throttled to a target fps, tagged
+with the session and step that were running and kept as a visual timeline;
+the latest frame doubles as the keyframe for each step. A batch records all
+its messages on one recorder, bound to each message's session in turn.
+"""
+
+import os
+import time
+import base64
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+SCREENCAST_FPS = float(os.getenv("SCREENCAST_FPS", "2"))
+SCREENCAST_MAX_WIDTH = int(os.getenv("SCREENCAST_MAX_WIDTH", "960"))
+SCREENCAST_MAX_HEIGHT = int(os.getenv("SCREENCAST_MAX_HEIGHT", "540"))
+SCREENCAST_QUALITY = int(os.getenv("SCREENCAST_QUALITY", "60"))
+
+
+class ScreencastRecorder:
+    def __init__(self, driver, ctx, fps: float = None, max_width: int = None, max_height: int = None,
+                 quality: int = None, output_dir: str = "screenshots"):
+        self.driver = driver
+        self.ctx = ctx
+        self.fps = fps or SCREENCAST_FPS
+        self.max_width = max_width or SCREENCAST_MAX_WIDTH
+        self.max_height = max_height or SCREENCAST_MAX_HEIGHT
+        self.quality = quality or SCREENCAST_QUALITY
+        self.output_dir = output_dir
+        self.frames: List[Dict] = []
+        self.latest_frame: Optional[bytes] = None
+        self.received = 0
+        self.error: Optional[str] = None
+        self._started_at = time.monotonic()
+        self._last_kept = 0.0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._ready = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, timeout: float = 5) -> bool:
+        """Start recording; returns False if the screencast could not be opened"""
+        self._thread = threading.Thread(target=self._run, name=f"screencast-{self.ctx.session_id}", daemon=True)
+        self._thread.start()
+        self._ready.wait(timeout)
+        return self.error is None and self._ready.is_set()
+
+    def stop(self, timeout: float = 5):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def bind(self, ctx):
+        """Tag the following frames with another session (the next message of a batch)"""
+        with self._lock:
+            self.ctx = ctx
+
+    def session_frames(self, session_id: str) -> List[Dict]:
+        """The frames recorded while session_id was bound"""
+        return [frame for frame in self.frames if frame["session_id"] == session_id]
+
+    @property
+    def active(self) -> bool:
+        return self._ready.is_set() and not self._stop.is_set() and self.error is None
+
+    def _run(self):
+        try:
+            import trio
+            trio.run(self._record)
+        except Exception as e:
+            self.error = str(e)
+            logger.warning("Screencast stopped for session %s: %s", self.ctx.session_id, e)
+        finally:
+            self._ready.set()
+
+    async def _record(self):
+        import trio
+        async with self.driver.bidi_connection() as connection:
+            session, devtools = connection.session, connection.devtools
+            await session.execute(devtools.page.start_screencast(
+                format_="jpeg", quality=self.quality,
+                max_width=self.max_width, max_height=self.max_height
+            ))
+            self._ready.set()
+            async with trio.open_nursery() as nursery:
+                nursery.start_soon(self._watch_stop, nursery.cancel_scope)
+                async for frame in session.listen(devtools.page.ScreencastFrame):
+                    # Chrome stops sending frames until each one is acknowledged
+                    await session.execute(devtools.page.screencast_frame_ack(frame.session_id))
+                    self._on_frame(frame.data)
+            with trio.move_on_after(1):
+                await session.execute(devtools.page.stop_screencast())
+
+    async def _watch_stop(self, cancel_scope):
+        import trio
+        while not self._stop.is_set():
+            await trio.sleep(0.1)
+        cancel_scope.cancel()
+
+    def _on_frame(self, data: str):
+        """Keep at most fps frames per second, tagged with the current step"""
+        self.received += 1
+        now = time.monotonic()
+        image = base64.b64decode(data)
+        with self._lock:
+            self.latest_frame = image
+            ctx = self.ctx
+        if now - self._last_kept < 1.0 / self.fps:
+            return
+        self._last_kept = now
+
+        index = len(self.frames)
+        filename = f"{ctx.session_id}_frame_{index:05d}.jpg"
+        with open(os.path.join(self.output_dir, filename), "wb") as f:
+            f.write(image)
+        self.frames.append({
+            "filename": filename,
+            "session_id": ctx.session_id,
+            "step": ctx.current_step,
+            "offset_ms": round((now - self._started_at) * 1000),
+            "timestamp": datetime.now().strftime("%Y%m%d_%H%M%S"),
+            "url": f"/screenshots/{filename}",
+        })
+
+    def save_keyframe(self, filepath: str) -> bool:
+        """Write the most recent frame to filepath without touching the driver"""
+        with self._lock:
+            image = self.latest_frame
+        if image is None:
+            return False
+        with open(filepath, "wb") as f:
+            f.write(image)
+        return True
+
+    def stats(self) -> Dict:
+        return {"received": self.received, "kept": len(self.frames), "fps": self.fps, "error": self.error}
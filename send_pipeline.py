@@ -0,0 +1,174 @@
+"""
+Pipelined sending for AI Email Agent
+In a batch, each message normally ends with a Send click followed by fixed
+pauses before the next compose window is opened, and nothing checks that
+Gmail actually finished sending. In pipelined mode (SEND_PIPELINE=1, or
+pipelined=True for one batch) the send step only clicks Send: the next
+compose window is opened and filled while Gmail is still sending the
+previous message, in the same logged-in tab.
+
+Delivery is confirmed in the background. A MutationObserver installed in the
+page counts "Message sent" toasts (the plan's sent_toast field), and a
+DeliveryConfirmer thread reads that count with one script call per poll and
+confirms the clicked sends in order: Gmail sends messages in click order,
+so the n-th toast confirms the n-th click. Sends with no toast within
+PIPELINE_CONFIRM_TIMEOUT are looked up in the Sent folder once the batch has
+finished.
+"""
+
+import os
+import time
+import logging
+import threading
+from collections import deque
+from typing import Dict, List, Optional
+from urllib.parse import quote
+
+logger = logging.getLogger(__name__)
+
+# Pipeline batches by default (per-batch pipelined= overrides it)
+SEND_PIPELINE = os.getenv("SEND_PIPELINE", "0") == "1"
+PIPELINE_CONFIRM_INTERVAL = float(os.getenv("PIPELINE_CONFIRM_INTERVAL", "0.25"))
+# Seconds from the Send click to the toast before the Sent folder is checked instead
+PIPELINE_CONFIRM_TIMEOUT = float(os.getenv("PIPELINE_CONFIRM_TIMEOUT", "60"))
+
+SENT_SEARCH_URL = "https://mail.google.com/mail/u/0/#search/"
+
+# Installs the toast counter once per page and returns [page id, toasts counted].
+# A toast is counted when an element matching the selector starts showing one
+# of the texts; Gmail reuses the toast element, so each element's last state is
+# remembered, and only the outermost matching element of a toast is looked at.
+SENT_TOAST_SCRIPT = """
+const [selector, texts] = arguments;
+let state = window.__aiEmailSent;
+if (!state) {
+    state = window.__aiEmailSent = {id: Math.random().toString(36).slice(2), count: 0, shown: new WeakMap()};
+    const scan = (counting) => {
+        document.querySelectorAll(selector).forEach((el) => {
+            if (el.parentElement && el.parentElement.closest(selector)) {
+                return;
+            }
+            const text = el.textContent || '';
+            const sent = texts.some((t) => text.includes(t));
+            if (sent && counting && !state.shown.get(el)) {
+                state.count += 1;
+            }
+            state.shown.set(el, sent);
+        });
+    };
+    new MutationObserver(() => scan(true)).observe(document.body, {childList: true, subtree: true, characterData: true});
+    scan(false);
+}
+return [state.id, state.count];
+"""
+
+
+def sent_search_url(recipient_email: str, subject: str) -> str:
+    """Gmail search for a sent message by recipient and subject"""
+    query = f'in:sent to:{recipient_email} subject:"{subject.replace(chr(34), "")}"'
+    return SENT_SEARCH_URL + quote(query, safe="")
+
+
+class DeliveryConfirmer:
+    """
+    Confirms clicked sends from the page's "Message sent" toasts, in click
+    order. Each confirmation is recorded on the session (ctx.delivery) and as
+    a delivery.confirm span from the click to the toast.
+    """
+
+    def __init__(self, driver, toast, interval: float = None, timeout: float = None):
+        self.driver = driver
+        self.selector = toast.css_group
+        self.texts = list(toast.text)
+        self.interval = interval or PIPELINE_CONFIRM_INTERVAL
+        self.timeout = timeout or PIPELINE_CONFIRM_TIMEOUT
+        self.pending = deque()
+        self.unconfirmed: List = []
+        self.counts = {"clicked": 0, "confirmed": 0, "timed_out": 0, "polls": 0}
+        self._page_id = None
+        self._seen = 0
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        # The counter is installed before the first click, so no toast is missed
+        self.poll()
+        self._thread = threading.Thread(target=self._run, name="delivery-confirmer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval * 2 + 1)
+
+    def expect(self, ctx):
+        """Register a send just before its click, so a fast toast cannot arrive first"""
+        span = ctx.trace.start_span(ctx.trace.root, "delivery.confirm", "wait", {})
+        with self._cond:
+            self.pending.append((ctx, time.perf_counter(), span))
+            self.counts["clicked"] += 1
+
+    def cancel(self, ctx):
+        """The click failed: nothing is being sent for ctx"""
+        with self._cond:
+            for item in list(self.pending):
+                if item[0] is ctx:
+                    self.pending.remove(item)
+                    item[2].set(confirmed=False)
+                    item[2].end = time.perf_counter()
+                    self.counts["clicked"] -= 1
+            self._cond.notify_all()
+
+    def poll(self):
+        """Read the page's toast count once and confirm or time out pending sends"""
+        result = self.driver.execute_script(SENT_TOAST_SCRIPT, self.selector, self.texts)
+        page_id, count = result if result else (None, 0)
+        now = time.perf_counter()
+        with self._cond:
+            self.counts["polls"] += 1
+            if page_id != self._page_id:
+                # First poll, or the page was reloaded: its counter starts from zero
+                self._page_id, self._seen = page_id, 0
+            new = max(count - self._seen, 0)
+            self._seen = max(count, self._seen)
+            while new and self.pending:
+                ctx, clicked_at, span = self.pending.popleft()
+                self._finish(ctx, span, now, {"confirmed": True, "via": "toast",
+                                              "seconds": round(now - clicked_at, 3)})
+                self.counts["confirmed"] += 1
+                new -= 1
+            while self.pending and now - self.pending[0][1] > self.timeout:
+                ctx, clicked_at, span = self.pending.popleft()
+                self._finish(ctx, span, now, {"confirmed": False, "via": None,
+                                              "seconds": round(now - clicked_at, 3)})
+                self.unconfirmed.append(ctx)
+                self.counts["timed_out"] += 1
+            self._cond.notify_all()
+
+    def _finish(self, ctx, span, now: float, delivery: Dict):
+        ctx.delivery = delivery
+        span.set(**delivery)
+        span.end = now
+
+    def drain(self, timeout: float = None) -> List:
+        """Wait until every clicked send is confirmed or timed out; returns all sessions left unconfirmed so far"""
+        deadline = time.monotonic() + (timeout or self.timeout + self.interval * 4 + 1)
+        with self._cond:
+            while self.pending and time.monotonic() < deadline:
+                self._cond.wait(timeout=min(self.interval, max(deadline - time.monotonic(), 0)))
+            for ctx, clicked_at, span in self.pending:
+                now = time.perf_counter()
+                self._finish(ctx, span, now, {"confirmed": False, "via": None, "seconds": round(now - clicked_at, 3)})
+                self.unconfirmed.append(ctx)
+                self.counts["timed_out"] += 1
+            self.pending.clear()
+            return list(self.unconfirmed)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.poll()
+            except Exception as e:
+                # Navigation in progress or browser closing - try again next tick
+                logger.debug("Delivery confirmation poll failed: %s", e)
@@ -0,0 +1,240 @@
+"""
+Durable session store for AI Email Agent
+Keeps every send session in an embedded SQLite database so that a client
+retrying with the same idempotency key gets the stored result back instead
+of running the whole browser automation (and sending the email) again.
+Generated drafts are kept here too, so they can be reviewed, edited and
+sent (or resent) later without generating them again.
+"""
+
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import logging
+import threading
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Sessions stuck in "running" for longer than this are treated as abandoned
+# (e.g. the server was restarted mid-send) and may be claimed again.
+DEFAULT_STALE_SECONDS = 600
+
+
+def request_fingerprint(payload: Dict) -> str:
+    """Stable hash of a request body, stored with its idempotency key to spot a key reused for another request"""
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class SessionStore:
+    def __init__(self, db_path: str = None, stale_seconds: float = None):
+        """Open (or create) the SQLite session database"""
+        self.db_path = db_path or os.getenv("SESSION_DB_PATH", "sessions.db")
+        self.stale_seconds = stale_seconds if stale_seconds is not None else float(
+            os.getenv("SESSION_STALE_SECONDS", DEFAULT_STALE_SECONDS)
+        )
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        if self.db_path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        self._create_tables()
+
+    def _create_tables(self):
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS sessions (
+                    session_id TEXT PRIMARY KEY,
+                    idempotency_key TEXT UNIQUE,
+                    status TEXT NOT NULL,
+                    message TEXT,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL,
+                    email_content TEXT,
+                    screenshots TEXT,
+                    response TEXT,
+                    request_hash TEXT
+                )
+                """
+            )
+            columns = [row["name"] for row in self._conn.execute("PRAGMA table_info(sessions)")]
+            if "request_hash" not in columns:
+                # Databases created before idempotency keys were tied to their request body
+                self._conn.execute("ALTER TABLE sessions ADD COLUMN request_hash TEXT")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS drafts (
+                    draft_id TEXT PRIMARY KEY,
+                    user_prompt TEXT NOT NULL,
+                    recipient_email TEXT,
+                    email_content TEXT NOT NULL,
+                    edited INTEGER NOT NULL DEFAULT 0,
+                    send_count INTEGER NOT NULL DEFAULT 0,
+                    last_session_id TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+                """
+            )
+
+    def claim(self, idempotency_key: str, session_id: str, request_hash: str = None) -> Tuple[Dict, bool]:
+        """
+        Atomically reserve an idempotency key for a new session.
+        Returns (record, created). When created is False the record belongs to
+        an earlier request with the same key; compare its request_hash to tell
+        a retry from a different request reusing the key.
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT * FROM sessions WHERE idempotency_key = ?", (idempotency_key,)
+            ).fetchone()
+            if row is not None:
+                existing = self._row_to_dict(row)
+                started = existing["started_at"] or existing["created_at"]
+                if existing["status"] in ("pending", "running") and now - started > self.stale_seconds:
+                    # Abandoned session - release the key so this request can run
+                    logger.warning("Reclaiming stale session %s for idempotency key", existing['session_id'])
+                    self._conn.execute(
+                        "UPDATE sessions SET idempotency_key = NULL, status = 'abandoned' WHERE session_id = ?",
+                        (existing["session_id"],),
+                    )
+                else:
+                    return existing, False
+
+            self._conn.execute(
+                "INSERT INTO sessions (session_id, idempotency_key, status, created_at, request_hash) "
+                "VALUES (?, ?, 'pending', ?, ?)",
+                (session_id, idempotency_key, now, request_hash),
+            )
+            row = self._conn.execute("SELECT * FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+            return self._row_to_dict(row), True
+
+    def create_session(self, session_id: str) -> Dict:
+        """Record a new session that was not submitted with an idempotency key"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO sessions (session_id, status, created_at) VALUES (?, 'pending', ?)",
+                (session_id, time.time()),
+            )
+            row = self._conn.execute("SELECT * FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+            return self._row_to_dict(row)
+
+    def mark_running(self, session_id: str):
+        """Mark a session as started"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE sessions SET status = 'running', started_at = ? WHERE session_id = ?",
+                (time.time(), session_id),
+            )
+
+    def claim_resume(self, session_id: str) -> bool:
+        """Mark a finished session as running again; False if it is already running"""
+        with self._lock, self._conn:
+            return self._conn.execute(
+                "UPDATE sessions SET status = 'running', started_at = ? "
+                "WHERE session_id = ? AND status NOT IN ('pending', 'running')",
+                (time.time(), session_id),
+            ).rowcount == 1
+
+    def finish_session(self, session_id: str, response: Dict):
+        """Store the final API response for a session"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                UPDATE sessions
+                SET status = ?, message = ?, finished_at = ?,
+                    email_content = ?, screenshots = ?, response = ?
+                WHERE session_id = ?
+                """,
+                (
+                    response.get("status", "error"),
+                    response.get("message"),
+                    time.time(),
+                    json.dumps(response.get("email_content")),
+                    json.dumps(response.get("screenshots", [])),
+                    json.dumps(response, default=str),
+                    session_id,
+                ),
+            )
+
+    def get_session(self, session_id: str) -> Optional[Dict]:
+        """Look up a session by id"""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        return self._row_to_dict(row) if row else None
+
+    def get_by_idempotency_key(self, idempotency_key: str) -> Optional[Dict]:
+        """Look up a session by the idempotency key it was submitted with"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM sessions WHERE idempotency_key = ?", (idempotency_key,)
+            ).fetchone()
+        return self._row_to_dict(row) if row else None
+
+    def create_draft(self, draft_id: str, user_prompt: str, recipient_email: Optional[str],
+                     email_content: Dict) -> Dict:
+        """Store a generated draft"""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO drafts (draft_id, user_prompt, recipient_email, email_content, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (draft_id, user_prompt, recipient_email, json.dumps(email_content), now, now),
+            )
+            row = self._conn.execute("SELECT * FROM drafts WHERE draft_id = ?", (draft_id,)).fetchone()
+            return self._draft_to_dict(row)
+
+    def get_draft(self, draft_id: str) -> Optional[Dict]:
+        """Look up a draft by id"""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM drafts WHERE draft_id = ?", (draft_id,)).fetchone()
+        return self._draft_to_dict(row) if row else None
+
+    def update_draft(self, draft_id: str, changes: Dict) -> Optional[Dict]:
+        """Apply edits (subject, body, ...) to a draft's content; None if there is no such draft"""
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT * FROM drafts WHERE draft_id = ?", (draft_id,)).fetchone()
+            if row is None:
+                return None
+            email_content = {**json.loads(row["email_content"]), **changes}
+            self._conn.execute(
+                "UPDATE drafts SET email_content = ?, edited = 1, updated_at = ? WHERE draft_id = ?",
+                (json.dumps(email_content), time.time(), draft_id),
+            )
+            row = self._conn.execute("SELECT * FROM drafts WHERE draft_id = ?", (draft_id,)).fetchone()
+            return self._draft_to_dict(row)
+
+    def record_draft_send(self, draft_id: str, session_id: str):
+        """Count a send of a draft"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE drafts SET send_count = send_count + 1, last_session_id = ? WHERE draft_id = ?",
+                (session_id, draft_id),
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    @staticmethod
+    def _row_to_dict(row: sqlite3.Row) -> Dict:
+        record = dict(row)
+        for field in ("email_content", "screenshots", "response"):
+            if record.get(field):
+                record[field] = json.loads(record[field])
+        started = record.get("started_at")
+        finished = record.get("finished_at")
+        record["duration_seconds"] = round(finished - started, 3) if started and finished else None
+        return record
+
+    @staticmethod
+    def _draft_to_dict(row: sqlite3.Row) -> Dict:
+        record = dict(row)
+        record["email_content"] = json.loads(record["email_content"])
+        record["edited"] = bool(record["edited"])
+        return record
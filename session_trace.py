@@ -0,0 +1,172 @@
+"""
+Per-session tracing for AI Email Agent
+Each send records a span tree: LLM calls, browser acquire/start, every step,
+every selector wait, pauses and screenshots. The active span lives in a
+context variable, so code deep in the agent opens child spans with span()
+without the session being passed down; outside an active trace span() does
+nothing.
+
+The finished tree is written as <session_id>_trace.json next to the
+screenshots, and a summary (time per kind, slowest spans and a flattened
+waterfall) goes into the send response.
+"""
+
+import os
+import re
+import json
+import time
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+TRACE_DIR = os.getenv("TRACE_DIR", "screenshots")
+TRACE_EXPORT = os.getenv("TRACE_EXPORT", "1") != "0"
+# Spans listed in the response waterfall (the exported file has all of them)
+WATERFALL_LIMIT = 150
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar("trace_span", default=None)
+
+
+class Span:
+    __slots__ = ("trace", "name", "kind", "attrs", "start", "end", "children", "status", "error")
+
+    def __init__(self, trace: "Trace", name: str, kind: str, attrs: Dict):
+        self.trace = trace
+        self.name = name
+        self.kind = kind
+        self.attrs = attrs
+        self.start = time.perf_counter()
+        self.end: Optional[float] = None
+        self.children: List["Span"] = []
+        self.status = "ok"
+        self.error: Optional[str] = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    @property
+    def duration(self) -> float:
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+
+class Trace:
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.started_at = time.time()
+        self.root = Span(self, "session", "session", {"session_id": session_id})
+        self.origin = self.root.start
+        self.filename: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def start_span(self, parent: Span, name: str, kind: str, attrs: Dict) -> Span:
+        child = Span(self, name, kind, attrs)
+        with self._lock:
+            parent.children.append(child)
+        return child
+
+    def finish(self):
+        self.root.end = time.perf_counter()
+
+    def reopen(self):
+        """Continue recording into a finished trace (a resumed send)"""
+        self.root.end = None
+
+    def _ms(self, value: float) -> float:
+        return round(value * 1000, 1)
+
+    def _span_dict(self, span: Span, children: bool = True) -> Dict:
+        entry = {
+            "name": span.name,
+            "kind": span.kind,
+            "start_ms": self._ms(span.start - self.origin),
+            "duration_ms": self._ms(span.duration),
+            "status": span.status,
+        }
+        if span.attrs:
+            entry["attrs"] = dict(span.attrs)
+        if span.error:
+            entry["error"] = span.error
+        if children:
+            entry["children"] = [self._span_dict(child) for child in self._children(span)]
+        return entry
+
+    def _children(self, span: Span) -> List[Span]:
+        # Spans from background threads (a generation) may be added out of start order
+        with self._lock:
+            return sorted(span.children, key=lambda child: child.start)
+
+    def _walk(self, span: Span = None, depth: int = 0):
+        span = span or self.root
+        yield depth, span
+        for child in self._children(span):
+            yield from self._walk(child, depth + 1)
+
+    def to_dict(self) -> Dict:
+        return {"session_id": self.session_id, "started_at": self.started_at, "root": self._span_dict(self.root)}
+
+    def summary(self) -> Dict:
+        """Totals per kind, slowest spans and a waterfall of the top two levels"""
+        spans = list(self._walk())[1:]
+        by_kind: Dict[str, float] = {}
+        for _, span in spans:
+            by_kind[span.kind] = by_kind.get(span.kind, 0.0) + span.duration
+        # Steps and generations contain the spans that explain them
+        leaves = [span for _, span in spans if span.kind not in ("step", "generation")]
+        slowest = sorted(leaves, key=lambda span: span.duration, reverse=True)[:5]
+        return {
+            "total_ms": self._ms(self.root.duration),
+            "span_count": len(spans),
+            "by_kind_ms": {kind: self._ms(total) for kind, total in by_kind.items()},
+            "slowest": [self._span_dict(span, children=False) for span in slowest],
+            "waterfall": [{**self._span_dict(span, children=False), "depth": depth}
+                          for depth, span in spans if depth <= 2][:WATERFALL_LIMIT],
+            "trace_url": f"/screenshots/{self.filename}" if self.filename else None,
+        }
+
+    def export(self, directory: str = None) -> Optional[str]:
+        """Write the span tree next to the screenshots; returns the file name"""
+        directory = directory or TRACE_DIR
+        try:
+            os.makedirs(directory, exist_ok=True)
+            filename = f"{re.sub(r'[^A-Za-z0-9_.-]', '_', self.session_id)}_trace.json"
+            with open(os.path.join(directory, filename), "w", encoding="utf-8") as f:
+                json.dump(self.to_dict(), f, default=str)
+            self.filename = filename
+            return filename
+        except Exception as e:
+            logger.warning("Could not export trace for session %s: %s", self.session_id, e)
+            return None
+
+
+@contextmanager
+def activate(trace: Trace, span: Span = None):
+    """Make trace (or one of its spans) the parent of spans opened in this context"""
+    token = _current_span.set(span or trace.root)
+    try:
+        yield trace
+    finally:
+        _current_span.reset(token)
+
+
+@contextmanager
+def span(name: str, kind: str = "internal", **attrs):
+    """Record a child span of the active span; yields None when nothing is being traced"""
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+    child = parent.trace.start_span(parent, name, kind, attrs)
+    token = _current_span.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.status = "error"
+        child.error = str(e)[:200]
+        raise
+    finally:
+        child.end = time.perf_counter()
+        _current_span.reset(token)
@@ -0,0 +1,47 @@
+"""
+Environment loading for AI Email Agent
+Most settings are read with os.getenv when their module is imported, so
+.env has to be loaded before any other project module. Importing this
+module loads it; main.py and ai_email_agent.py import it first.
+Variables already set in the environment win over .env.
+"""
+
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+_env_loaded = False
+
+
+def _env_file_exists() -> bool:
+    """Whether python-dotenv could find a .env (from the working directory or this file's directory upwards)"""
+    for start in (os.getcwd(), os.path.dirname(os.path.abspath(__file__))):
+        directory = start
+        while True:
+            if os.path.isfile(os.path.join(directory, ".env")):
+                return True
+            parent = os.path.dirname(directory)
+            if parent == directory:
+                break
+            directory = parent
+    return False
+
+
+def load_environment():
+    """Load environment variables from .env (once per process)"""
+    global _env_loaded
+    if _env_loaded:
+        return
+    _env_loaded = True
+    # python-dotenv compiles its parser on import; skip it when there is nothing to load
+    if not _env_file_exists():
+        return
+    try:
+        from dotenv import load_dotenv
+        load_dotenv()
+    except Exception as e:
+        logger.warning("Could not load .env file: %s", e)
+
+
+load_environment()
@@ -0,0 +1,106 @@
+"""
+Direct SMTP delivery for AI Email Agent
+Sends the generated email over SMTP instead of driving Gmail in a browser
+(DELIVERY_BACKEND=smtp; Gmail needs an app password). The MIME message is
+produced as a stream: attachments are read from disk and base64-encoded a
+chunk at a time and written straight to the DATA command, so a 50MB
+attachment never sits in memory. Every line of the message is a header,
+a MIME boundary or base64, so no line starts with "." and the stream needs
+no dot-stuffing.
+"""
+
+import os
+import ssl
+import uuid
+import base64
+import logging
+import smtplib
+from email.header import Header
+from email.utils import encode_rfc2231, formatdate, make_msgid
+from typing import Dict, Iterator, List
+
+logger = logging.getLogger(__name__)
+
+SMTP_HOST = os.getenv("SMTP_HOST", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "1") != "0"
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", "60"))
+
+# Multiple of 57 bytes, so each chunk encodes to whole 76-character base64 lines
+ENCODE_CHUNK = 57 * 16 * 1024
+
+
+def _base64_lines(data: bytes) -> bytes:
+    return base64.encodebytes(data).replace(b"\n", b"\r\n")
+
+
+def _filename_params(filename: str) -> str:
+    try:
+        filename.encode("ascii")
+        return f'filename="{filename}"'
+    except UnicodeEncodeError:
+        return f"filename*={encode_rfc2231(filename, 'utf-8')}"
+
+
+def iter_message(sender: str, recipient: str, subject: str, body: str,
+                 attachments: List[Dict] = None, boundary: str = None) -> Iterator[bytes]:
+    """The MIME message as CRLF-terminated chunks; attachment files are read as they are encoded"""
+    boundary = boundary or f"=_{uuid.uuid4().hex}"
+    headers = [
+        f"From: {sender}",
+        f"To: {recipient}",
+        f"Subject: {Header(subject, 'utf-8').encode()}",
+        f"Date: {formatdate(localtime=True)}",
+        f"Message-ID: {make_msgid()}",
+        "MIME-Version: 1.0",
+        f'Content-Type: multipart/mixed; boundary="{boundary}"',
+    ]
+    yield ("\r\n".join(headers) + "\r\n\r\n").encode("utf-8")
+    yield (f"--{boundary}\r\nContent-Type: text/plain; charset=utf-8\r\n"
+           "Content-Transfer-Encoding: base64\r\n\r\n").encode("ascii")
+    yield _base64_lines(body.encode("utf-8"))
+    for attachment in attachments or []:
+        filename = attachment["filename"]
+        yield (f"--{boundary}\r\n"
+               f"Content-Type: {attachment.get('content_type') or 'application/octet-stream'}\r\n"
+               f"Content-Disposition: attachment; {_filename_params(filename)}\r\n"
+               "Content-Transfer-Encoding: base64\r\n\r\n").encode("utf-8")
+        with open(attachment["path"], "rb") as f:
+            for chunk in iter(lambda: f.read(ENCODE_CHUNK), b""):
+                yield _base64_lines(chunk)
+    yield f"--{boundary}--\r\n".encode("ascii")
+
+
+def send_streamed(sender: str, password: str, recipient: str, subject: str, body: str,
+                  attachments: List[Dict] = None, host: str = None, port: int = None,
+                  starttls: bool = None) -> Dict:
+    """Deliver one email, streaming the message body into the SMTP DATA command"""
+    host = host or SMTP_HOST
+    port = port or SMTP_PORT
+    starttls = SMTP_STARTTLS if starttls is None else starttls
+    sent_bytes = 0
+    with smtplib.SMTP(host, port, timeout=SMTP_TIMEOUT) as smtp:
+        smtp.ehlo()
+        if starttls:
+            smtp.starttls(context=ssl.create_default_context())
+            smtp.ehlo()
+        if password:
+            smtp.login(sender, password)
+        code, reply = smtp.mail(sender)
+        if code != 250:
+            raise smtplib.SMTPSenderRefused(code, reply, sender)
+        code, reply = smtp.rcpt(recipient)
+        if code not in (250, 251):
+            raise smtplib.SMTPRecipientsRefused({recipient: (code, reply)})
+        code, reply = smtp.docmd("DATA")
+        if code != 354:
+            raise smtplib.SMTPDataError(code, reply)
+        for chunk in iter_message(sender, recipient, subject, body, attachments):
+            smtp.send(chunk)
+            sent_bytes += len(chunk)
+        smtp.send(b".\r\n")
+        code, reply = smtp.getreply()
+        if code != 250:
+            raise smtplib.SMTPDataError(code, reply)
+    logger.info("Delivered email to %s over SMTP (%d bytes)", recipient, sent_bytes)
+    return {"smtp_reply": reply.decode("utf-8", "replace"), "message_bytes": sent_bytes}
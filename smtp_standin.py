@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Local SMTP stand-in for AI Email Agent
+A small threaded server speaking enough SMTP (EHLO, AUTH PLAIN/LOGIN, MAIL,
+RCPT, DATA, RSET, NOOP, QUIT) for the direct-delivery backend to be tested
+without a mail server. Messages are read line by line and discarded unless
+keep_messages is set, so large attachments can be streamed through it.
+No STARTTLS: point the agent at it with SMTP_STARTTLS=0.
+
+Usage: python smtp_standin.py --port 2525
+"""
+
+import argparse
+import logging
+import threading
+import socketserver
+from typing import Dict, List
+
+logger = logging.getLogger(__name__)
+
+
+class SMTPStandIn:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, keep_messages: bool = False):
+        self.host = host
+        self.port = port
+        self.keep_messages = keep_messages
+        self.messages: List[Dict] = []
+        self.counts = {"connections": 0, "messages": 0, "bytes": 0}
+        self._lock = threading.Lock()
+        self.server = None
+
+    def start(self):
+        standin = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                standin._handle(self)
+
+        self.server = socketserver.ThreadingTCPServer((self.host, self.port), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, name="smtp-standin", daemon=True).start()
+        logger.info("SMTP stand-in listening on %s:%s", self.host, self.port)
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+
+    def _handle(self, request: socketserver.StreamRequestHandler):
+        with self._lock:
+            self.counts["connections"] += 1
+
+        def reply(line: str):
+            request.wfile.write(f"{line}\r\n".encode("ascii"))
+
+        reply("220 smtp-standin ready")
+        envelope = {"from": None, "to": []}
+        for raw in request.rfile:
+            command = raw.decode("utf-8", "replace").strip()
+            verb = command.split(" ", 1)[0].upper()
+            if verb in ("EHLO", "HELO"):
+                request.wfile.write(b"250-smtp-standin\r\n250-8BITMIME\r\n250 AUTH PLAIN LOGIN\r\n")
+            elif verb == "AUTH":
+                if command.upper().startswith("AUTH LOGIN"):
+                    # Username and password prompts; any credentials are accepted
+                    for _ in range(2 if len(command.split()) == 2 else 1):
+                        reply("334 VXNlcm5hbWU6")
+                        request.rfile.readline()
+                reply("235 Authentication successful")
+            elif verb == "MAIL":
+                envelope = {"from": command.split(":", 1)[-1].strip(), "to": []}
+                reply("250 OK")
+            elif verb == "RCPT":
+                envelope["to"].append(command.split(":", 1)[-1].strip())
+                reply("250 OK")
+            elif verb == "DATA":
+                reply("354 End data with <CR><LF>.<CR><LF>")
+                size, kept = 0, []
+                for line in request.rfile:
+                    if line == b".\r\n":
+                        break
+                    size += len(line)
+                    if self.keep_messages:
+                        kept.append(line[1:] if line.startswith(b"..") else line)
+                with self._lock:
+                    self.counts["messages"] += 1
+                    self.counts["bytes"] += size
+                    if self.keep_messages:
+                        self.messages.append({**envelope, "data": b"".join(kept)})
+                reply("250 OK queued")
+            elif verb in ("RSET", "NOOP"):
+                reply("250 OK")
+            elif verb == "QUIT":
+                reply("221 Bye")
+                return
+            else:
+                reply("502 Command not implemented")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return dict(self.counts)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local SMTP stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=2525)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    standin = SMTPStandIn(args.host, args.port)
+    standin.start()
+    print(f"📮 SMTP stand-in listening on {args.host}:{standin.port}")
+    print(f"   export SMTP_HOST={args.host} SMTP_PORT={standin.port} SMTP_STARTTLS=0")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        standin.stop()
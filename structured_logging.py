@@ -0,0 +1,145 @@
+"""
+Logging setup for AI Email Agent
+Log calls only put the record on a queue; a listener thread formats it and
+writes it out, so automation threads never wait on log I/O. Records are JSON
+lines carrying the session_id of the send they belong to (set with
+log_context) and any extra fields.
+
+Messages are formatted on the listener thread, so log with lazy arguments
+(logger.info("Found %s", selector)) rather than f-strings, and pass values
+that will not change afterwards. High-frequency debug events (selector
+hits, element dumps) pass extra={"sample": "<key>"} and only one in
+LOG_SAMPLE_EVERY of them is kept.
+
+LOG_LEVEL sets the level (default INFO), LOG_FORMAT=text switches to plain lines.
+"""
+
+import os
+import sys
+import json
+import time
+import queue
+import atexit
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Dict
+
+LOG_SAMPLE_EVERY = int(os.getenv("LOG_SAMPLE_EVERY", "20"))
+
+# Session of the send running on the current thread
+session_id_var: contextvars.ContextVar = contextvars.ContextVar("session_id", default=None)
+
+# Attributes every LogRecord has; anything else came in through extra=
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "sample"}
+
+# logging.handlers is imported by create_queue_logging, so importing this module stays cheap
+_listener = None
+_configure_lock = threading.Lock()
+
+
+@contextmanager
+def log_context(session_id: str):
+    """Tag log records from this thread with session_id"""
+    token = session_id_var.set(session_id)
+    try:
+        yield
+    finally:
+        session_id_var.reset(token)
+
+
+class SessionFilter(logging.Filter):
+    """Stamp the current session_id on the record (runs on the calling thread)"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not hasattr(record, "session_id"):
+            record.session_id = session_id_var.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keep one in every N records that share an extra "sample" key"""
+
+    def __init__(self, every: int = None):
+        super().__init__()
+        self.every = max(1, every or LOG_SAMPLE_EVERY)
+        self._counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        key = getattr(record, "sample", None)
+        if key is None:
+            return True
+        with self._lock:
+            count = self._counts.get(key, 0)
+            self._counts[key] = count + 1
+        if count % self.every:
+            return False
+        # The kept record stands for this many events
+        record.sampled = self.every
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created)) + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "session_id": getattr(record, "session_id", None),
+            "thread": record.threadName,
+        }
+        entry.update({key: value for key, value in vars(record).items()
+                      if key not in _RECORD_ATTRS and key not in entry})
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s [%(session_id)s] %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        if not hasattr(record, "session_id"):
+            record.session_id = None
+        return super().format(record)
+
+
+def create_queue_logging(stream=None, fmt: str = None, sample_every: int = None):
+    """A (QueueHandler, QueueListener) pair writing formatted records to stream"""
+    from logging.handlers import QueueHandler, QueueListener
+
+    class LazyQueueHandler(QueueHandler):
+        """QueueHandler that hands records over unformatted"""
+
+        def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+            # The default prepare() formats the message here, on the calling thread
+            return record
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(TextFormatter() if (fmt or os.getenv("LOG_FORMAT", "json")) == "text" else JsonFormatter())
+    handler = LazyQueueHandler(log_queue)
+    handler.addFilter(SessionFilter())
+    handler.addFilter(SamplingFilter(sample_every))
+    return handler, QueueListener(log_queue, output)
+
+
+def configure_logging(level: str = None, fmt: str = None, stream=None):
+    """Route the root logger through the queue (once per process)"""
+    global _listener
+    with _configure_lock:
+        if _listener is not None:
+            return
+        handler, _listener = create_queue_logging(stream, fmt)
+        root = logging.getLogger()
+        for existing in list(root.handlers):
+            root.removeHandler(existing)
+        root.addHandler(handler)
+        root.setLevel((level or os.getenv("LOG_LEVEL", "INFO")).upper())
+        _listener.start()
+        # Write out what is still queued when the process exits
+        atexit.register(_listener.stop)
@@ -0,0 +1,114 @@
+"""
+Stub browser for AI Email Agent
+A stand-in for the Chrome WebDriver that accepts every command the
+automation steps issue and finds every element, so the API can be load
+tested without Chrome or a Gmail account. Enable it with BROWSER_DRIVER=stub;
+STUB_DRIVER_LATENCY adds a per-command delay to mimic WebDriver round trips.
+Clicking an element found by a Send selector counts as a send, which shows
+its "Message sent" toast STUB_SEND_SECONDS later (Gmail's sending time).
+"""
+
+import os
+import io
+import time
+import threading
+from typing import List, Optional
+
+from send_pipeline import SENT_TOAST_SCRIPT
+
+STUB_DRIVER_LATENCY = float(os.getenv("STUB_DRIVER_LATENCY", "0"))
+STUB_SEND_SECONDS = float(os.getenv("STUB_SEND_SECONDS", "0"))
+
+_screenshot: Optional[bytes] = None
+_screenshot_lock = threading.Lock()
+
+
+def stub_screenshot() -> bytes:
+    """A screenshot-sized PNG, rendered once per process"""
+    global _screenshot
+    with _screenshot_lock:
+        if _screenshot is None:
+            from PIL import Image, ImageDraw
+            image = Image.new("RGB", (1280, 720), color="white")
+            draw = ImageDraw.Draw(image)
+            draw.rectangle([0, 0, 1280, 64], fill="#d93025")
+            draw.text((24, 24), "Stub browser", fill="white")
+            buffer = io.BytesIO()
+            image.save(buffer, "PNG")
+            _screenshot = buffer.getvalue()
+    return _screenshot
+
+
+class StubElement:
+    def __init__(self, driver: "StubDriver", selector: str):
+        self.driver = driver
+        self.selector = selector
+        self.text = ""
+        self.size = {"width": 600, "height": 300}
+
+    def is_displayed(self) -> bool:
+        return True
+
+    def is_enabled(self) -> bool:
+        return True
+
+    def click(self):
+        self.driver._command()
+        if self.selector and "Send" in self.selector:
+            self.driver.sends.append(time.monotonic())
+
+    def clear(self):
+        self.driver._command()
+        self.text = ""
+
+    def send_keys(self, *values):
+        self.driver._command()
+        self.text += "".join(str(value) for value in values)
+
+    def get_attribute(self, name: str) -> str:
+        return ""
+
+
+class StubDriver:
+    def __init__(self, latency: float = None, send_seconds: float = None):
+        self.latency = STUB_DRIVER_LATENCY if latency is None else latency
+        self.send_seconds = STUB_SEND_SECONDS if send_seconds is None else send_seconds
+        self.sends: List[float] = []
+        self.current_url = "about:blank"
+        self.title = ""
+        self.page_source = ""
+        self.commands = 0
+
+    def _command(self):
+        self.commands += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def get(self, url: str):
+        self._command()
+        self.current_url = url
+
+    def find_element(self, by: str = "css selector", value: str = None) -> StubElement:
+        self._command()
+        return StubElement(self, value)
+
+    def find_elements(self, by: str = "css selector", value: str = None) -> List[StubElement]:
+        self._command()
+        return [StubElement(self, value)]
+
+    def execute_script(self, script: str, *args):
+        self._command()
+        if script == SENT_TOAST_SCRIPT:
+            now = time.monotonic()
+            return ["stub", sum(1 for sent in self.sends if now - sent >= self.send_seconds)]
+        # Page probes find nothing wrong on the stub page
+        return None
+
+    def save_screenshot(self, filepath: str) -> bool:
+        self._command()
+        with open(filepath, "wb") as f:
+            f.write(stub_screenshot())
+        return True
+
+    def quit(self):
+        pass
@@ -108,6 +108,630 @@ def test_ai_email_agent():
         print(f"❌ AI Email Agent test failed: {e}")
         return False
 
+def test_concurrent_sessions():
+    """Test that one agent can run many sends concurrently without cross-talk"""
+    print("\n🔄 Testing concurrent sessions on a shared agent...")
+    
+    try:
+        import threading
+        import ai_email_agent
+        from ai_email_agent import AIEmailAgent
+        from driver_pool import DriverPool
+        from stub_driver import StubDriver
+        
+        class RecordingDriver(StubDriver):
+            def __init__(self):
+                super().__init__(latency=0.001)
+                self.saved = []
+            def save_screenshot(self, filepath):
+                self.saved.append(os.path.basename(filepath))
+                return super().save_screenshot(filepath)
+        
+        drivers = []
+        def factory():
+            drivers.append(RecordingDriver())
+            return drivers[-1]
+        
+        agent = AIEmailAgent()
+        agent.driver_pool = DriverPool(factory, size=0)
+        sessions = ["concurrent-a", "concurrent-b"]
+        results = {}
+        
+        def run(session_id):
+            content = {"subject": f"Hello from {session_id}", "body": "Hi!", "email_type": "general",
+                       "tone": "friendly", "ai_generated": False}
+            results[session_id] = agent.send_email("me@gmail.com", "pw", f"{session_id}@example.com", "Say hello",
+                                                   session_id=session_id, email_content=content)
+        
+        saved = ai_email_agent.STEP_PAUSE_SCALE, ai_email_agent.TRACE_EXPORT
+        ai_email_agent.STEP_PAUSE_SCALE, ai_email_agent.TRACE_EXPORT = 0.01, False
+        try:
+            threads = [threading.Thread(target=run, args=(session_id,)) for session_id in sessions]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            ai_email_agent.STEP_PAUSE_SCALE, ai_email_agent.TRACE_EXPORT = saved
+            for name in os.listdir("screenshots"):
+                if name.startswith("concurrent-"):
+                    os.remove(os.path.join("screenshots", name))
+        
+        steps = [[s["step"] for s in results[session_id]["screenshots"]] for session_id in sessions]
+        for session_id in sessions:
+            result = results[session_id]
+            if result["status"] != "success" or result["session_id"] != session_id or \
+                    result["email_content"]["subject"] != f"Hello from {session_id}":
+                print(f"❌ Session {session_id} got the wrong result: {result.get('message')}")
+                return False
+            if any(not s["filename"].startswith(f"{session_id}_") for s in result["screenshots"]):
+                print(f"❌ Session {session_id} received another session's screenshot")
+                return False
+        spans = [[span["name"] for span in results[session_id]["trace"]["waterfall"] if span["kind"] == "step"]
+                 for session_id in sessions]
+        if spans[0] != spans[1] or len(spans[0]) != len(set(spans[0])):
+            print(f"❌ Session traces have each other's steps: {spans}")
+            return False
+        if steps[0] != steps[1] or steps[0][-1:] != ["success"]:
+            print(f"❌ Sessions ran different steps: {steps}")
+            return False
+        if len(drivers) != 2 or any(len({name.split("_")[0] for name in d.saved}) != 1 for d in drivers):
+            print("❌ A browser was shared between concurrent sessions")
+            return False
+        
+        print(f"✅ Concurrent sends kept their results, steps and screenshots separate ({len(steps[0])} steps each)")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Concurrent session test failed: {e}")
+        return False
+
+def test_screencast():
+    """Test that screencast frames are throttled and tagged with the session bound at the time"""
+    print("\n🔄 Testing screencast recording...")
+    
+    try:
+        import base64
+        import tempfile
+        from ai_email_agent import SessionContext
+        from screencast import ScreencastRecorder
+        
+        class NoDevToolsDriver:
+            pass
+        
+        first, second = SessionContext("cast-1"), SessionContext("cast-2")
+        with tempfile.TemporaryDirectory() as output_dir:
+            recorder = ScreencastRecorder(NoDevToolsDriver(), first, fps=1e9, output_dir=output_dir)
+            if recorder.start(timeout=1) or recorder.error is None:
+                print("❌ Screencast started on a driver without DevTools")
+                return False
+            
+            first.recorder = second.recorder = recorder
+            first.current_step = "login"
+            recorder._on_frame(base64.b64encode(b"frame-1").decode())
+            recorder.bind(second)
+            second.current_step = "compose"
+            recorder._on_frame(base64.b64encode(b"frame-2").decode())
+            recorder.fps = 0.001
+            recorder._on_frame(base64.b64encode(b"frame-3").decode())
+            
+            if [(f["session_id"], f["step"]) for f in first.timeline] != [("cast-1", "login")] or \
+                    [(f["session_id"], f["step"]) for f in second.timeline] != [("cast-2", "compose")]:
+                print(f"❌ Frames were not tagged with their session: {recorder.frames}")
+                return False
+            if not second.timeline[0]["filename"].startswith("cast-2_") or recorder.received != 3:
+                print("❌ Frame files or counts are wrong")
+                return False
+            keyframe = os.path.join(output_dir, "keyframe.jpg")
+            with open(keyframe, "wb"):
+                pass
+            if not recorder.save_keyframe(keyframe) or open(keyframe, "rb").read() != b"frame-3":
+                print("❌ Keyframe is not the latest frame")
+                return False
+        
+        print("✅ Screencast frames throttled and kept per session")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Screencast test failed: {e}")
+        return False
+
+def test_checkpoint_resume():
+    """Test that a failed send retries from its last checkpoint and resumes in the parked browser"""
+    print("\n🔄 Testing checkpointed retries and resume...")
+    
+    try:
+        from ai_email_agent import AIEmailAgent
+        from driver_pool import DriverPool
+        
+        class FakeDriver:
+            def save_screenshot(self, filepath):
+                return True
+            def execute_script(self, script):
+                return None
+            def quit(self):
+                pass
+        
+        agent = AIEmailAgent()
+        agent.driver_pool = DriverPool(FakeDriver, size=0)
+        calls = []
+        body_failures = [3]
+        
+        def step(name):
+            return lambda driver, ctx, *args: calls.append(name)
+        
+        def body(driver, ctx, text):
+            calls.append("body")
+            if body_failures[0]:
+                body_failures[0] -= 1
+                raise Exception("Could not find email body field")
+        
+        for name in ("navigate", "login", "compose", "recipient", "subject", "send"):
+            setattr(agent, f"step_{name}", step(name))
+        agent.step_body = body
+        content = {"subject": "Hi", "body": "Hello", "email_type": "general", "tone": "friendly"}
+        
+        result = agent.send_email("me@gmail.com", "pw", "you@example.com", "hi",
+                                  session_id="resume-test", email_content=content)
+        expected = ["navigate", "login", "compose", "recipient", "subject", "body",
+                    "body", "compose", "recipient", "subject", "body"]
+        if result["status"] != "error" or not result["resumable"] or calls != expected:
+            print(f"❌ Unexpected retry sequence: {calls}")
+            return False
+        if result["checkpoint"] != "subject" or len(result["attempts"]) != 3:
+            print(f"❌ Unexpected checkpoint state: {result['checkpoint']}, {result['attempts']}")
+            return False
+        
+        del calls[:]
+        result = agent.resume_email("resume-test", "me@gmail.com", "pw", "you@example.com", "hi")
+        if result["status"] != "success" or calls != ["body", "send"]:
+            print(f"❌ Resume did not continue from the checkpoint: {calls}")
+            return False
+        if len(result["attempts"]) != 4 or agent.driver_pool.stats()["resumed"] != 1:
+            print("❌ Resume attempts were not recorded")
+            return False
+        
+        print(f"✅ Retried from checkpoints and resumed in the parked browser ({result['retry_seconds']}s in retries)")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Checkpoint resume test failed: {e}")
+        return False
+    finally:
+        trace_file = os.path.join("screenshots", "resume-test_trace.json")
+        if os.path.exists(trace_file):
+            os.remove(trace_file)
+
+def test_failure_watchdog():
+    """Test that failure pages are classified on the sign-in host only, and that the watchdog aborts"""
+    print("\n🔄 Testing the failure watchdog...")
+
+    try:
+        import time
+        from ai_email_agent import SessionContext
+        from failure_watchdog import AutomationAbort, FailureWatchdog, probe_page
+
+        class PageDriver:
+            def __init__(self, page):
+                self.page = page
+            def execute_script(self, script, *args):
+                return self.page
+
+        login = {"host": "accounts.google.com", "text": "Wrong password. Try again.", "captcha": False,
+                 "challenge": False, "banner": ""}
+        compose = {**login, "host": "mail.google.com"}
+        if probe_page(PageDriver(login)) != ("WRONG_PASSWORD", "Gmail rejected the password"):
+            print(f"❌ Login page was not classified: {probe_page(PageDriver(login))}")
+            return False
+        if probe_page(PageDriver(compose)) is not None or probe_page(PageDriver({"host": "mail.google.com"})) is not None:
+            print("❌ Email text in Gmail was taken for a login failure")
+            return False
+        if probe_page(PageDriver({**login, "text": "", "captcha": True}))[0] != "CAPTCHA" or \
+                probe_page(PageDriver({**login, "text": "", "banner": "Enter a password"}))[0] != "AUTH_ERROR":
+            print("❌ CAPTCHA or error banner was not classified")
+            return False
+
+        ctx = SessionContext("watchdog-test")
+        watchdog = FailureWatchdog(PageDriver(compose), ctx, interval=0.01)
+        watchdog.start()
+        time.sleep(0.1)
+        watchdog.stop()
+        if ctx.failure is not None:
+            print("❌ Watchdog aborted a send on the Gmail page")
+            return False
+        watchdog = FailureWatchdog(PageDriver(login), ctx, interval=0.01)
+        watchdog.start()
+        try:
+            ctx.pause(5)
+            aborted = None
+        except AutomationAbort as e:
+            aborted = e.code
+        watchdog.stop()
+        if aborted != "WRONG_PASSWORD":
+            print(f"❌ Watchdog did not abort the session: {aborted}")
+            return False
+
+        print("✅ Failure pages classified on the sign-in host only; the watchdog aborts the session")
+        return True
+
+    except Exception as e:
+        print(f"❌ Failure watchdog test failed: {e}")
+        return False
+
+def test_stub_browser_send():
+    """Test the full step sequence against the stub browser"""
+    print("\n🔄 Testing a send on the stub browser...")
+    
+    try:
+        import ai_email_agent
+        from ai_email_agent import AIEmailAgent
+        from driver_pool import DriverPool
+        from stub_driver import StubDriver
+        
+        agent = AIEmailAgent()
+        agent.driver_pool = DriverPool(StubDriver, size=0)
+        saved_scale, ai_email_agent.STEP_PAUSE_SCALE = ai_email_agent.STEP_PAUSE_SCALE, 0
+        try:
+            result = agent.send_email("me@gmail.com", "pw", "you@example.com", "Say hello",
+                                      session_id="stub-browser-test")
+        finally:
+            ai_email_agent.STEP_PAUSE_SCALE = saved_scale
+            for name in os.listdir("screenshots"):
+                if name.startswith("stub-browser-test_"):
+                    os.remove(os.path.join("screenshots", name))
+        
+        steps = [s["step"] for s in result.get("screenshots", [])]
+        if result["status"] != "success" or steps[-1:] != ["success"]:
+            print(f"❌ Stub send did not succeed: {result.get('message')}")
+            return False
+        if not all("captured_at" in s for s in result["screenshots"]):
+            print("❌ Screenshots are missing capture times")
+            return False
+        
+        print(f"✅ Stub browser ran all steps ({len(steps)} screenshots)")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Stub browser test failed: {e}")
+        return False
+
+def test_send_pipeline():
+    """Test pipelined batches: toasts confirm sends in order, the Sent folder covers missing toasts"""
+    print("\n🔄 Testing pipelined batch sending...")
+
+    try:
+        import ai_email_agent
+        import send_pipeline
+        from ai_email_agent import AIEmailAgent
+        from driver_pool import DriverPool
+        from stub_driver import StubDriver
+
+        content = {"subject": "Hi", "body": "Hello", "email_type": "general", "tone": "friendly"}
+
+        def batch(send_seconds, prefix):
+            agent = AIEmailAgent()
+            agent.driver_pool = DriverPool(lambda: StubDriver(send_seconds=send_seconds), size=0)
+            messages = [{"session_id": f"{prefix}-{i}", "recipient_email": f"r{i}@example.com",
+                         "user_prompt": "hi", "email_content": content} for i in range(4)]
+            return agent.send_batch("me@gmail.com", "pw", messages, pipelined=True)
+
+        saved = (ai_email_agent.STEP_PAUSE_SCALE, send_pipeline.PIPELINE_CONFIRM_INTERVAL,
+                 send_pipeline.PIPELINE_CONFIRM_TIMEOUT)
+        ai_email_agent.STEP_PAUSE_SCALE = 0
+        send_pipeline.PIPELINE_CONFIRM_INTERVAL, send_pipeline.PIPELINE_CONFIRM_TIMEOUT = 0.02, 0.3
+        try:
+            toasts = batch(0.05, "pipeline-test")
+            # No toast ever shows up: each send is looked up in the Sent folder instead
+            no_toasts = batch(60, "pipeline-test-sent")
+        finally:
+            (ai_email_agent.STEP_PAUSE_SCALE, send_pipeline.PIPELINE_CONFIRM_INTERVAL,
+             send_pipeline.PIPELINE_CONFIRM_TIMEOUT) = saved
+            for name in os.listdir("screenshots"):
+                if name.startswith("pipeline-test"):
+                    os.remove(os.path.join("screenshots", name))
+
+        if any(result["status"] != "success" for result in toasts + no_toasts):
+            print(f"❌ Pipelined batch failed: {[result.get('message') for result in toasts + no_toasts]}")
+            return False
+        if [result["delivery"]["via"] for result in toasts] != ["toast"] * 4:
+            print(f"❌ Sends were not confirmed by toasts: {[result['delivery'] for result in toasts]}")
+            return False
+        if [result["delivery"]["via"] for result in no_toasts] != ["sent_folder"] * 4:
+            print(f"❌ Missing toasts were not checked in the Sent folder: {[r['delivery'] for r in no_toasts]}")
+            return False
+        steps = [s["step"] for s in toasts[1]["screenshots"]]
+        if steps != ["compose", "recipient", "subject", "body", "send"]:
+            print(f"❌ Pipelined send waited for the send to finish: {steps}")
+            return False
+        spans = [span["name"] for span in toasts[0]["trace"]["waterfall"]]
+        if "delivery.confirm" not in spans:
+            print("❌ Delivery confirmation is missing from the trace")
+            return False
+
+        print(f"✅ Pipelined batch confirmed 4 sends by toast "
+              f"({toasts[-1]['delivery']['seconds']}s after the last click) and 4 from the Sent folder")
+        return True
+
+    except Exception as e:
+        print(f"❌ Send pipeline test failed: {e}")
+        return False
+
+def test_session_trace():
+    """Test the span tree recorded for a stub send"""
+    print("\n🔄 Testing session tracing...")
+    
+    try:
+        import json
+        import ai_email_agent
+        from ai_email_agent import AIEmailAgent
+        from driver_pool import DriverPool
+        from stub_driver import StubDriver
+        
+        agent = AIEmailAgent()
+        agent.driver_pool = DriverPool(StubDriver, size=0)
+        saved_scale, ai_email_agent.STEP_PAUSE_SCALE = ai_email_agent.STEP_PAUSE_SCALE, 0
+        try:
+            result = agent.send_email("me@gmail.com", "pw", "you@example.com", "Say hello",
+                                      session_id="trace-test")
+            with open(os.path.join("screenshots", "trace-test_trace.json"), encoding="utf-8") as f:
+                exported = json.load(f)
+        finally:
+            ai_email_agent.STEP_PAUSE_SCALE = saved_scale
+            for name in os.listdir("screenshots"):
+                if name.startswith("trace-test_"):
+                    os.remove(os.path.join("screenshots", name))
+        
+        trace = result.get("trace") or {}
+        top = [span["name"] for span in trace.get("waterfall", []) if span["depth"] == 1]
+        # Generation runs alongside the browser acquire, so either may start first
+        if sorted(top[:2]) != ["driver.acquire", "generate_email_content"] or \
+                top[2:] != ["navigate", "login", "compose", "recipient", "subject", "body", "send"]:
+            print(f"❌ Unexpected top-level spans: {top}")
+            return False
+        kinds = trace["by_kind_ms"]
+        if not all(kind in kinds for kind in ("selector", "wait", "screenshot", "driver")):
+            print(f"❌ Trace is missing span kinds: {sorted(kinds)}")
+            return False
+        if len(exported["root"]["children"]) != len(top) or trace["trace_url"] != "/screenshots/trace-test_trace.json":
+            print("❌ Exported trace does not match the summary")
+            return False
+        
+        print(f"✅ Trace recorded {trace['span_count']} spans and exported the tree")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Session trace test failed: {e}")
+        return False
+
+def test_generation_overlap():
+    """Test that content is generated while the browser logs in"""
+    print("\n🔄 Testing generation overlapped with login...")
+    
+    try:
+        import time
+        import ai_email_agent
+        from ai_email_agent import AIEmailAgent
+        from driver_pool import DriverPool
+        from failure_watchdog import AutomationAbort
+        from stub_driver import StubDriver
+        
+        agent = AIEmailAgent()
+        agent.driver_pool = DriverPool(StubDriver, size=0)
+        
+        def slow_generate(prompt, recipient_email=None):
+            time.sleep(0.4)
+            return {"subject": "Hello there", "body": "Hi!", "email_type": "general", "tone": "friendly",
+                    "ai_generated": True}
+        
+        agent.generate_email_content = slow_generate
+        saved = ai_email_agent.STEP_PAUSE_SCALE, ai_email_agent.GENERATION_OVERLAP, ai_email_agent.TRACE_EXPORT
+        ai_email_agent.STEP_PAUSE_SCALE, ai_email_agent.TRACE_EXPORT = 0.01, False
+        timings = {}
+        try:
+            for overlap in (False, True):
+                ai_email_agent.GENERATION_OVERLAP = overlap
+                started = time.perf_counter()
+                result = agent.send_email("me@gmail.com", "pw", "you@example.com", "Say hello",
+                                          session_id=f"overlap-test-{overlap}")
+                timings[overlap] = time.perf_counter() - started
+                if result["status"] != "success" or result["email_content"]["subject"] != "Hello there":
+                    print(f"❌ Send with overlap={overlap} failed: {result.get('message')}")
+                    return False
+            
+            # A send that cannot be resumed fails without waiting for its draft
+            def abort_login(driver, ctx, *args):
+                raise AutomationAbort("WRONG_PASSWORD", "Gmail rejected the password")
+            
+            agent.step_login = abort_login
+            started = time.perf_counter()
+            failed = agent.send_email("me@gmail.com", "pw", "you@example.com", "Say hello",
+                                      session_id="overlap-test-abort")
+            abort_seconds = time.perf_counter() - started
+            del agent.step_login
+            if failed["error_code"] != "WRONG_PASSWORD" or failed["resumable"] or abort_seconds > 0.3:
+                print(f"❌ Aborted send waited for its draft ({abort_seconds:.2f}s)")
+                return False
+        finally:
+            ai_email_agent.STEP_PAUSE_SCALE, ai_email_agent.GENERATION_OVERLAP, ai_email_agent.TRACE_EXPORT = saved
+            for name in os.listdir("screenshots"):
+                if name.startswith("overlap-test-"):
+                    os.remove(os.path.join("screenshots", name))
+        
+        spans = {span["name"]: span for span in result["trace"]["waterfall"]}
+        login_end = spans["login"]["start_ms"] + spans["login"]["duration_ms"]
+        if spans["generate_email_content"]["start_ms"] > login_end:
+            print("❌ Generation did not start before login finished")
+            return False
+        if timings[True] > timings[False] - 0.25:
+            print(f"❌ Overlap did not shorten the send: {timings[True]:.2f}s vs {timings[False]:.2f}s")
+            return False
+        
+        print(f"✅ Generation overlapped with login ({timings[False]:.2f}s sequential, {timings[True]:.2f}s overlapped)")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Generation overlap test failed: {e}")
+        return False
+
+def test_scheduler_batching():
+    """Test that due jobs for the same account run in one batch, never before their send time"""
+    print("\n🔄 Testing scheduled send batching...")
+    
+    try:
+        import time
+        from scheduler import ScheduleStore, SendScheduler
+        
+        batches = []
+        def runner(gmail_id, gmail_password, jobs):
+            batches.append((gmail_id, gmail_password, [job["job_id"] for job in jobs], time.time()))
+            return [{"status": "success", "session_id": job["session_id"]} for job in jobs]
+        
+        store = ScheduleStore(":memory:")
+        now = time.time()
+        # A job left running by a crash is failed on start instead of staying stuck
+        store.add({"job_id": "crashed", "session_id": "s-crashed", "gmail_id": "a@x.com",
+                   "recipient_email": "r@x.com", "user_prompt": "hello", "send_at": now - 60})
+        store.set_status(["crashed"], "running")
+        
+        scheduler = SendScheduler(runner, store, batch_window=0.5)
+        scheduler.start()
+        jobs = [("a1", "a@x.com", 0.1, "pw"), ("a2", "a@x.com", 0.3, "pw"), ("a3", "a@x.com", 1.0, "pw"),
+                ("b1", "b@x.com", 0.1, "pw"), ("b2", "b@x.com", 0.1, "other")]
+        for job_id, account, delay, password in jobs:
+            scheduler.schedule({
+                "job_id": job_id, "session_id": f"s-{job_id}", "gmail_id": account,
+                "recipient_email": "r@x.com", "user_prompt": "hello", "send_at": now + delay
+            }, password)
+        
+        for _ in range(50):
+            if scheduler.jobs_run == len(jobs):
+                break
+            time.sleep(0.05)
+        scheduler.stop()
+        
+        grouped = sorted((account, password, ids) for account, password, ids, _ in batches)
+        expected = [("a@x.com", "pw", ["a1", "a2"]), ("a@x.com", "pw", ["a3"]),
+                    ("b@x.com", "other", ["b2"]), ("b@x.com", "pw", ["b1"])]
+        if grouped != expected:
+            print(f"❌ Unexpected batches: {grouped}")
+            return False
+        send_at = {job_id: now + delay for job_id, _, delay, _ in jobs}
+        if any(started < send_at[job_id] for _, _, ids, started in batches for job_id in ids):
+            print("❌ A scheduled job was sent before its send time")
+            return False
+        if store.get("a2")["status"] != "success":
+            print("❌ Batched job result was not recorded")
+            return False
+        crashed = store.get("crashed")
+        if crashed["status"] != "error" or "reschedule" not in crashed["result"]["message"]:
+            print(f"❌ Interrupted job was not failed on start: {crashed['status']}")
+            return False
+        
+        # The endpoint keeps the client's session id and queues a retried request only once
+        import asyncio
+        from datetime import datetime
+        import main
+        from fastapi import HTTPException
+        from session_store import SessionStore
+        saved_stores = main.scheduler, main.session_store
+        main.scheduler, main.session_store = SendScheduler(runner, ScheduleStore(":memory:")), SessionStore(":memory:")
+        try:
+            request = main.ScheduledEmailRequest(gmail_id="a@x.com", gmail_password="pw", recipient_email="r@x.com",
+                                                 user_prompt="hello", send_at=datetime.fromtimestamp(now + 3600),
+                                                 session_id="client-session", idempotency_key="schedule-key")
+            first = asyncio.run(main.schedule_ai_email(request, None))
+            retry = asyncio.run(main.schedule_ai_email(request, None))
+            if first["session_id"] != "client-session" or retry["job_id"] != first["job_id"] or \
+                    not retry.get("idempotent_replay") or len(main.scheduler.store.list()) != 1:
+                print(f"❌ Retried schedule request was queued again: {first}, {retry}")
+                return False
+            try:
+                asyncio.run(main.schedule_ai_email(request.model_copy(update={"capture_mode": "screencast"}), None))
+                print("❌ Scheduled send accepted capture_mode")
+                return False
+            except HTTPException as e:
+                if e.status_code != 400:
+                    raise
+        finally:
+            main.scheduler, main.session_store = saved_stores
+        
+        print("✅ Due jobs for one account share a login, per password, and none is sent early")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Scheduler test failed: {e}")
+        return False
+
+def test_worker_ring():
+    """Test that account routing is stable, only part of it moves when workers change, and drained workers fail cleanly"""
+    print("\n🔄 Testing account-affine worker routing...")
+    
+    try:
+        from worker_tier import HashRing, account_key
+        
+        ring = HashRing([f"worker-{i}" for i in range(4)])
+        accounts = [account_key(f"User{i}@Gmail.com ") for i in range(2000)]
+        before = {account: ring.get(account) for account in accounts}
+        
+        if ring.get(account_key("user7@gmail.com")) != before[account_key("USER7@gmail.com")]:
+            print("❌ Routing depends on account spelling")
+            return False
+        load = {node: list(before.values()).count(node) for node in ring.nodes}
+        if min(load.values()) < len(accounts) / 4 * 0.5:
+            print(f"❌ Accounts are badly spread: {load}")
+            return False
+        
+        ring.add("worker-4")
+        moved = [a for a in accounts if ring.get(a) != before[a]]
+        if any(ring.get(a) != "worker-4" for a in moved) or len(moved) > len(accounts) * 0.35:
+            print(f"❌ Adding a worker moved too many accounts ({len(moved)})")
+            return False
+        
+        ring.remove("worker-4")
+        if any(ring.get(a) != before[a] for a in accounts):
+            print("❌ Removing the worker did not restore the original routing")
+            return False
+        
+        # A worker that dies while draining fails its queued sends instead of leaving them hanging
+        import queue
+        from worker_tier import WorkerTier
+        
+        class FakeProcess:
+            pid, exitcode = 1, None
+            def is_alive(self):
+                return self.exitcode is None
+            def terminate(self):
+                self.exitcode = -15
+        
+        tier = WorkerTier(size=0)
+        if tier._outbox is not None:
+            print("❌ Disabled worker tier set up a multiprocessing queue")
+            return False
+        for worker_id in ("worker-a", "worker-b"):
+            tier._workers[worker_id] = {"process": FakeProcess(), "inbox": queue.Queue(), "ready": True,
+                                        "assigned": 0, "pending": set(), "stats": {}, "started_at": 0}
+            tier.ring.add(worker_id)
+        future = tier.submit("send_email", "drained@gmail.com", session_id="drained")
+        owner = tier.route("drained@gmail.com")
+        worker = tier._workers[owner]
+        tier.remove_worker(owner, drain=True)
+        tier._reap_drained()
+        if future.done() or owner not in tier._draining or worker["inbox"].get_nowait() is None:
+            print("❌ Draining worker was not kept until it exited")
+            return False
+        worker["process"].exitcode = -9
+        tier._reap_drained()
+        if owner in tier._draining or not future.done() or not isinstance(future.exception(), RuntimeError):
+            print("❌ Sends of a worker that died while draining were left hanging")
+            return False
+        
+        print(f"✅ Routing is stable; adding a worker moved {len(moved)}/{len(accounts)} accounts")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Worker routing test failed: {e}")
+        return False
+
 def test_main_app():
     """Test if the main FastAPI app can be imported"""
     print("\n🔄 Testing main application...")
@@ -132,6 +756,717 @@ def test_main_app():
         print(f"❌ Main app test failed: {e}")
         return False
 
+def test_session_store():
+    """Test that idempotency keys return the stored session result"""
+    print("\n🔄 Testing session store...")
+    
+    try:
+        from session_store import SessionStore
+        store = SessionStore(":memory:")
+        
+        record, created = store.claim("retry-key", "session-1")
+        if not created or record["status"] != "pending":
+            print("❌ New idempotency key was not claimed")
+            return False
+        
+        store.mark_running("session-1")
+        store.finish_session("session-1", {"status": "success", "message": "sent", "session_id": "session-1"})
+        
+        record, created = store.claim("retry-key", "session-2")
+        if created or record["session_id"] != "session-1" or record["response"]["status"] != "success":
+            print("❌ Retry with the same idempotency key did not return the stored result")
+            return False
+        
+        # An exact replay with the client's session id returns the stored result; another key gets 409
+        import asyncio
+        import main
+        from fastapi import HTTPException
+        saved_store, main.session_store = main.session_store, store
+        try:
+            replay = main.AIEmailRequest(gmail_id="me@gmail.com", gmail_password="pw", recipient_email="you@example.com",
+                                         user_prompt="hi", session_id="session-1", idempotency_key="retry-key")
+            response = asyncio.run(main.send_ai_email(replay, None, None, None))
+            if not response.get("idempotent_replay") or response["session_id"] != "session-1":
+                print(f"❌ Replay with the session id did not return the stored result: {response}")
+                return False
+            try:
+                asyncio.run(main.send_ai_email(replay.model_copy(update={"idempotency_key": "other-key"}), None, None, None))
+                print("❌ Reusing a session id under another key was accepted")
+                return False
+            except HTTPException as e:
+                if e.status_code != 409:
+                    raise
+            
+            # A key reused with a different body gets 422; a retry with a corrected password is a replay
+            original = replay.model_copy(update={"session_id": "session-body", "idempotency_key": "body-key"})
+            store.claim("body-key", "session-body", main.idempotency_fingerprint(original))
+            store.finish_session("session-body", {"status": "success", "session_id": "session-body"})
+            response = asyncio.run(main.send_ai_email(original.model_copy(update={"gmail_password": "new"}),
+                                                      None, None, None))
+            if not response.get("idempotent_replay"):
+                print(f"❌ Retry with another password was not a replay: {response}")
+                return False
+            try:
+                asyncio.run(main.send_ai_email(original.model_copy(update={"user_prompt": "something else"}),
+                                               None, None, None))
+                print("❌ Idempotency key reused for a different request was accepted")
+                return False
+            except HTTPException as e:
+                if e.status_code != 422:
+                    raise
+            
+            # A resume whose browser is gone resends the stored content instead of generating again
+            stored = {"subject": "Stored", "body": "Same email", "ai_generated": True}
+            store.create_session("resume-stored")
+            store.finish_session("resume-stored", {"status": "demo", "resumable": True, "email_content": stored,
+                                                   "session_id": "resume-stored"})
+            calls = []
+            saved_run_agent = main.run_agent
+            main.run_agent = lambda method, gmail_id, **kwargs: calls.append((method, kwargs["email_content"])) or \
+                {"status": "success", "screenshots": [], "session_id": "resume-stored", "email_content": stored}
+            try:
+                main._build_ai_email_response(replay.model_copy(update={"session_id": "resume-stored"}),
+                                              "resume-stored", True, False)
+            finally:
+                main.run_agent = saved_run_agent
+            if calls != [("resume_email", stored)]:
+                print(f"❌ Resume did not reuse the stored email content: {calls}")
+                return False
+        finally:
+            main.session_store = saved_store
+        
+        draft = store.create_draft("draft-1", "Say thanks", "you@example.com",
+                                   {"subject": "Thanks", "body": "Thank you!", "ai_generated": True})
+        store.update_draft("draft-1", {"body": "Thanks a lot!"})
+        store.record_draft_send("draft-1", "session-3")
+        draft = store.get_draft("draft-1")
+        if (draft["email_content"] != {"subject": "Thanks", "body": "Thanks a lot!", "ai_generated": True}
+                or not draft["edited"] or draft["send_count"] != 1 or store.update_draft("missing", {}) is not None):
+            print(f"❌ Stored draft was not edited and counted: {draft}")
+            return False
+        
+        print("✅ Session store returns stored results for repeated idempotency keys and keeps edited drafts")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Session store test failed: {e}")
+        return False
+
+def test_singleflight():
+    """Test that identical concurrent generation requests share one call"""
+    print("\n🔄 Testing in-flight request coalescing...")
+    
+    try:
+        import threading
+        import time
+        from singleflight import SingleFlight
+        
+        flight = SingleFlight("test")
+        calls = []
+        
+        def slow_generate(prompt):
+            calls.append(prompt)
+            time.sleep(0.2)
+            return {"subject": prompt}
+        
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(flight.do("same-prompt", slow_generate, "hello")[0]))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        stats = flight.stats()
+        if len(calls) != 1 or stats["coalesced"] != 4 or len(results) != 5:
+            print(f"❌ Expected one shared call, got {len(calls)} calls and stats {stats}")
+            return False
+        
+        print("✅ Concurrent identical requests coalesced into one call")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Coalescing test failed: {e}")
+        return False
+
+def test_websocket_fanout():
+    """Test that a slow WebSocket viewer does not stall the others"""
+    print("\n🔄 Testing WebSocket fan-out...")
+    
+    try:
+        import asyncio
+        from connection_manager import ConnectionManager
+        
+        class FakeWebSocket:
+            def __init__(self, delay):
+                self.delay = delay
+                self.received = []
+            async def accept(self):
+                pass
+            async def send_json(self, data):
+                await asyncio.sleep(self.delay)
+                self.received.append(data)
+        
+        async def run():
+            manager = ConnectionManager()
+            fast, slow = FakeWebSocket(0), FakeWebSocket(10)
+            fast_client = await manager.connect("session", fast)
+            slow_client = await manager.connect("session", slow)
+            for i in range(100):
+                await manager.broadcast("session", {"step": i})
+            await asyncio.sleep(0.1)
+            result = (len(fast.received), slow_client.dropped)
+            manager.disconnect("session", fast_client)
+            manager.disconnect("session", slow_client)
+            return result
+        
+        fast_received, slow_dropped = asyncio.run(run())
+        if fast_received != 100 or slow_dropped == 0:
+            print(f"❌ Fast client got {fast_received}/100 messages, slow client dropped {slow_dropped}")
+            return False
+        
+        print("✅ Slow viewers drop old messages without stalling others")
+        return True
+        
+    except Exception as e:
+        print(f"❌ WebSocket fan-out test failed: {e}")
+        return False
+
+def test_backplane():
+    """Test that events published on one worker reach viewers on another"""
+    print("\n🔄 Testing pub/sub backplane...")
+    
+    try:
+        import asyncio
+        from backplane import RedisBackplane
+        from connection_manager import ConnectionManager
+        from redis_standin import RedisStandIn
+        
+        class FakeWebSocket:
+            def __init__(self):
+                self.received = []
+            async def accept(self):
+                pass
+            async def send_json(self, data):
+                self.received.append(data)
+        
+        async def run():
+            standin = RedisStandIn()
+            await standin.start()
+            sender = ConnectionManager(RedisBackplane(standin.url))
+            viewer = ConnectionManager(RedisBackplane(standin.url))
+            await sender.start()
+            await viewer.start()
+            websocket = FakeWebSocket()
+            client = await viewer.connect("session", websocket)
+            await sender.broadcast("session", {"step": "login"})
+            for _ in range(50):
+                if websocket.received:
+                    break
+                await asyncio.sleep(0.02)
+            viewer.disconnect("session", client)
+            await sender.stop()
+            await viewer.stop()
+            await standin.stop()
+            return websocket.received
+        
+        received = asyncio.run(run())
+        if received != [{"step": "login"}]:
+            print(f"❌ Viewer on the other worker received {received}")
+            return False
+        
+        # A backend without publish fails when it is created, not on its first event
+        from backplane import Backplane
+        
+        class IncompleteBackplane(Backplane):
+            pass
+        
+        try:
+            IncompleteBackplane()
+            print("❌ Backplane without publish could be instantiated")
+            return False
+        except TypeError:
+            pass
+        
+        print("✅ Events cross workers through the Redis-protocol backplane")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Backplane test failed: {e}")
+        return False
+
+def test_model_router():
+    """Test model/token routing by prompt complexity, learning and the latency SLO"""
+    print("\n🔄 Testing adaptive model routing...")
+    
+    try:
+        from model_router import ModelRouter
+        
+        router = ModelRouter(models=["command", "command-light"], slo_ms=2000)
+        short = router.route("generate", "Say thanks to Sam")
+        detailed = router.route("generate", "Write a cover letter for the internship application, "
+                                            "covering my projects, skills and availability")
+        if short["model"] != "command-light" or detailed["model"] != "command":
+            print(f"❌ Unexpected models: {short['model']}, {detailed['model']}")
+            return False
+        if short["max_tokens"] >= detailed["max_tokens"]:
+            print("❌ Short prompts should get a smaller token budget")
+            return False
+        
+        # Short emails turn out to need ~40 tokens: the budget shrinks toward that
+        for _ in range(5):
+            router.observe(short, 0.2, "word " * 30)
+        learned = router.route("generate", "Say thanks to Alex")
+        if learned["max_tokens"] >= short["max_tokens"]:
+            print("❌ Budget did not shrink after observing short outputs")
+            return False
+        
+        # The full model is slow: detailed emails move to the light model to meet the SLO
+        router.observe(detailed, 10.0, "word " * 300)
+        slow = router.route("generate", "Write a cover letter for the internship application, "
+                                        "covering my projects, skills and availability")
+        if slow["model"] != "command-light":
+            print("❌ Router did not downgrade the model under the SLO")
+            return False
+        
+        print(f"✅ Routed by complexity; budget {short['max_tokens']} → {learned['max_tokens']} tokens after learning")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Model router test failed: {e}")
+        return False
+
+def test_cohere_standin():
+    """Test generation against the local Cohere stand-in, including 429 fallback"""
+    print("\n🔄 Testing generation against the Cohere stand-in...")
+    
+    saved = {name: os.environ.get(name) for name in ("COHERE_API_URL", "COHERE_API_KEY", "COHERE_MAX_RETRIES")}
+    standin = None
+    try:
+        from cohere_standin import CohereStandIn
+        from ai_email_agent import AIEmailAgent
+        
+        standin = CohereStandIn(completion="wrapped", seed=1)
+        standin.start()
+        os.environ.update({"COHERE_API_URL": standin.url, "COHERE_API_KEY": "standin-key", "COHERE_MAX_RETRIES": "0"})
+        
+        agent = AIEmailAgent()
+        if not agent.ai_available:
+            print("❌ Agent did not connect to the stand-in")
+            return False
+        content = agent.generate_email_content("Thank the team for the launch", "team@example.com")
+        if not content["ai_generated"] or not content["subject"].startswith("About:"):
+            print(f"❌ Unexpected generated content: {content['subject']}")
+            return False
+        
+        standin.configure(rate_limit_rate=1.0)
+        content = agent.generate_email_content("Ask for a deadline extension", "prof@example.com")
+        if content["ai_generated"] or standin.stats()["rate_limited"] < 1:
+            print("❌ Rate-limited generation did not fall back")
+            return False
+        
+        print(f"✅ Stand-in served {standin.stats()['requests']} generate calls; 429s fell back to templates")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Cohere stand-in test failed: {e}")
+        return False
+    finally:
+        if standin is not None:
+            standin.stop()
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+def test_draft_reuse():
+    """Test near-duplicate prompt lookup, slot filling and eviction"""
+    print("\n🔄 Testing near-duplicate draft reuse...")
+    
+    try:
+        from draft_cache import NUMPY_AVAILABLE, DraftCache
+        if not NUMPY_AVAILABLE:
+            print("⚠️  NumPy not installed, draft reuse is disabled")
+            return True
+        
+        cache = DraftCache(capacity=2, threshold=0.9)
+        draft = {"subject": "Internship at Google", "body": "Dear team,\n\nI would love to intern at Google.",
+                 "key_points": ["Google internship"], "ai_generated": True}
+        cache.add("send internship mail to Google", "hr@google.com", draft)
+        
+        reused = cache.lookup("Send an internship email for Google", "hr@google.com")
+        if reused is None or reused["subject"] != "Internship at Google":
+            print("❌ Near-duplicate prompt did not reuse the stored draft")
+            return False
+        filled = cache.lookup("send internship mail to Microsoft", "jobs@microsoft.com")
+        if filled is None or "Microsoft" not in filled["body"] or "Google" in filled["body"]:
+            print("❌ Reused draft was not slot-filled for the new company")
+            return False
+        if cache.lookup("Schedule a meeting with the design team", "hr@google.com") is not None:
+            print("❌ Unrelated prompt reused a draft")
+            return False
+        
+        cache.add("Thank the team for the launch", None, draft)
+        cache.lookup("send internship mail to Google", "hr@google.com")
+        cache.add("Ask for a deadline extension", None, draft)
+        stats = cache.stats()
+        # The internship draft was used most recently, so the thank-you note is evicted
+        if stats["size"] != 2 or stats["evictions"] != 1 or cache.lookup("thank the team for the launch") is not None:
+            print(f"❌ Unexpected eviction: {stats}")
+            return False
+        
+        print(f"✅ Reused {stats['hits']} near-duplicate and {stats['slot_filled']} slot-filled drafts; LRU eviction works")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Draft reuse test failed: {e}")
+        return False
+
+def test_personalization():
+    """Test template-once personalization: one generation for 100 recipients"""
+    print("\n🔄 Testing multi-recipient personalization...")
+    
+    saved = {name: os.environ.get(name) for name in ("COHERE_API_URL", "COHERE_API_KEY", "COHERE_MAX_RETRIES")}
+    standin = None
+    try:
+        from cohere_standin import CohereStandIn
+        from ai_email_agent import AIEmailAgent
+        
+        standin = CohereStandIn(seed=1)
+        standin.start()
+        os.environ.update({"COHERE_API_URL": standin.url, "COHERE_API_KEY": "standin-key", "COHERE_MAX_RETRIES": "0"})
+        agent = AIEmailAgent()
+        calls = standin.stats()["requests"]
+        
+        recipients = [{"email": f"user{i}@example.com", "name": f"User {i}", "company": "Acme"} for i in range(100)]
+        recipients.append({"email": "anon@example.com"})
+        result = agent.personalize("Invite them to our product demo", recipients)
+        drafts = result["drafts"]
+        # One generation is an interpretation call plus a generate call
+        if result["generations"] != 1 or standin.stats()["requests"] - calls != 2:
+            print(f"❌ Template mode made {standin.stats()['requests'] - calls} LLM calls")
+            return False
+        if not drafts[7]["body"].startswith("Dear User 7,") or "{{" in drafts[7]["body"]:
+            print(f"❌ Draft not rendered for its recipient: {drafts[7]['body'][:40]}")
+            return False
+        if not drafts[-1]["body"].startswith("Hello,") or drafts[-1]["personalized_for"] != "anon@example.com":
+            print("❌ Recipient without a name was not greeted generically")
+            return False
+        
+        result = agent.personalize("Invite them to our product demo", recipients[:5], mode="individual")
+        if result["generations"] != 5 or standin.stats()["requests"] - calls != 12:
+            print(f"❌ Individual mode made {standin.stats()['requests'] - calls - 2} LLM calls for 5 recipients")
+            return False
+        
+        print("✅ 101 recipients personalized from one generation; individual mode generates per recipient")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Personalization test failed: {e}")
+        return False
+    finally:
+        if standin is not None:
+            standin.stop()
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+def test_structured_logging():
+    """Test queued JSON logging: session ids, lazy formatting and sampling"""
+    print("\n🔄 Testing structured logging...")
+    
+    try:
+        import io
+        import json
+        import logging
+        import threading
+        from structured_logging import create_queue_logging, log_context
+        
+        class Formatted:
+            """Records the thread that turned it into text"""
+            thread = None
+            def __str__(self):
+                Formatted.thread = threading.current_thread().name
+                return "selector"
+        
+        stream = io.StringIO()
+        handler, listener = create_queue_logging(stream, fmt="json", sample_every=10)
+        test_logger = logging.getLogger("test_structured_logging")
+        test_logger.addHandler(handler)
+        test_logger.setLevel(logging.DEBUG)
+        test_logger.propagate = False
+        listener.start()
+        try:
+            with log_context("session-1"):
+                test_logger.info("Found %s", Formatted())
+                for i in range(100):
+                    test_logger.debug("Selector %d hit", i, extra={"sample": "selector"})
+            test_logger.info("No session")
+        finally:
+            listener.stop()
+            test_logger.removeHandler(handler)
+        
+        records = [json.loads(line) for line in stream.getvalue().splitlines()]
+        if records[0]["session_id"] != "session-1" or records[-1]["session_id"] is not None:
+            print("❌ Records did not carry the session id of their context")
+            return False
+        if Formatted.thread in (None, threading.current_thread().name):
+            print("❌ Message was formatted on the logging thread")
+            return False
+        sampled = [r for r in records if r["message"].startswith("Selector")]
+        if len(sampled) != 10 or sampled[0].get("sampled") != 10:
+            print(f"❌ Expected 10 sampled selector records, got {len(sampled)}")
+            return False
+        
+        print("✅ JSON records carry session ids, format off-thread and sample 1 in 10 debug events")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Structured logging test failed: {e}")
+        return False
+
+def test_request_profiler():
+    """Test per-request CPU and memory profiles and the admin token check"""
+    print("\n🔄 Testing request profiling...")
+    
+    try:
+        import json
+        import shutil
+        import time
+        import tempfile
+        import request_profiler
+        from request_profiler import check_admin_token, profile_path, profile_session
+        
+        saved_dir, request_profiler.PROFILE_DIR = request_profiler.PROFILE_DIR, tempfile.mkdtemp()
+        saved_token = os.environ.get("PROFILING_ADMIN_TOKEN")
+        try:
+            with profile_session("profile/test"):
+                blocks = [bytearray(1024) for _ in range(200)]
+                total = 0
+                deadline = time.time() + 0.2
+                while time.time() < deadline:
+                    total += sum(range(1000))
+            with open(profile_path("profile/test")) as f:
+                report = json.load(f)
+            with open(profile_path("profile/test", "folded")) as f:
+                folded = f.read()
+            
+            os.environ["PROFILING_ADMIN_TOKEN"] = "secret"
+            token_ok = check_admin_token("secret") and not check_admin_token("wrong") and not check_admin_token(None)
+            del os.environ["PROFILING_ADMIN_TOKEN"]
+            token_ok = token_ok and not check_admin_token("secret")
+        finally:
+            shutil.rmtree(request_profiler.PROFILE_DIR, ignore_errors=True)
+            request_profiler.PROFILE_DIR = saved_dir
+            if saved_token is not None:
+                os.environ["PROFILING_ADMIN_TOKEN"] = saved_token
+        
+        if report["samples"] < 5 or "test_request_profiler" not in folded:
+            print(f"❌ Profiler did not sample the profiled code ({report['samples']} samples)")
+            return False
+        if not any("test_request_profiler" in entry["function"] for entry in report["cpu"]["total"]):
+            print("❌ Profiled function missing from the CPU report")
+            return False
+        if report["memory"]["peak_bytes"] < 200 * 1024 or len(blocks) != 200:
+            print(f"❌ Peak memory {report['memory']['peak_bytes']} does not cover the allocations")
+            return False
+        if not token_ok:
+            print("❌ Admin token check accepted a bad or missing token")
+            return False
+        
+        print(f"✅ Profile stored with {report['samples']} CPU samples and "
+              f"{report['memory']['peak_bytes'] // 1024}KB peak memory")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Request profiler test failed: {e}")
+        return False
+
+def test_attachments():
+    """Test streamed attachment uploads, dedup, size limits and streamed SMTP delivery"""
+    print("\n🔄 Testing attachments...")
+    
+    try:
+        import io
+        import email
+        import shutil
+        import asyncio
+        import tempfile
+        from attachments import AttachmentError, AttachmentStore, parse_multipart
+        from smtp_delivery import send_streamed
+        from smtp_standin import SMTPStandIn
+        
+        workdir = tempfile.mkdtemp()
+        smtp = SMTPStandIn(keep_messages=True)
+        smtp.start()
+        try:
+            store = AttachmentStore(workdir, max_bytes=1024 * 1024)
+            payload = os.urandom(300 * 1024)
+            body = (b'--b\r\nContent-Disposition: form-data; name="request"\r\n\r\n{"a": 1}\r\n'
+                    b'--b\r\nContent-Disposition: form-data; name="file"; filename="cv.pdf"\r\n'
+                    b'Content-Type: application/pdf\r\n\r\n' + payload + b'\r\n--b--\r\n')
+            
+            async def chunks():
+                for i in range(0, len(body), 4096):
+                    yield body[i:i + 4096]
+            
+            fields, files = asyncio.run(parse_multipart("multipart/form-data; boundary=b", chunks(), store))
+            again = store.save("copy.pdf", io.BytesIO(payload), "application/pdf")
+            try:
+                store.save("big.bin", io.BytesIO(os.urandom(2 * 1024 * 1024)))
+                too_big = False
+            except AttachmentError as e:
+                too_big = e.status_code == 413
+            try:
+                store.resolve([{"attachment_id": "0" * 64}])
+                unknown = False
+            except AttachmentError as e:
+                unknown = e.status_code == 404
+            attachments = store.resolve([{"attachment_id": again["attachment_id"], "filename": "Resume.pdf"}])
+            send_streamed("me@example.com", "pw", "you@example.com", "Resume", "Attached.", attachments,
+                          host="127.0.0.1", port=smtp.port, starttls=False)
+            message = email.message_from_bytes(smtp.messages[0]["data"])
+            attached = [part for part in message.walk() if part.get_filename()]
+            leftovers = os.listdir(store.tmp_dir)
+        finally:
+            smtp.stop()
+            shutil.rmtree(workdir, ignore_errors=True)
+        
+        if fields != {"request": '{"a": 1}'} or len(files) != 1 or files[0]["size"] != len(payload):
+            print(f"❌ Multipart upload was not parsed: {fields}, {files}")
+            return False
+        if files[0]["deduplicated"] or not again["deduplicated"] or again["attachment_id"] != files[0]["attachment_id"]:
+            print("❌ Repeated upload was not deduplicated by content hash")
+            return False
+        if not too_big or not unknown or leftovers:
+            print("❌ Size limit or unknown attachment was not rejected cleanly")
+            return False
+        if [part.get_filename() for part in attached] != ["Resume.pdf"] or attached[0].get_payload(decode=True) != payload:
+            print("❌ SMTP message did not carry the attachment")
+            return False
+        
+        print("✅ Upload spooled and deduplicated, limits enforced, attachment streamed over SMTP")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Attachment test failed: {e}")
+        return False
+
+def test_ui_plan():
+    """Test UI plan validation, compiled selector groups and hot reload"""
+    print("\n🔄 Testing UI plan...")
+
+    try:
+        import json
+        import shutil
+        import tempfile
+        from ui_plan import UI_PLAN_PATH, PlanError, PlanStore, compile_plan, load_plan
+
+        plan = load_plan(UI_PLAN_PATH)
+        recipient = plan.fields["recipient"]
+        if recipient.css_group != ", ".join(recipient.css) or " | " not in recipient.xpath_union:
+            print("❌ Recipient selectors were not compiled into combined queries")
+            return False
+        chip = plan.field("attachment_chip", filename='cv "final".pdf')
+        if "{filename}" in chip.css_group or 'cv final.pdf' not in chip.css_group:
+            print(f"❌ Placeholder was not filled: {chip.css_group}")
+            return False
+
+        with open(UI_PLAN_PATH) as f:
+            data = json.load(f)
+        rejected = []
+        for broken in ({**data, "steps": ["navigate", "login", "compose", "recipient", "subject", "body"]},
+                       {**data, "steps": data["steps"] + ["wait"]},
+                       {**data, "fields": {**data["fields"], "email_next": {"css": ["button:contains('Next')"]}}},
+                       {**data, "fields": {k: v for k, v in data["fields"].items() if k != "body"}}):
+            try:
+                compile_plan(broken)
+            except PlanError as e:
+                rejected.append(str(e))
+        if len(rejected) != 4:
+            print(f"❌ Invalid plans were accepted: {rejected}")
+            return False
+
+        workdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(workdir, "ui_plan.json")
+
+            def write(plan_data, raw=None):
+                # Written next to the plan and renamed over it, as an editor or deploy would
+                with open(path + ".tmp", "w") as f:
+                    f.write(raw if raw is not None else json.dumps(plan_data))
+                os.replace(path + ".tmp", path)
+
+            write({**data, "version": 1})
+            store = PlanStore(path, check_interval=0)
+            first = store.current()
+            write({**data, "version": 2, "steps": ["navigate", "login", "compose", "subject", "body", "recipient",
+                                                   "attach", "send"]})
+            second = store.current()
+            write(None, raw='{"version": 3, "steps": [')
+            kept = store.current()
+            stats = store.stats()
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        if first.version != 1 or second.version != 2 or kept is not second:
+            print(f"❌ Plan was not hot reloaded: {first.version}, {second.version}, {kept.version}")
+            return False
+        if stats["loads"] != 2 or stats["failed_loads"] != 1 or not stats["last_error"]:
+            print(f"❌ Failed reload was not recorded: {stats}")
+            return False
+
+        # A send builds its steps in the plan's order
+        from ai_email_agent import AIEmailAgent, SessionContext
+        ctx = SessionContext()
+        ctx.plan = second
+        steps = AIEmailAgent.send_steps(AIEmailAgent.__new__(AIEmailAgent), None, ctx, "a", "b", "c", {})
+        if [name for name, _, _ in steps] != ["navigate", "login", "compose", "subject", "body", "recipient", "send"]:
+            print(f"❌ Steps did not follow the plan: {[name for name, _, _ in steps]}")
+            return False
+
+        print(f"✅ Plan {plan.label} compiled, invalid plans rejected, hot reload kept the last good plan")
+        return True
+
+    except Exception as e:
+        print(f"❌ UI plan test failed: {e}")
+        return False
+
+def test_env_settings():
+    """Test that .env values reach the settings modules read at import time"""
+    print("\n🔄 Testing .env loading...")
+    
+    try:
+        import subprocess
+        import tempfile
+        
+        with tempfile.TemporaryDirectory() as workdir:
+            with open(os.path.join(workdir, ".env"), "w", encoding="utf-8") as f:
+                f.write("CAPTURE_MODE=screencast\nSTEP_RETRIES=7\nDELIVERY_BACKEND=smtp\n")
+            env = {key: value for key, value in os.environ.items()
+                   if key not in ("CAPTURE_MODE", "STEP_RETRIES", "DELIVERY_BACKEND")}
+            env["PYTHONPATH"] = os.path.dirname(os.path.abspath(__file__))
+            check = ("import main, ai_email_agent as a; "
+                     "print(a.CAPTURE_MODE, a.STEP_RETRIES, a.DELIVERY_BACKEND, main.DELIVERY_BACKEND)")
+            output = subprocess.run([sys.executable, "-c", check], cwd=workdir, env=env,
+                                    capture_output=True, text=True, check=True).stdout.split()
+        
+        if output != ["screencast", "7", "smtp", "smtp"]:
+            print(f"❌ Module settings ignored .env: {output}")
+            return False
+        
+        print("✅ .env is loaded before module-level settings are read")
+        return True
+        
+    except Exception as e:
+        print(f"❌ .env loading test failed: {e}")
+        return False
+
 def test_env_file():
     """Test if .env file exists and has proper format"""
     print("\n🔄 Testing .env file...")
@@ -170,7 +1505,30 @@ def main():
     tests = [
         test_imports,
         test_ai_email_agent,
+        test_concurrent_sessions,
+        test_screencast,
+        test_checkpoint_resume,
+        test_failure_watchdog,
+        test_stub_browser_send,
+        test_send_pipeline,
+        test_session_trace,
+        test_generation_overlap,
+        test_scheduler_batching,
+        test_worker_ring,
         test_main_app,
+        test_session_store,
+        test_singleflight,
+        test_websocket_fanout,
+        test_backplane,
+        test_model_router,
+        test_cohere_standin,
+        test_draft_reuse,
+        test_personalization,
+        test_structured_logging,
+        test_request_profiler,
+        test_attachments,
+        test_ui_plan,
+        test_env_settings,
         test_env_file
     ]
     
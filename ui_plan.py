@@ -0,0 +1,277 @@
+"""
+UI step plan for AI Email Agent
+The Gmail selectors and the order of the automation steps live in a
+versioned data file (ui_plan.json) instead of in the step code, so a Gmail
+UI change is a data edit. The file is validated and compiled once when it is
+loaded: each field's CSS selectors become one selector group and its XPath
+fallbacks one union expression, so a lookup waits once for any of them
+rather than waiting out each selector in turn. The running server picks up
+edits to the file on its own; a plan that fails validation is logged and
+the previous one stays in use. Each send uses the plan that was current
+when it started.
+"""
+
+import os
+import re
+import json
+import time
+import logging
+import threading
+from typing import Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+UI_PLAN_PATH = os.getenv("UI_PLAN_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "ui_plan.json"))
+# Seconds between checks of the plan file for changes (0 checks on every send)
+UI_PLAN_CHECK_SECONDS = float(os.getenv("UI_PLAN_CHECK_SECONDS", "2"))
+
+KNOWN_STEPS = ("navigate", "login", "compose", "recipient", "subject", "body", "attach", "send")
+# Steps the file may leave out (attach only runs for sends with attachments)
+OPTIONAL_STEPS = ("attach",)
+# Fields the steps look up
+REQUIRED_FIELDS = (
+    "email_input", "email_next", "password_input", "password_next", "compose_button", "compose_dialog",
+    "recipient", "input_candidates", "subject", "body", "body_candidates", "attach_input",
+    "attachment_chip", "send_button", "sent_toast", "sent_row",
+)
+DEFAULT_TIMEOUT = 10
+DEFAULT_FALLBACK_TIMEOUT = 5
+
+# jQuery-only pseudo-classes: Selenium rejects them, and one invalid selector
+# would make a whole compiled selector group fail
+JQUERY_PSEUDO = re.compile(r":(contains|eq|gt|lt|first|last|even|odd|visible|hidden|input|button|text|header|animated)\b")
+PLACEHOLDER = re.compile(r"\{(\w+)\}")
+
+
+class PlanError(ValueError):
+    """A plan file that cannot be used"""
+
+
+def _balanced(selector: str) -> bool:
+    stack, quote = [], None
+    for char in selector:
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in "'\"":
+            quote = char
+        elif char in "[(":
+            stack.append("]" if char == "[" else ")")
+        elif char in "])":
+            if not stack or stack.pop() != char:
+                return False
+    return not stack and quote is None
+
+
+def _check_css(field: str, selector: str):
+    if not isinstance(selector, str) or not selector.strip():
+        raise PlanError(f"{field}: empty CSS selector")
+    if "," in PLACEHOLDER.sub("", selector):
+        raise PlanError(f"{field}: list selectors one per entry, not comma-separated ({selector})")
+    if JQUERY_PSEUDO.search(selector):
+        raise PlanError(f"{field}: {selector} uses a jQuery-only pseudo-class")
+    if not _balanced(selector):
+        raise PlanError(f"{field}: unbalanced brackets or quotes in {selector}")
+
+
+def _check_xpath(field: str, selector: str):
+    if not isinstance(selector, str) or not selector.strip().startswith(("/", "(", ".")):
+        raise PlanError(f"{field}: XPath fallbacks must be absolute or relative paths ({selector})")
+    if not _balanced(selector):
+        raise PlanError(f"{field}: unbalanced brackets or quotes in {selector}")
+
+
+class FieldQuery:
+    """
+    One field's selectors in priority order, plus their compiled combined
+    forms. text lists strings a match must contain, for fields recognised by
+    their text (the "Message sent" toast).
+    """
+
+    __slots__ = ("name", "css", "xpath", "css_group", "xpath_union", "timeout", "fallback_timeout", "text")
+
+    def __init__(self, name: str, css: List[str], xpath: List[str], timeout: float, fallback_timeout: float,
+                 text: List[str] = ()):
+        self.name = name
+        self.css = tuple(css)
+        self.xpath = tuple(xpath)
+        self.css_group = ", ".join(self.css)
+        self.xpath_union = " | ".join(self.xpath)
+        self.timeout = timeout
+        self.fallback_timeout = fallback_timeout
+        self.text = tuple(text)
+
+    def format(self, **values) -> "FieldQuery":
+        """Fill {placeholders} (e.g. an attachment's file name); quotes are dropped from values"""
+        def fill(selector: str) -> str:
+            return PLACEHOLDER.sub(lambda m: str(values[m.group(1)]).replace('"', "").replace("'", ""), selector)
+        return FieldQuery(self.name, [fill(s) for s in self.css], [fill(s) for s in self.xpath],
+                          self.timeout, self.fallback_timeout, self.text)
+
+    def lookups(self, timeout: float = None) -> Iterator[Tuple[str, str, Tuple[str, ...], float]]:
+        """(by, combined query, selectors in priority order, timeout) for CSS, then the XPath fallbacks"""
+        if self.css:
+            yield "css selector", self.css_group, self.css, timeout or self.timeout
+        if self.xpath:
+            yield "xpath", self.xpath_union, self.xpath, self.fallback_timeout
+
+
+class UIPlan:
+    """A validated, compiled plan; never modified once built"""
+
+    def __init__(self, version: int, name: str, steps: Tuple[str, ...], fields: Dict[str, FieldQuery],
+                 checksum: str, source: str = None):
+        self.version = version
+        self.name = name
+        self.steps = steps
+        self.fields = fields
+        self.checksum = checksum
+        self.source = source
+        self.loaded_at = time.time()
+
+    @property
+    def label(self) -> str:
+        return f"{self.name}@{self.version}"
+
+    def field(self, name: str, **values) -> FieldQuery:
+        query = self.fields[name]
+        return query.format(**values) if values else query
+
+    def info(self) -> Dict:
+        return {"version": self.version, "name": self.name, "checksum": self.checksum, "steps": list(self.steps),
+                "fields": len(self.fields), "loaded_at": self.loaded_at, "source": self.source}
+
+
+def compile_plan(data: Dict, checksum: str = "", source: str = None) -> UIPlan:
+    """Validate a parsed plan file and compile its fields; raises PlanError"""
+    if not isinstance(data, dict):
+        raise PlanError("Plan must be a JSON object")
+    version = data.get("version")
+    if not isinstance(version, int) or isinstance(version, bool) or version < 1:
+        raise PlanError("Plan needs an integer version >= 1")
+
+    steps = data.get("steps")
+    if not isinstance(steps, list) or not steps:
+        raise PlanError("Plan needs a list of steps")
+    unknown = [step for step in steps if step not in KNOWN_STEPS]
+    if unknown:
+        raise PlanError(f"Unknown steps: {', '.join(map(str, unknown))}")
+    if len(set(steps)) != len(steps):
+        raise PlanError("Steps must not repeat")
+    missing = [step for step in KNOWN_STEPS if step not in steps and step not in OPTIONAL_STEPS]
+    if missing:
+        raise PlanError(f"Missing steps: {', '.join(missing)}")
+    # Batches log in once and run the rest per message; the send click must come last
+    if steps[:2] != ["navigate", "login"] or steps[-1] != "send":
+        raise PlanError("Steps must start with navigate, login and end with send")
+    if steps.index("compose") != 2:
+        raise PlanError("compose must directly follow login")
+
+    raw_fields = data.get("fields")
+    if not isinstance(raw_fields, dict):
+        raise PlanError("Plan needs a fields object")
+    missing = [name for name in REQUIRED_FIELDS if name not in raw_fields]
+    if missing:
+        raise PlanError(f"Missing fields: {', '.join(missing)}")
+
+    fields = {}
+    for name, spec in raw_fields.items():
+        if not isinstance(spec, dict):
+            raise PlanError(f"{name}: field must be an object")
+        css, xpath = spec.get("css", []), spec.get("xpath", [])
+        if not isinstance(css, list) or not isinstance(xpath, list) or not (css or xpath):
+            raise PlanError(f"{name}: needs a list of css and/or xpath selectors")
+        for selector in css:
+            _check_css(name, selector)
+        for selector in xpath:
+            _check_xpath(name, selector)
+        timeouts = []
+        for key, default in (("timeout", DEFAULT_TIMEOUT), ("fallback_timeout", DEFAULT_FALLBACK_TIMEOUT)):
+            value = spec.get(key, default)
+            if not isinstance(value, (int, float)) or isinstance(value, bool) or value <= 0:
+                raise PlanError(f"{name}: {key} must be a positive number")
+            timeouts.append(value)
+        text = spec.get("text", [])
+        if not isinstance(text, list) or not all(isinstance(t, str) and t for t in text):
+            raise PlanError(f"{name}: text must be a list of non-empty strings")
+        fields[name] = FieldQuery(name, css, xpath, *timeouts, text)
+
+    return UIPlan(version, str(data.get("name") or "ui-plan"), tuple(steps), fields, checksum, source)
+
+
+def load_plan(path: str) -> UIPlan:
+    import hashlib
+    with open(path, "rb") as f:
+        raw = f.read()
+    try:
+        data = json.loads(raw)
+    except ValueError as e:
+        raise PlanError(f"{path} is not valid JSON: {e}")
+    return compile_plan(data, hashlib.sha256(raw).hexdigest()[:12], path)
+
+
+class PlanStore:
+    """
+    The current plan, reloaded when its file changes. Reads are a plain
+    attribute lookup; a new plan replaces the old one only once it has been
+    fully compiled, so a send never sees a half-loaded plan.
+    """
+
+    def __init__(self, path: str = None, check_interval: float = None):
+        self.path = path or UI_PLAN_PATH
+        self.check_interval = UI_PLAN_CHECK_SECONDS if check_interval is None else check_interval
+        self._plan: Optional[UIPlan] = None
+        self._signature = None
+        self._failed_signature = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self.counts = {"loads": 0, "failed_loads": 0}
+        self.last_error: Optional[str] = None
+
+    def current(self) -> UIPlan:
+        plan = self._plan
+        if plan is None or time.monotonic() - self._checked_at >= self.check_interval:
+            self.reload()
+            plan = self._plan
+        return plan
+
+    def _file_signature(self):
+        stat = os.stat(self.path)
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def reload(self, force: bool = False) -> bool:
+        """Load the file if it changed; True if a new plan was installed"""
+        with self._lock:
+            self._checked_at = time.monotonic()
+            try:
+                signature = self._file_signature()
+            except OSError as e:
+                return self._failed(None, f"Cannot read UI plan {self.path}: {e}")
+            if not force and signature in (self._signature, self._failed_signature):
+                return False
+            try:
+                plan = load_plan(self.path)
+            except (OSError, PlanError) as e:
+                return self._failed(signature, str(e))
+            previous, self._plan = self._plan, plan
+            self._signature, self._failed_signature = signature, None
+            self.counts["loads"] += 1
+            self.last_error = None
+        if previous is None:
+            logger.info("Loaded UI plan %s (%s)", plan.label, plan.checksum)
+        else:
+            logger.info("Reloaded UI plan %s -> %s (%s)", previous.label, plan.label, plan.checksum)
+        return True
+
+    def _failed(self, signature, error: str) -> bool:
+        self._failed_signature = signature
+        self.counts["failed_loads"] += 1
+        self.last_error = error
+        if self._plan is None:
+            raise PlanError(error)
+        logger.error("Keeping UI plan %s: %s", self._plan.label, error)
+        return False
+
+    def stats(self) -> Dict:
+        plan = self._plan
+        return {**(plan.info() if plan is not None else {}), **self.counts, "last_error": self.last_error}
@@ -0,0 +1,352 @@
+"""
+Browser worker tier for AI Email Agent
+Runs sends in separate worker processes, each with its own agent and browser
+pool, so browser automation is not limited to one Python process. Requests
+are routed by consistent hashing on the sender account: every send for a
+gmail_id lands on the same worker (where its parked browser for a resume
+lives), and when a worker joins or leaves only the accounts on that part of
+the ring move.
+
+Parked browsers live in their worker. A worker that dies is restarted under
+the same id, so its accounts still route to it, but its parked browsers are
+gone: a resume of one of its sessions starts the send over in a new
+browser, reusing the generated content stored with the session.
+
+WORKER_PROCESSES sets the number of workers (0 = run sends in-process).
+"""
+
+import os
+import time
+import uuid
+import bisect
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", "4"))
+WORKER_STATS_INTERVAL = float(os.getenv("WORKER_STATS_INTERVAL", "2"))
+RING_REPLICAS = 100
+
+# Agent methods a worker will run for the parent
+WORKER_METHODS = ("send_email", "resume_email", "send_direct", "send_batch")
+
+
+def account_key(gmail_id: str) -> str:
+    return (gmail_id or "").strip().lower()
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.md5(value.encode("utf-8")).digest()[:8], "big")
+
+
+class HashRing:
+    def __init__(self, nodes: List[str] = None, replicas: int = RING_REPLICAS):
+        self.replicas = replicas
+        self._points: List[int] = []
+        self._owners: Dict[int, str] = {}
+        self.nodes: List[str] = []
+        for node in nodes or []:
+            self.add(node)
+
+    def add(self, node: str):
+        if node in self.nodes:
+            return
+        self.nodes.append(node)
+        for i in range(self.replicas):
+            point = _hash(f"{node}#{i}")
+            self._owners[point] = node
+            bisect.insort(self._points, point)
+
+    def remove(self, node: str):
+        if node not in self.nodes:
+            return
+        self.nodes.remove(node)
+        for i in range(self.replicas):
+            point = _hash(f"{node}#{i}")
+            if self._owners.get(point) == node:
+                del self._owners[point]
+                self._points.remove(point)
+
+    def get(self, key: str) -> Optional[str]:
+        """The node owning key: the first point clockwise from its hash"""
+        if not self._points:
+            return None
+        index = bisect.bisect(self._points, _hash(key)) % len(self._points)
+        return self._owners[self._points[index]]
+
+
+def _worker_main(worker_id: str, inbox, outbox):
+    """Worker process: one agent and browser pool, jobs run on a small thread pool"""
+    from concurrent.futures import ThreadPoolExecutor
+    from ai_email_agent import AIEmailAgent
+    from structured_logging import configure_logging
+    from request_profiler import profile_session
+
+    # Spawned processes start without logging configuration
+    configure_logging()
+    agent = AIEmailAgent()
+    agent.driver_pool.prewarm()
+    counters = {"in_flight": 0, "completed": 0, "failed": 0, "busy_seconds": 0.0}
+    lock = threading.Lock()
+    stopped = threading.Event()
+    outbox.put(("ready", worker_id, None))
+
+    def report_stats():
+        while not stopped.wait(WORKER_STATS_INTERVAL):
+            with lock:
+                stats = dict(counters)
+            stats["browsers"] = agent.driver_pool.stats()
+            outbox.put(("stats", worker_id, stats))
+
+    def run(job_id: str, method: str, kwargs: Dict):
+        if method == "send_batch":
+            kwargs["on_screenshot"] = lambda sid, shot: outbox.put(("screenshot", worker_id, (sid, shot)))
+        else:
+            sid = kwargs["session_id"]
+            kwargs["on_screenshot"] = lambda shot: outbox.put(("screenshot", worker_id, (sid, shot)))
+        profile = kwargs.pop("profile", False)
+        started = time.perf_counter()
+        with lock:
+            counters["in_flight"] += 1
+        try:
+            if profile:
+                with profile_session(kwargs["session_id"]):
+                    result = getattr(agent, method)(**kwargs)
+            else:
+                result = getattr(agent, method)(**kwargs)
+            outbox.put(("result", worker_id, (job_id, result)))
+            failed = False
+        except Exception as e:
+            outbox.put(("error", worker_id, (job_id, f"{type(e).__name__}: {e}")))
+            failed = True
+        with lock:
+            counters["in_flight"] -= 1
+            counters["failed" if failed else "completed"] += 1
+            counters["busy_seconds"] += time.perf_counter() - started
+
+    threading.Thread(target=report_stats, daemon=True).start()
+    with ThreadPoolExecutor(max_workers=WORKER_CONCURRENCY, thread_name_prefix=f"{worker_id}-send") as pool:
+        while True:
+            job = inbox.get()
+            if job is None:
+                break
+            pool.submit(run, *job)
+    stopped.set()
+    agent.driver_pool.close()
+
+
+class WorkerTier:
+    def __init__(self, size: int = None, on_screenshot: Callable[[str, Dict], None] = None):
+        self.size = size if size is not None else int(os.getenv("WORKER_PROCESSES", "0"))
+        self.on_screenshot = on_screenshot
+        self.ring = HashRing()
+        # Created by start(), so a disabled tier sets up no multiprocessing
+        self._context = None
+        self._outbox = None
+        self._workers: Dict[str, Dict] = {}
+        # Workers taken off the ring that are still finishing their queued sends
+        self._draining: Dict[str, Dict] = {}
+        self._futures: Dict[str, Future] = {}
+        self._lock = threading.RLock()
+        # Last owner of recently seen accounts, to report how many move on a rebalance
+        self._owners: "OrderedDict[str, str]" = OrderedDict()
+        self._stopped = False
+        self._threads: List[threading.Thread] = []
+        self.rebalances = 0
+        self.moved_accounts = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.size > 0
+
+    def start(self):
+        import multiprocessing
+        self._context = multiprocessing.get_context("spawn")
+        self._outbox = self._context.Queue()
+        for i in range(self.size):
+            self.add_worker(f"worker-{i}")
+        for target in (self._collect, self._monitor):
+            thread = threading.Thread(target=target, name=f"worker-tier-{target.__name__.strip('_')}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info("Started %s browser worker processes", self.size)
+
+    def stop(self, timeout: float = 10):
+        self._stopped = True
+        with self._lock:
+            workers = list(self._workers.values())
+            draining = list(self._draining.values())
+        for worker in workers:
+            worker["inbox"].put(None)
+        for worker in workers + draining:
+            worker["process"].join(timeout)
+            if worker["process"].is_alive():
+                worker["process"].terminate()
+        self._fail_pending(None, "Worker tier stopped")
+
+    def wait_ready(self, timeout: float = 60) -> bool:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self._lock:
+                if self._workers and all(w["ready"] for w in self._workers.values()):
+                    return True
+            time.sleep(0.1)
+        return False
+
+    def add_worker(self, worker_id: str = None):
+        """Start a worker process and give it its share of the ring"""
+        worker_id = worker_id or f"worker-{uuid.uuid4().hex[:6]}"
+        inbox = self._context.Queue()
+        process = self._context.Process(target=_worker_main, args=(worker_id, inbox, self._outbox),
+                                        name=worker_id, daemon=True)
+        process.start()
+        with self._lock:
+            self._workers[worker_id] = {
+                "process": process, "inbox": inbox, "ready": False, "assigned": 0,
+                "pending": set(), "stats": {}, "started_at": time.time(),
+            }
+            self.ring.add(worker_id)
+            self._rebalanced(f"{worker_id} joined")
+        return worker_id
+
+    def remove_worker(self, worker_id: str, drain: bool = True):
+        """Take a worker off the ring; with drain, its queued sends finish first"""
+        with self._lock:
+            worker = self._workers.pop(worker_id, None)
+            self.ring.remove(worker_id)
+            self._rebalanced(f"{worker_id} left")
+        if worker is None:
+            return
+        if drain and worker["process"].is_alive():
+            with self._lock:
+                self._draining[worker_id] = worker
+            worker["inbox"].put(None)
+        else:
+            worker["process"].terminate()
+            self._fail_pending(worker, f"Worker {worker_id} exited")
+
+    def _rebalanced(self, reason: str):
+        """Count recently seen accounts whose owner changed (caller holds the lock)"""
+        moved = 0
+        for account, owner in self._owners.items():
+            new_owner = self.ring.get(account)
+            if new_owner != owner:
+                self._owners[account] = new_owner
+                moved += 1
+        self.rebalances += 1
+        self.moved_accounts += moved
+        if self._owners:
+            logger.info("Ring rebalanced (%s): %s/%s recent accounts moved", reason, moved, len(self._owners))
+
+    def route(self, gmail_id: str) -> Optional[str]:
+        with self._lock:
+            return self.ring.get(account_key(gmail_id))
+
+    def submit(self, method: str, gmail_id: str, **kwargs) -> Future:
+        """Run an agent method on the worker that owns gmail_id"""
+        if method not in WORKER_METHODS:
+            raise ValueError(f"Unsupported worker method {method}")
+        future: Future = Future()
+        job_id = str(uuid.uuid4())
+        account = account_key(gmail_id)
+        with self._lock:
+            worker_id = self.ring.get(account)
+            if worker_id is None:
+                raise RuntimeError("No browser workers are running")
+            self._owners[account] = worker_id
+            self._owners.move_to_end(account)
+            if len(self._owners) > 10000:
+                self._owners.popitem(last=False)
+            worker = self._workers[worker_id]
+            worker["assigned"] += 1
+            worker["pending"].add(job_id)
+            self._futures[job_id] = future
+        worker["inbox"].put((job_id, method, {**kwargs, "gmail_id": gmail_id}))
+        return future
+
+    def _collect(self):
+        """Resolve futures and forward screenshots and stats sent by the workers"""
+        while not self._stopped:
+            try:
+                kind, worker_id, payload = self._outbox.get(timeout=0.5)
+            except Exception:
+                continue
+            if kind == "screenshot":
+                if self.on_screenshot is not None:
+                    self.on_screenshot(*payload)
+                continue
+            with self._lock:
+                worker = self._workers.get(worker_id) or self._draining.get(worker_id)
+                if kind == "ready" and worker is not None:
+                    worker["ready"] = True
+                elif kind == "stats" and worker is not None:
+                    worker["stats"] = payload
+                elif kind in ("result", "error"):
+                    job_id, value = payload
+                    if worker is not None:
+                        worker["pending"].discard(job_id)
+                    future = self._futures.pop(job_id, None)
+                    if future is None:
+                        continue
+                    if kind == "result":
+                        future.set_result(value)
+                    else:
+                        future.set_exception(RuntimeError(value))
+
+    def _monitor(self):
+        """Replace workers that die, under the same id so their accounts map back to them"""
+        while not self._stopped:
+            time.sleep(1)
+            self._reap_drained()
+            with self._lock:
+                dead = [(wid, w) for wid, w in self._workers.items() if not w["process"].is_alive()]
+            for worker_id, worker in dead:
+                if self._stopped:
+                    return
+                logger.error("Browser worker %s exited (code %s), restarting", worker_id, worker['process'].exitcode)
+                self.remove_worker(worker_id, drain=False)
+                self.add_worker(worker_id)
+
+    def _reap_drained(self):
+        """Forget drained workers that exited; fail the sends of any that died before finishing them"""
+        with self._lock:
+            exited = [(wid, w) for wid, w in self._draining.items() if not w["process"].is_alive()]
+            for worker_id, _ in exited:
+                del self._draining[worker_id]
+        for worker_id, worker in exited:
+            if worker["process"].exitcode != 0:
+                logger.error("Draining worker %s exited (code %s) with %s sends pending",
+                             worker_id, worker["process"].exitcode, len(worker["pending"]))
+                self._fail_pending(worker, f"Worker {worker_id} exited")
+
+    def _fail_pending(self, worker: Optional[Dict], message: str):
+        with self._lock:
+            job_ids = list(worker["pending"]) if worker is not None else list(self._futures)
+            futures = [self._futures.pop(job_id, None) for job_id in job_ids]
+        for future in futures:
+            if future is not None and not future.done():
+                future.set_exception(RuntimeError(message))
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "workers": {
+                    worker_id: {
+                        "pid": worker["process"].pid,
+                        "alive": worker["process"].is_alive(),
+                        "ready": worker["ready"],
+                        "assigned": worker["assigned"],
+                        "pending": len(worker["pending"]),
+                        **worker["stats"],
+                    }
+                    for worker_id, worker in self._workers.items()
+                },
+                "rebalances": self.rebalances,
+                "moved_accounts": self.moved_accounts,
+                "tracked_accounts": len(self._owners),
+            }